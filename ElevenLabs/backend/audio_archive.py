@@ -0,0 +1,172 @@
+"""
+Background debug-audio archiver
+Segments sent to STT are handed to a bounded queue and written by a daemon
+thread, so saving never blocks transcription. Two layouts:
+    wav:     one stt_<timestamp>.wav per segment, oldest deleted past max_files
+    archive: records appended to stt_<timestamp>.ssa segment files, oldest segment
+             file deleted past max_files (see read_archive / __main__ to extract)
+"""
+
+import argparse
+import logging
+import queue
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional
+import numpy as np
+from config import SAVE_AUDIO_DIR, SAVE_AUDIO_MAX, SAVE_AUDIO_FORMAT, SAVE_AUDIO_QUEUE, SAVE_AUDIO_ARCHIVE_MB
+from audio_encoders import WavEncoder
+
+logger = logging.getLogger(__name__)
+
+# Archive record: magic, unix time, sample rate, sample count, then int16 PCM
+RECORD_HEADER = struct.Struct("<4sdII")
+RECORD_MAGIC = b"SSA1"
+
+
+class AudioArchiver:
+    """
+    Saves STT segments off the transcription path
+    Retained files are tracked in an in-memory deque (seeded by one directory
+    scan at startup), so rotation is a popleft + unlink rather than a glob.
+    When the queue is full the new segment is dropped and counted.
+    """
+
+    def __init__(self,
+                 output_dir: str = SAVE_AUDIO_DIR,
+                 max_files: int = SAVE_AUDIO_MAX,
+                 layout: str = SAVE_AUDIO_FORMAT,
+                 max_queue: int = SAVE_AUDIO_QUEUE,
+                 archive_mb: float = SAVE_AUDIO_ARCHIVE_MB):
+        """
+        Args:
+            output_dir: Directory for saved audio (created if missing)
+            max_files: Files kept (WAVs, or archive segment files); 0 = keep everything
+            layout: "wav" or "archive"
+            max_queue: Segments waiting to be written before new ones are dropped
+            archive_mb: Size at which the archive rolls over to a new segment file
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.max_files = max_files
+        if layout not in ("wav", "archive"):
+            logger.warning(f"Unknown SAVE_AUDIO_FORMAT '{layout}', using wav")
+            layout = "wav"
+        self.layout = layout
+        self.archive_bytes = int(archive_mb * 1024 * 1024)
+        self.wav_encoder = WavEncoder()
+
+        pattern = "stt_*.wav" if layout == "wav" else "stt_*.ssa"
+        self._files: deque = deque(sorted(self.output_dir.glob(pattern)))
+        self._archive = None  # Open archive segment file (archive layout)
+        self._rotate()
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self.saved = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="audio-archiver")
+        self._thread.start()
+        logger.info(f"Saving STT audio to {self.output_dir} ({layout}, keep {max_files or 'all'})")
+
+    def submit(self, pcm: np.ndarray, sample_rate: int, wav: Optional[bytes] = None):
+        """
+        Queue a segment without blocking
+
+        Args:
+            pcm: int16 PCM samples (not modified afterwards by the caller)
+            sample_rate: Sample rate of pcm
+            wav: The same audio already encoded as WAV (e.g. the upload body), written as-is
+        """
+        try:
+            self._queue.put_nowait((pcm, sample_rate, wav, time.time()))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+                self.saved += 1
+            except Exception as e:
+                logger.warning(f"Failed to save audio: {e}")
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def _write(self, pcm: np.ndarray, sample_rate: int, wav: Optional[bytes], timestamp: float):
+        if self.layout == "wav":
+            name = datetime.fromtimestamp(timestamp).strftime("stt_%Y%m%d_%H%M%S_%f.wav")
+            path = self.output_dir / name
+            path.write_bytes(wav if wav is not None else self.wav_encoder.encode(pcm, sample_rate))
+            self._files.append(path)
+            self._rotate()
+            return
+
+        if self._archive is None or self._archive.tell() >= self.archive_bytes:
+            if self._archive is not None:
+                self._archive.close()
+            name = datetime.fromtimestamp(timestamp).strftime("stt_%Y%m%d_%H%M%S_%f.ssa")
+            path = self.output_dir / name
+            self._archive = open(path, "ab")
+            self._files.append(path)
+            self._rotate()
+        self._archive.write(RECORD_HEADER.pack(RECORD_MAGIC, timestamp, sample_rate, len(pcm)))
+        self._archive.write(pcm.tobytes())
+        self._archive.flush()
+
+    def _rotate(self):
+        # The open archive segment is always the newest entry, so it is never removed
+        while self.max_files > 0 and len(self._files) > self.max_files:
+            self._files.popleft().unlink(missing_ok=True)
+
+    def get_stats(self) -> dict:
+        return {"saved": self.saved, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+    def close(self, timeout: float = 5.0):
+        """Write out queued segments and stop the writer thread"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Audio archiver queue still full at shutdown")
+            return
+        self._thread.join(timeout)
+
+
+def read_archive(path: str) -> Iterator[tuple[float, int, np.ndarray]]:
+    """Yield (unix time, sample rate, int16 PCM) for each record in an archive segment file"""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            magic, timestamp, sample_rate, num_samples = RECORD_HEADER.unpack(header)
+            if magic != RECORD_MAGIC:
+                raise ValueError(f"{path}: corrupt record at offset {f.tell() - RECORD_HEADER.size}")
+            data = f.read(2 * num_samples)
+            if len(data) < 2 * num_samples:
+                return  # Truncated final record (writer was interrupted)
+            yield timestamp, sample_rate, np.frombuffer(data, dtype=np.int16)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the segments of an STT audio archive as WAV files")
+    parser.add_argument("archive", help="stt_*.ssa file")
+    parser.add_argument("--out", default=".", help="Output directory")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    encoder = WavEncoder()
+    count = 0
+    for timestamp, sample_rate, pcm in read_archive(args.archive):
+        name = datetime.fromtimestamp(timestamp).strftime("stt_%Y%m%d_%H%M%S_%f.wav")
+        (out / name).write_bytes(encoder.encode(pcm, sample_rate))
+        count += 1
+    print(f"Extracted {count} segments to {out}")
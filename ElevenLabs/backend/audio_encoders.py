@@ -0,0 +1,115 @@
+"""
+Upload encoders for cloud STT
+Each encoder turns 16-bit mono PCM into a file body the API accepts. WAV is
+always available; FLAC (lossless) and Ogg/Opus (low-bitrate speech codec) need
+the optional soundfile package (libsndfile >= 1.0.29 for Opus).
+"""
+
+import io
+import logging
+import wave
+import numpy as np
+from config import ELEVENLABS_AUDIO_COMPRESSION
+
+logger = logging.getLogger(__name__)
+
+WAV_HEADER_BYTES = 44
+
+
+def to_pcm16(audio: np.ndarray) -> np.ndarray:
+    """Convert float32 audio in [-1, 1] to int16 PCM (clipping out-of-range samples)"""
+    return (np.clip(audio, -1.0, 1.0) * 32767.0).astype(np.int16)
+
+
+def wav_size(num_samples: int) -> int:
+    """Size of a 16-bit mono WAV file, the baseline that compressed uploads are measured against"""
+    return WAV_HEADER_BYTES + 2 * num_samples
+
+
+class WavEncoder:
+    """Uncompressed 16-bit PCM WAV"""
+
+    name = "wav"
+    filename = "audio.wav"
+    mime_type = "audio/wav"
+
+    def encode(self, pcm: np.ndarray, sample_rate: int) -> bytes:
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav_file:
+            wav_file.setnchannels(1)  # Mono
+            wav_file.setsampwidth(2)  # 16-bit = 2 bytes
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(pcm.tobytes())
+        return buffer.getvalue()
+
+
+class _SoundFileEncoder:
+    """Encoder backed by libsndfile via the optional soundfile package"""
+
+    format = ""
+    subtype = ""
+
+    def __init__(self, compression: float = ELEVENLABS_AUDIO_COMPRESSION):
+        import soundfile
+
+        if self.subtype not in soundfile.available_subtypes(self.format):
+            raise ValueError(f"libsndfile has no {self.format}/{self.subtype} support")
+        self.soundfile = soundfile
+        self.compression = compression
+
+    def encode(self, pcm: np.ndarray, sample_rate: int) -> bytes:
+        buffer = io.BytesIO()
+        kwargs = {"format": self.format, "subtype": self.subtype}
+        if self.compression >= 0:
+            kwargs["compression_level"] = self.compression
+        try:
+            self.soundfile.write(buffer, pcm, sample_rate, **kwargs)
+        except TypeError:
+            # soundfile < 0.12 has no compression_level
+            kwargs.pop("compression_level", None)
+            buffer = io.BytesIO()
+            self.soundfile.write(buffer, pcm, sample_rate, **kwargs)
+        return buffer.getvalue()
+
+
+class FlacEncoder(_SoundFileEncoder):
+    """Lossless FLAC (roughly half the size of WAV for speech)"""
+
+    name = "flac"
+    filename = "audio.flac"
+    mime_type = "audio/flac"
+    format = "FLAC"
+    subtype = "PCM_16"
+
+
+class OpusEncoder(_SoundFileEncoder):
+    """Ogg/Opus speech codec (an order of magnitude smaller than WAV; lossy)"""
+
+    name = "opus"
+    filename = "audio.ogg"
+    mime_type = "audio/ogg"
+    format = "OGG"
+    subtype = "OPUS"
+
+
+AUDIO_ENCODERS = {
+    WavEncoder.name: WavEncoder,
+    FlacEncoder.name: FlacEncoder,
+    OpusEncoder.name: OpusEncoder,
+}
+
+
+def create_audio_encoder(name: str):
+    """
+    Build an upload encoder by name
+    Falls back to WAV if the requested one is unknown or unavailable
+    """
+    encoder_cls = AUDIO_ENCODERS.get(name)
+    if encoder_cls is None:
+        logger.warning(f"Unknown audio codec '{name}', using wav")
+        return WavEncoder()
+    try:
+        return encoder_cls()
+    except Exception as e:
+        logger.warning(f"Audio codec '{name}' unavailable ({e}), using wav")
+        return WavEncoder()
@@ -0,0 +1,113 @@
+"""
+Audio frame shared across pipeline stages
+Carries samples with their capture time and sample rate, plus lazily computed
+features that are memoized so each one is computed at most once per chunk
+"""
+
+import time
+import numpy as np
+from typing import Callable, Hashable, Optional, Union
+from numpy.lib.stride_tricks import sliding_window_view
+
+_mel_filterbanks: dict = {}
+
+
+def _hz_to_mel(hz):
+    return 2595.0 * np.log10(1.0 + np.asarray(hz) / 700.0)
+
+
+def _mel_to_hz(mel):
+    return 700.0 * (10.0 ** (np.asarray(mel) / 2595.0) - 1.0)
+
+
+def mel_filterbank(sample_rate: int, n_fft: int, n_mels: int) -> np.ndarray:
+    """Triangular mel filterbank of shape (n_mels, n_fft // 2 + 1), cached per parameters"""
+    key = (sample_rate, n_fft, n_mels)
+    bank = _mel_filterbanks.get(key)
+    if bank is None:
+        freqs = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+        edges = _mel_to_hz(np.linspace(_hz_to_mel(0.0), _hz_to_mel(sample_rate / 2), n_mels + 2))
+        lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+        rising = (freqs - lower) / np.maximum(center - lower, 1e-9)
+        falling = (upper - freqs) / np.maximum(upper - center, 1e-9)
+        bank = np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+        _mel_filterbanks[key] = bank
+    return bank
+
+
+def fft_size(frame_length: int) -> int:
+    """FFT size used for a given analysis frame length (next power of two)"""
+    return 1 << (int(frame_length) - 1).bit_length()
+
+
+class AudioFrame:
+    """
+    A chunk of mono float32 audio with memoized features
+    Features: rms, peak, stft (power spectrogram) and log_mel. Stages that compute
+    a feature in their own way (e.g. the VAD's spectrum over its carried analysis
+    frames) publish it with cache() under their own key, so later stages opt in
+    to reusing it and stft() always covers exactly this chunk's samples.
+    """
+
+    def __init__(self, samples: np.ndarray, sample_rate: int, timestamp: Optional[float] = None):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.timestamp = time.time() if timestamp is None else timestamp  # Capture time of first sample
+        self._features: dict = {}
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def feature(self, key: Hashable, compute: Callable[[], object]):
+        """Return a cached feature, computing it on first use"""
+        if key not in self._features:
+            self._features[key] = compute()
+        return self._features[key]
+
+    def cache(self, key: Hashable, value):
+        """Publish a feature computed elsewhere"""
+        self._features[key] = value
+
+    def has_feature(self, key: Hashable) -> bool:
+        return key in self._features
+
+    @property
+    def rms(self) -> float:
+        return self.feature("rms", lambda: float(np.sqrt(np.mean(self.samples ** 2))) if len(self.samples) else 0.0)
+
+    @property
+    def peak(self) -> float:
+        return self.feature("peak", lambda: float(np.max(np.abs(self.samples))) if len(self.samples) else 0.0)
+
+    def stft(self, frame_length: int, hop_length: int) -> np.ndarray:
+        """Hann-windowed power spectrogram, shape (n_frames, fft_size(frame_length) // 2 + 1)"""
+        n_fft = fft_size(frame_length)
+
+        def compute():
+            if len(self.samples) < frame_length:
+                return np.zeros((0, n_fft // 2 + 1), dtype=np.float32)
+            frames = sliding_window_view(self.samples, frame_length)[::hop_length]
+            window = np.hanning(frame_length).astype(np.float32)
+            return np.abs(np.fft.rfft(frames * window, n=n_fft, axis=1)) ** 2
+
+        return self.feature(("stft", frame_length, hop_length, n_fft), compute)
+
+    def log_mel(self, frame_length: int, hop_length: int, n_mels: int = 64) -> np.ndarray:
+        """Log-mel spectrogram built on the (possibly shared) stft, shape (n_frames, n_mels)"""
+        def compute():
+            power = self.stft(frame_length, hop_length)
+            bank = mel_filterbank(self.sample_rate, fft_size(frame_length), n_mels)
+            return np.log(power @ bank.T + 1e-10)
+
+        return self.feature(("log_mel", frame_length, hop_length, n_mels), compute)
+
+    @staticmethod
+    def unwrap(audio: Union["AudioFrame", np.ndarray], sample_rate: Optional[int]) -> tuple[np.ndarray, Optional[int]]:
+        """Return (samples, sample_rate) for either an AudioFrame or a bare array"""
+        if isinstance(audio, AudioFrame):
+            return audio.samples, audio.sample_rate
+        return audio, sample_rate
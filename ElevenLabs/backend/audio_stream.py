@@ -5,44 +5,179 @@ Audio stream capture from USB microphone
 import sounddevice as sd
 import numpy as np
 import logging
+import threading
+import time
+from collections import deque
 from typing import Callable, Optional
+from audio_frame import AudioFrame
+from resampler import StreamingResampler
 from config import (
     AUDIO_SAMPLE_RATE,
     AUDIO_CHANNELS,
     AUDIO_CHUNK_SIZE,
     AUDIO_DEVICE_INDEX,
     AUDIO_USE_DEVICE_DEFAULT,
+    AUDIO_CAPTURE_MODE,
+    AUDIO_RING_SECONDS,
+    AUDIO_CAPTURE_BLOCK_SIZE,
+    AUDIO_READ_SIZE,
 )
 
 logger = logging.getLogger(__name__)
 
 
+class AudioRingBuffer:
+    """
+    Preallocated single-producer / single-consumer float32 ring buffer
+    The PortAudio callback writes samples in place; a consumer thread reads
+    fixed-size blocks back out as views. Positions are monotonic sample counters,
+    each owned by one side, so no lock is needed. Dropped samples leave a gap in
+    the stream; each gap is marked at the write position where it starts, so block
+    timestamps only include the drops that happened before the block was written.
+    """
+
+    def __init__(self, capacity: int, block_size: int):
+        # Round capacity up to whole blocks so aligned block reads never wrap
+        n_blocks = max(2, -(-int(capacity) // block_size))
+        self.block_size = block_size
+        self.capacity = n_blocks * block_size
+        self.buffer = np.zeros(self.capacity, dtype=np.float32)
+
+        self.write_pos = 0  # Total samples written (producer-owned)
+        self.read_pos = 0   # Total samples released (consumer-owned)
+
+        self.overflows = 0        # Writes that did not fit (the consumer fell behind)
+        self.dropped_samples = 0
+        self.input_overflows = 0  # PortAudio input_overflow flags (samples lost before the callback)
+        # (write_pos, dropped_samples) at each overflow; appended by the producer, popped by the consumer
+        self._gaps: deque = deque()
+        self._dropped_before = 0  # Samples dropped ahead of read_pos (consumer-owned)
+
+    def available(self) -> int:
+        """Number of samples written but not yet released"""
+        return self.write_pos - self.read_pos
+
+    def write(self, indata: np.ndarray):
+        """
+        Write a (frames, channels) block from the audio callback
+        Multi-channel input is downmixed straight into the ring without temporaries.
+        Samples that do not fit are dropped and counted as an overflow.
+        """
+        frames = indata.shape[0]
+        free = self.capacity - (self.write_pos - self.read_pos)
+        if frames > free:
+            # The newest samples are dropped, so the gap starts after what still fits
+            self.overflows += 1
+            self.dropped_samples += frames - free
+            self._gaps.append((self.write_pos + free, self.dropped_samples))
+            frames = free
+            if frames == 0:
+                return
+
+        start = self.write_pos % self.capacity
+        first = min(frames, self.capacity - start)
+        self._store(indata[:first], self.buffer[start:start + first])
+        if frames > first:
+            self._store(indata[first:frames], self.buffer[:frames - first])
+
+        # Publish only after the samples are in place
+        self.write_pos += frames
+
+    @staticmethod
+    def _store(src: np.ndarray, dst: np.ndarray):
+        if src.shape[1] == 1:
+            dst[:] = src[:, 0]
+        else:
+            np.mean(src, axis=1, out=dst)
+
+    def peek_block(self) -> Optional[np.ndarray]:
+        """
+        Return a view of the next block, or None if a full block is not ready yet
+        The view stays valid until release_block() is called.
+        """
+        if self.write_pos - self.read_pos < self.block_size:
+            return None
+        start = self.read_pos % self.capacity
+        return self.buffer[start:start + self.block_size]
+
+    def block_position(self) -> int:
+        """Stream position (samples since start, including dropped ones) of the next block's first sample"""
+        while self._gaps and self._gaps[0][0] <= self.read_pos:
+            self._dropped_before = self._gaps.popleft()[1]
+        return self.read_pos + self._dropped_before
+
+    def release_block(self):
+        """Hand the block returned by peek_block() back to the producer"""
+        self.read_pos += self.block_size
+
+    def get_stats(self) -> dict:
+        """Return fill level and overflow counters"""
+        return {
+            "capacity": self.capacity,
+            "fill": self.available(),
+            "overflows": self.overflows,
+            "dropped_samples": self.dropped_samples,
+            "input_overflows": self.input_overflows,
+        }
+
+
 class AudioStream:
-    """Captures audio from default microphone in chunks"""
-    
-    def __init__(self, 
+    """
+    Captures audio from default microphone in chunks
+    In ring mode the capture block size and the size of the chunks handed to the
+    pipeline are independent, so the pipeline can run on short blocks without
+    adding work to the PortAudio callback. Callback mode runs the pipeline inside
+    the PortAudio callback, so it keeps chunk_size (0.5 s) blocks and reports the
+    end of an utterance up to a chunk later; use ring mode for short blocks.
+    With AUDIO_USE_DEVICE_DEFAULT the device is captured at its native rate
+    (capture_rate) and resampled to sample_rate before anything downstream sees it.
+    """
+
+    def __init__(self,
                  sample_rate: int = AUDIO_SAMPLE_RATE,
                  channels: int = AUDIO_CHANNELS,
-                 chunk_size: int = AUDIO_CHUNK_SIZE):
-        self.sample_rate = sample_rate
+                 chunk_size: int = AUDIO_CHUNK_SIZE,
+                 capture_mode: str = AUDIO_CAPTURE_MODE,
+                 ring_seconds: float = AUDIO_RING_SECONDS,
+                 capture_block_size: int = AUDIO_CAPTURE_BLOCK_SIZE,
+                 read_size: int = AUDIO_READ_SIZE):
+        self.sample_rate = sample_rate  # Rate delivered to the pipeline
+        self.capture_rate = sample_rate  # Rate the device is opened at
+        self.resampler: Optional[StreamingResampler] = None
         self.channels = channels
         self.chunk_size = chunk_size
+        self.capture_mode = capture_mode
+        self.ring_seconds = ring_seconds
+        self.capture_block_size = capture_block_size
+        self.read_size = read_size
         self.stream: Optional[sd.InputStream] = None
         self.running = False
-        
-    def start(self, callback: Callable[[np.ndarray], None]):
+        self.ring: Optional[AudioRingBuffer] = None
+        self.consumer_thread: Optional[threading.Thread] = None
+        self.start_time = 0.0
+
+    def start(self, callback: Callable[[AudioFrame], None]):
         """
         Start audio stream
-        Calls callback with each audio chunk (numpy array)
+        Calls callback with each audio chunk as an AudioFrame stamped with its capture time
+        In ring mode the callback runs on a consumer thread instead of the PortAudio thread
         """
-        def audio_callback(indata, frames, time, status):
+        def audio_callback(indata, frames, time_info, status):
             if status:
                 logger.warning(f"Audio stream status: {status}")
             if self.running:
                 # Convert to mono if needed
                 audio_chunk = indata[:, 0] if self.channels == 1 else np.mean(indata, axis=1)
-                callback(np.copy(audio_chunk))
-        
+                captured_at = time.time() - frames / self.capture_rate
+                callback(AudioFrame(self._to_pipeline_rate(audio_chunk), self.sample_rate, captured_at))
+
+        def ring_callback(indata, frames, time_info, status):
+            # Keep the real-time thread to a single in-place copy (and a counter bump)
+            if status.input_overflow:
+                self.ring.input_overflows += 1
+            if self.running:
+                self.ring.write(indata)
+
         try:
             device = None
             if AUDIO_DEVICE_INDEX not in (None, ""):
@@ -68,29 +203,99 @@ class AudioStream:
                     device_info = sd.query_devices(default_in)
                     logger.info(f"Using default input device [{default_in}]: {device_info['name']}")
 
+            self.capture_rate = self.sample_rate
             if AUDIO_USE_DEVICE_DEFAULT and device_info:
-                self.sample_rate = int(device_info.get("default_samplerate", self.sample_rate))
-                logger.info(f"Using device default sample rate: {self.sample_rate}Hz")
+                self.capture_rate = int(device_info.get("default_samplerate", self.sample_rate))
+                logger.info(f"Using device default sample rate: {self.capture_rate}Hz")
+
+            self.resampler = None
+            if self.capture_rate != self.sample_rate:
+                self.resampler = StreamingResampler(self.capture_rate, self.sample_rate)
+                logger.info(
+                    f"Resampling {self.capture_rate}Hz -> {self.sample_rate}Hz "
+                    f"(polyphase {self.resampler.up}/{self.resampler.down}, "
+                    f"{self.resampler.taps_per_phase} taps per phase)"
+                )
+
+            # Block sizes are expressed at the pipeline rate; scale them to the capture rate
+            rate_ratio = self.capture_rate / self.sample_rate
+            use_ring = self.capture_mode == "ring"
+            if use_ring:
+                self.ring = AudioRingBuffer(
+                    int(self.ring_seconds * self.capture_rate), int(round(self.read_size * rate_ratio))
+                )
 
             self.stream = sd.InputStream(
-                samplerate=self.sample_rate,
+                samplerate=self.capture_rate,
                 channels=self.channels,
-                blocksize=self.chunk_size,
-                callback=audio_callback,
+                blocksize=self.capture_block_size if use_ring else int(round(self.chunk_size * rate_ratio)),
+                callback=ring_callback if use_ring else audio_callback,
                 dtype=np.float32,
                 device=device
             )
             self.running = True
+            self.start_time = time.time()
+            if use_ring:
+                self.consumer_thread = threading.Thread(
+                    target=self._consume_loop, args=(callback,), daemon=True
+                )
+                self.consumer_thread.start()
             self.stream.start()
             logger.info(
                 f"Audio stream started: {self.sample_rate}Hz, {self.channels} channel(s), "
-                f"chunk size {self.chunk_size}"
+                f"chunk size {self.read_size if use_ring else self.chunk_size}, {self.capture_mode} mode"
             )
         except Exception as e:
+            self.running = False
             logger.error(f"Failed to start audio stream: {e}")
             logger.error("Make sure microphone permissions are granted in System Settings")
             raise
-    
+
+    def _consume_loop(self, callback: Callable[[AudioFrame], None]):
+        """Drain fixed-size blocks from the ring and run the pipeline off the audio thread"""
+        poll_interval = self.ring.block_size / self.capture_rate / 4
+        last_overflows = 0
+        last_input_overflows = 0
+        while self.running:
+            block = self.ring.peek_block()
+            if block is None:
+                time.sleep(poll_interval)
+                continue
+
+            # Downstream stages keep chunks beyond the next ring cycle, so hand out a copy
+            chunk = self._to_pipeline_rate(block)
+            position = self.ring.block_position()
+            self.ring.release_block()
+            captured_at = self.start_time + position / self.capture_rate
+
+            if self.ring.overflows != last_overflows:
+                logger.warning(
+                    f"Audio ring overflow: consumer fell behind "
+                    f"({self.ring.dropped_samples} samples dropped so far)"
+                )
+                last_overflows = self.ring.overflows
+            if self.ring.input_overflows != last_input_overflows:
+                logger.warning(
+                    f"Audio input overflow: samples lost before the capture callback "
+                    f"({self.ring.input_overflows} so far)"
+                )
+                last_input_overflows = self.ring.input_overflows
+
+            try:
+                callback(AudioFrame(chunk, self.sample_rate, captured_at))
+            except Exception as e:
+                logger.error(f"Error in audio consumer callback: {e}")
+
+    def _to_pipeline_rate(self, audio: np.ndarray) -> np.ndarray:
+        """Return an owned copy of the audio at the pipeline sample rate"""
+        if self.resampler is None:
+            return np.copy(audio)
+        return self.resampler.process(audio)
+
+    def get_ring_stats(self) -> Optional[dict]:
+        """Return ring buffer stats in ring mode, None otherwise"""
+        return self.ring.get_stats() if self.ring else None
+
     def stop(self):
         """Stop audio stream"""
         self.running = False
@@ -98,7 +303,10 @@ class AudioStream:
             self.stream.stop()
             self.stream.close()
             logger.info("Audio stream stopped")
-    
+        if self.consumer_thread:
+            self.consumer_thread.join(timeout=1.0)
+            self.consumer_thread = None
+
     @staticmethod
     def list_devices():
         """List available audio input devices"""
@@ -107,7 +315,7 @@ class AudioStream:
         for i, device in enumerate(devices):
             if device['max_input_channels'] > 0:
                 logger.info(f"  [{i}] {device['name']} - {device['max_input_channels']} channel(s) @ {device['default_samplerate']}Hz")
-    
+
     @staticmethod
     def get_rms_energy(audio: np.ndarray) -> float:
         """Calculate RMS energy of audio chunk"""
@@ -0,0 +1,175 @@
+"""
+Inference engines for sound event classification
+An engine wraps one loaded model and scores fixed-size waveform windows:
+    window_size                    samples per window (YAMNet: 15600 = 0.975 s at 16 kHz)
+    labels                         class names, index-aligned with the scores
+    infer(windows) -> scores       (batch, window_size) float32 -> (batch, num_classes)
+Engines are not thread-safe; callers serialize infer() calls.
+"""
+
+import csv
+import io
+import logging
+import os
+import zipfile
+from typing import Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+YAMNET_WINDOW = 15600
+
+
+def _parse_labels(text: str, is_csv: bool) -> list[str]:
+    if not is_csv:
+        return [line.strip() for line in text.splitlines() if line.strip()]
+    rows = list(csv.reader(io.StringIO(text)))
+    if rows and "display_name" in rows[0]:
+        column = rows[0].index("display_name")  # YAMNet class map: index,mid,display_name
+        return [row[column] for row in rows[1:] if len(row) > column]
+    return [row[-1] for row in rows if row]
+
+
+def load_labels(model_path: str, labels_path: str = "") -> Optional[list[str]]:
+    """
+    Class names from a .csv/.txt file, or from the label file packed into a
+    TFLite model with metadata (such models are also zip archives)
+    """
+    if labels_path:
+        with open(labels_path, encoding="utf-8") as f:
+            return _parse_labels(f.read(), labels_path.endswith(".csv"))
+    if zipfile.is_zipfile(model_path):
+        with zipfile.ZipFile(model_path) as archive:
+            for name in archive.namelist():
+                if name.endswith((".txt", ".csv")):
+                    return _parse_labels(archive.read(name).decode("utf-8"), name.endswith(".csv"))
+    return None
+
+
+def _tflite_interpreter():
+    """Interpreter class from whichever TFLite runtime is installed"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteEngine:
+    """
+    TFLite model (e.g. YAMNet from MediaPipe / TF Hub), loaded once
+    Models with a batch dimension are resized to the batch and run in one
+    invoke; models with a 1-D waveform input are invoked once per window.
+    """
+
+    def __init__(self, model_path: str, num_threads: int = 2):
+        self.interpreter = _tflite_interpreter()(model_path=model_path, num_threads=max(1, num_threads))
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        shape = self._input["shape"]
+        self.window_size = int(shape[-1]) if shape[-1] > 0 else YAMNET_WINDOW
+        self.batched = len(shape) == 2
+        self._batch = int(shape[0]) if self.batched else 1
+        self.num_classes = int(self._output["shape"][-1])
+
+    def _set_batch(self, batch: int) -> bool:
+        if batch == self._batch:
+            return True
+        try:
+            self.interpreter.resize_tensor_input(self._input["index"], [batch, self.window_size])
+            self.interpreter.allocate_tensors()
+        except Exception as e:
+            # Fixed-shape ops (e.g. reshapes baked for batch 1): fall back to one invoke per window
+            logger.info(f"TFLite model cannot be batched ({e}), invoking per window")
+            self.interpreter.resize_tensor_input(self._input["index"], [1, self.window_size])
+            self.interpreter.allocate_tensors()
+            self.batched = False
+            self._batch = 1
+            return False
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch = batch
+        return True
+
+    def _invoke(self, data: np.ndarray) -> np.ndarray:
+        scale, zero_point = self._input.get("quantization", (0.0, 0))
+        if scale:
+            data = np.round(data / scale + zero_point)
+        self.interpreter.set_tensor(self._input["index"], data.astype(self._input["dtype"]))
+        self.interpreter.invoke()
+        scores = self.interpreter.get_tensor(self._output["index"])
+        scale, zero_point = self._output.get("quantization", (0.0, 0))
+        if scale:
+            scores = (scores.astype(np.float32) - zero_point) * scale
+        return scores
+
+    def infer(self, windows: np.ndarray) -> np.ndarray:
+        if self.batched and self._set_batch(len(windows)):
+            return self._invoke(windows).reshape(len(windows), -1)
+        shape = [1, self.window_size] if len(self._input["shape"]) == 2 else [self.window_size]
+        # Per-frame outputs (if any) are averaged to one score vector per window
+        return np.stack([
+            self._invoke(window.reshape(shape)).reshape(-1, self.num_classes).mean(axis=0)
+            for window in windows
+        ])
+
+
+class OnnxEngine:
+    """ONNX model run with ONNX Runtime on CPU (batched when the first input dimension is dynamic)"""
+
+    def __init__(self, model_path: str, num_threads: int = 2):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = max(1, num_threads)
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._shape = model_input.shape
+        self.window_size = self._shape[-1] if isinstance(self._shape[-1], int) else YAMNET_WINDOW
+        self.batched = len(self._shape) == 2 and not isinstance(self._shape[0], int)
+
+    def infer(self, windows: np.ndarray) -> np.ndarray:
+        windows = windows.astype(np.float32)
+        if self.batched:
+            return self.session.run(None, {self._input_name: windows})[0].reshape(len(windows), -1)
+        shape = [1, self.window_size] if len(self._shape) == 2 else [self.window_size]
+        scores = []
+        for window in windows:
+            output = self.session.run(None, {self._input_name: window.reshape(shape)})[0]
+            scores.append(output.reshape(-1, output.shape[-1]).mean(axis=0))
+        return np.stack(scores)
+
+
+CLASSIFIER_ENGINES = {
+    ".tflite": TFLiteEngine,
+    ".onnx": OnnxEngine,
+}
+
+
+def create_classifier_engine(model_path: str, labels_path: str = "", num_threads: int = 2):
+    """
+    Load the engine for a model file (chosen by extension) and attach its labels
+    Raises if the model or its runtime is unavailable.
+    """
+    engine_cls = CLASSIFIER_ENGINES.get(os.path.splitext(model_path)[1].lower())
+    if engine_cls is None:
+        raise ValueError(f"Unsupported classifier model '{model_path}' (expected .tflite or .onnx)")
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Classifier model not found at {model_path}")
+    engine = engine_cls(model_path, num_threads)
+    labels = load_labels(model_path, labels_path)
+    num_classes = engine.infer(np.zeros((1, engine.window_size), dtype=np.float32)).shape[-1]
+    if labels is None or len(labels) != num_classes:
+        if labels is not None:
+            logger.warning(f"Label file has {len(labels)} entries but the model has {num_classes} classes")
+        labels = [f"class_{i}" for i in range(num_classes)]
+    engine.labels = labels
+    return engine
@@ -1,66 +1,283 @@
 """
-Sound event classification using MediaPipe Audio Classifier
-TODO: Full MediaPipe integration requires model asset setup
-Currently provides placeholder implementation
+Sound event classification with a YAMNet-class audio model
+The model (TFLite, as used by MediaPipe's Audio Classifier, or ONNX) is loaded
+once in initialize(). Without a configured model an energy-based placeholder
+is used.
 """
 
+import asyncio
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
 import numpy as np
-from typing import Optional
-from audio_stream import AudioStream
+from config import (
+    CLASSIFIER_MODEL_PATH,
+    CLASSIFIER_LABELS_PATH,
+    CLASSIFIER_THREADS,
+    CLASSIFIER_WORKERS,
+    CLASSIFIER_TOP_K,
+    CLASSIFIER_MIN_SCORE,
+    CLASSIFIER_BATCH_SIZE,
+    CLASSIFIER_BATCH_WINDOW_MS,
+)
+from audio_frame import AudioFrame
+from classifier_engines import SAMPLE_RATE, create_classifier_engine
+from classifier_pool import ClassifierProcessPool
+from sound_novelty import NoveltyGate
 
 logger = logging.getLogger(__name__)
 
 
+def format_label(label: str) -> str:
+    """Caption text for a class name, e.g. "Dog bark" -> "[DOG BARK]" """
+    return f"[{label.upper()}]"
+
+
 class MediaPipeClassifier:
     """
-    Sound event classifier using MediaPipe
-    TODO: Requires MediaPipe Audio Classifier model assets
-    See: https://ai.google.dev/edge/mediapipe/solutions/audio/audio_classifier
-    
-    For now, provides placeholder mapping based on energy levels
+    Sound event classifier
+    Chunks are scored over the model's native window (0.975 s for YAMNet): each
+    0.5 s chunk is classified together with the audio just before it, as long
+    as that audio was contiguous. classify_async() batches chunks queued within
+    a short window into one invoke. With num_workers > 0 the model runs in a
+    pool of worker processes (audio passed through shared memory) instead of
+    a thread of this process.
+
+    observe() is the cheap first stage of the cascade: it returns the cached
+    label when a chunk sounds like a recently classified one, and only the
+    remaining chunks go through classify_async().
     """
-    
-    def __init__(self):
+
+    def __init__(self,
+                 model_path: str = CLASSIFIER_MODEL_PATH,
+                 labels_path: str = CLASSIFIER_LABELS_PATH,
+                 num_threads: int = CLASSIFIER_THREADS,
+                 num_workers: int = CLASSIFIER_WORKERS,
+                 top_k: int = CLASSIFIER_TOP_K,
+                 min_score: float = CLASSIFIER_MIN_SCORE,
+                 batch_size: int = CLASSIFIER_BATCH_SIZE,
+                 batch_window_ms: int = CLASSIFIER_BATCH_WINDOW_MS):
+        """
+        Args:
+            model_path: .tflite or .onnx model ("" = energy placeholder)
+            labels_path: Class map .csv/.txt ("" = labels embedded in the model)
+            num_threads: Inference threads (per worker process)
+            num_workers: Worker processes (0 = in-process, on one thread)
+            top_k: Labels returned per chunk by classify_topk
+            min_score: Top score needed for classify() to return a label
+            batch_size: Maximum chunks per invoke
+            batch_window_ms: Time to wait for more chunks before invoking
+        """
+        self.model_path = model_path
+        self.labels_path = labels_path
+        self.num_threads = num_threads
+        self.num_workers = max(0, num_workers)
+        self.top_k = max(1, top_k)
+        self.min_score = min_score
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window_ms / 1000.0
         self.initialized = False
-        
+        self.engine = None
+        self.novelty = NoveltyGate()
+
+        # Audio preceding the next chunk, to fill the model window
+        self._context = np.zeros(0, dtype=np.float32)
+        self._context_end: Optional[float] = None
+        self._context_lock = threading.Lock()
+
+        # The interpreter is not thread-safe: every invoke runs on this one thread
+        # (or, in process-pool mode, on one dispatch thread per worker)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="classifier")
+        self._pending: list[tuple[np.ndarray, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self._stats_lock = threading.Lock()
+        self.chunks = 0
+        self.batches = 0
+        self.infer_seconds = 0.0
+        self._latencies: deque = deque(maxlen=200)  # Per-batch inference time
+
     def initialize(self):
-        """Initialize MediaPipe classifier (placeholder)"""
-        # TODO: Initialize MediaPipe Audio Classifier
-        # Example:
-        # import mediapipe as mp
-        # self.mp_audio = mp.solutions.audio
-        # self.classifier = self.mp_audio.AudioClassifier(
-        #     model_path="path/to/model.tflite",
-        #     num_threads=4
-        # )
-        
-        logger.warning("MediaPipe classifier not fully implemented - using placeholder")
+        """Load the model once (falls back to the energy placeholder if it cannot be loaded)"""
+        if self.initialized:
+            return
+        if self.model_path:
+            try:
+                if self.num_workers:
+                    self.engine = ClassifierProcessPool(
+                        self.model_path, self.labels_path, self.num_workers, self.num_threads, self.batch_size
+                    )
+                    # One dispatch thread per worker process so batches run in parallel
+                    self.executor.shutdown(wait=False)
+                    self.executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="classifier")
+                else:
+                    self.engine = create_classifier_engine(self.model_path, self.labels_path, self.num_threads)
+                logger.info(
+                    f"Sound classifier loaded: {self.model_path} ({len(self.engine.labels)} classes, "
+                    f"{self.engine.window_size / SAMPLE_RATE:.3f}s window, {self.num_threads} threads"
+                    f"{f' x {self.num_workers} processes' if self.num_workers else ''}, "
+                    f"{'batched' if self.engine.batched else 'per-window'} inference)"
+                )
+            except Exception as e:
+                logger.error(f"Sound classifier model unavailable ({e}), using energy placeholder")
+        if self.engine is None:
+            logger.warning("No sound classifier model configured - using energy placeholder")
         self.initialized = True
-    
-    def classify(self, audio: np.ndarray, sample_rate: int = 16000) -> str:
+
+    def _window(self, frame: AudioFrame) -> np.ndarray:
+        """Model input for a chunk: the chunk preceded by contiguous earlier audio, zero-padded"""
+        size = self.engine.window_size
+        with self._context_lock:
+            # A gap (speech, skipped quiet chunks) breaks the context
+            if self._context_end is None or abs(frame.timestamp - self._context_end) > 0.05:
+                self._context = np.zeros(0, dtype=np.float32)
+            window = np.concatenate([self._context, frame.samples])[-size:]
+            self._context = window
+            self._context_end = frame.timestamp + frame.duration
+        if len(window) < size:
+            window = np.concatenate([np.zeros(size - len(window), dtype=np.float32), window])
+        return window.astype(np.float32, copy=False)
+
+    def _infer(self, windows: np.ndarray) -> list[list[tuple[str, float]]]:
+        """Score a batch of windows (on the classifier thread); returns top-k (label, score) per window"""
+        start = time.perf_counter()
+        scores = self.engine.infer(windows)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.chunks += len(windows)
+            self.batches += 1
+            self.infer_seconds += elapsed
+            self._latencies.append(elapsed)
+        results = []
+        for row in scores:
+            top = np.argsort(row)[::-1][:self.top_k]
+            results.append([(self.engine.labels[i], float(row[i])) for i in top])
+        return results
+
+    def _to_caption(self, results: list[tuple[str, float]]) -> tuple[str, float]:
+        """(caption, score) for the top result ("" if below min_score)"""
+        label, score = results[0]
+        if not label or score < self.min_score:
+            return "", score
+        if label.lower() == "silence":
+            return "[SILENCE]", score
+        return format_label(label), score
+
+    def classify_topk(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = 16000) -> list[tuple[str, float]]:
+        """
+        Top-k (label, score) pairs for a chunk, best first (empty with the placeholder)
+        """
+        if not self.initialized:
+            self.initialize()
+        if self.engine is None:
+            return []
+        frame = audio if isinstance(audio, AudioFrame) else AudioFrame(audio, sample_rate)
+        if frame.sample_rate != SAMPLE_RATE:
+            logger.warning(f"Sound classifier expects {SAMPLE_RATE} Hz audio, got {frame.sample_rate} Hz")
+            return []
+        window = self._window(frame)
+        return self.executor.submit(self._infer, window[None, :]).result()[0]
+
+    def classify(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = 16000) -> str:
         """
         Classify sound event in audio chunk
-        
+
         Args:
-            audio: Audio samples as numpy array (float32, mono)
-            sample_rate: Sample rate in Hz (default 16000)
-        
+            audio: AudioFrame (cached features such as rms/stft are reused) or
+                audio samples as numpy array (float32, mono)
+            sample_rate: Sample rate in Hz (default 16000; ignored for AudioFrame)
+
         Returns:
-            Sound event label string (e.g., "[DOG BARK]", "[SIREN]", etc.)
+            Sound event label string (e.g., "[DOG BARK]", "[SIREN]", etc.), or ""
+            if the model is not confident enough
+        """
+        if not self.initialized:
+            self.initialize()
+        if self.engine is None:
+            frame = audio if isinstance(audio, AudioFrame) else AudioFrame(audio, sample_rate)
+            return self._placeholder_label(frame)
+        results = self.classify_topk(audio, sample_rate)
+        return self._to_caption(results)[0] if results else ""
+
+    def observe(self, frame: AudioFrame) -> Optional[tuple[str, float]]:
+        """Cached (label, score) if the chunk matches a recently classified sound, else None (classify it)"""
+        cached = self.novelty.observe(frame)
+        if cached is not None and self.engine is not None and frame.sample_rate == SAMPLE_RATE:
+            self._window(frame)  # Keep the window context contiguous for the next classified chunk
+        return cached
+
+    async def classify_async(self, frame: AudioFrame) -> tuple[str, float]:
+        """
+        Classify a chunk on the classifier thread (call on the loop thread)
+        Chunks submitted within batch_window_ms of each other share one invoke.
+        Returns (label, top score; 1.0 for the placeholder), cached for observe().
         """
         if not self.initialized:
             self.initialize()
-        
-        # TODO: Replace with actual MediaPipe classification
-        # Example:
-        # results = self.classifier.classify(audio, sample_rate)
-        # top_result = results.classifications[0].categories[0]
-        # return f"[{top_result.category_name}]"
-        
-        # Placeholder: Simple energy-based mapping
-        energy = AudioStream.get_rms_energy(audio)
-        
+        if self.engine is None or frame.sample_rate != SAMPLE_RATE:
+            label, score = await asyncio.to_thread(self.classify, frame), 1.0
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending.append((self._window(frame), future))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.batch_window, self._flush)
+            label, score = self._to_caption(await future)
+        self.novelty.update(frame, label, score)
+        return label, score
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: list):
+        windows = np.stack([window for window, _ in batch])
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self._infer, windows)
+        except Exception as e:
+            logger.error(f"Sound classification error: {e}")
+            results = [[("", 0.0)]] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> dict:
+        """Return chunks classified, batching and throughput (chunks per second of inference time)"""
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000.0
+            stats = {
+                "chunks": self.chunks,
+                "batches": self.batches,
+                "avg_batch_size": self.chunks / self.batches if self.batches else 0.0,
+                "chunks_per_s": self.chunks / self.infer_seconds if self.infer_seconds else 0.0,
+            }
+        if len(latencies):
+            stats["infer_p50_ms"] = float(np.percentile(latencies, 50))
+            stats["infer_p95_ms"] = float(np.percentile(latencies, 95))
+        stats["novelty"] = self.novelty.get_stats()
+        if isinstance(self.engine, ClassifierProcessPool):
+            stats.update(self.engine.get_stats())
+        return stats
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if isinstance(self.engine, ClassifierProcessPool):
+            self.engine.close()
+
+    @staticmethod
+    def _placeholder_label(frame: AudioFrame) -> str:
+        """Energy-based stand-in used when no model is configured"""
+        energy = frame.rms
+
         if energy > 0.15:
             return "[LOUD_NOISE]"
         elif energy > 0.08:
@@ -69,7 +286,7 @@ class MediaPipeClassifier:
             return "[QUIET_NOISE]"
         else:
             return "[SILENCE]"
-    
+
     @staticmethod
     def get_placeholder_labels() -> list[str]:
         """Return list of placeholder labels for testing"""
@@ -85,27 +302,18 @@ class MediaPipeClassifier:
         ]
 
 
-# TODO: MediaPipe Audio Classifier Setup Instructions
 """
-To fully implement MediaPipe Audio Classifier:
-
-1. Install MediaPipe:
-   pip install mediapipe
-
-2. Download Audio Classifier model:
-   - Visit: https://ai.google.dev/edge/mediapipe/solutions/audio/audio_classifier
-   - Download the YAMNet model or custom model TFLite file
-   - Place in models/ directory
+Model setup:
 
-3. Update initialize() method:
-   import mediapipe as mp
-   mp_audio = mp.solutions.audio
-   self.classifier = mp_audio.AudioClassifier(
-       model_path="models/yamnet.tflite",
-       num_threads=4
-   )
+1. Install a runtime (either one):
+   pip install ai-edge-litert      (or tflite-runtime / tensorflow)
+   pip install onnxruntime
 
-4. Update classify() method to use actual classifier results
+2. Download YAMNet:
+   - MediaPipe: https://ai.google.dev/edge/mediapipe/solutions/audio/audio_classifier
+     (yamnet.tflite, labels embedded)
+   - or the TF Hub TFLite/ONNX export plus yamnet_class_map.csv
 
-5. Handle model-specific input requirements (sample rate, chunk size, etc.)
+3. export CLASSIFIER_MODEL_PATH=models/yamnet.tflite
+   export CLASSIFIER_LABELS_PATH=models/yamnet_class_map.csv   # only if not embedded
 """
@@ -0,0 +1,254 @@
+"""
+Process-pool execution for the sound classifier
+Each worker process loads its own copy of the model, so preprocessing and
+inference run outside the backend's GIL. Audio windows and score rows travel
+through one shared-memory block per worker; the pipe to the worker only
+carries the batch length and timing.
+"""
+
+import logging
+import multiprocessing as mp
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+import numpy as np
+from classifier_engines import create_classifier_engine
+
+logger = logging.getLogger(__name__)
+
+# Python < 3.13 registers every attached block with the resource tracker (no track flag)
+_TRACK_FLAG = sys.version_info >= (3, 13)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # The parent owns (and unlinks) the block; workers only attach
+    if _TRACK_FLAG:
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # Otherwise the worker's tracker could unlink the block when the worker exits.
+    # A spawned worker shares the parent's tracker, so this also drops the parent's
+    # entry; the parent registers the block again once the worker acknowledges.
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _worker_main(conn, model_path: str, labels_path: str, num_threads: int):
+    """Worker process: load the model, then score batches written to shared memory"""
+    try:
+        engine = create_classifier_engine(model_path, labels_path, num_threads)
+    except Exception as e:
+        conn.send(("error", str(e)))
+        return
+    conn.send(("ready", engine.window_size, engine.labels, engine.batched))
+
+    shm_name, max_batch = conn.recv()
+    shm = _attach(shm_name)
+    conn.send(("attached",))
+    inputs = np.ndarray((max_batch, engine.window_size), dtype=np.float32, buffer=shm.buf)
+    outputs = np.ndarray((max_batch, len(engine.labels)), dtype=np.float32, buffer=shm.buf, offset=inputs.nbytes)
+    try:
+        while True:
+            count = conn.recv()
+            if count is None:
+                break
+            start = time.perf_counter()
+            try:
+                outputs[:count] = engine.infer(inputs[:count])
+                conn.send(("ok", time.perf_counter() - start))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del inputs, outputs
+        shm.close()
+
+
+class _Worker:
+    """Parent-side handle: process, pipe, shared block and latency history"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[mp.Process] = None
+        self.conn = None
+        self.shm: Optional[shared_memory.SharedMemory] = None
+        self.inputs: Optional[np.ndarray] = None
+        self.outputs: Optional[np.ndarray] = None
+        self.requests = 0
+        self.errors = 0
+        self.restarts = 0
+        self.latencies: deque = deque(maxlen=200)  # Round trip per batch
+        self.infer_latencies: deque = deque(maxlen=200)  # Inference time inside the worker
+
+
+class ClassifierProcessPool:
+    """
+    Pool of classifier worker processes with the engine interface
+    (window_size, labels, batched, infer) so MediaPipeClassifier can use it in
+    place of an in-process engine. infer() is thread-safe: each call takes an
+    idle worker, so up to num_workers batches run in parallel. A worker that
+    dies or takes longer than request_timeout is restarted and the batch fails.
+    """
+
+    def __init__(self, model_path: str, labels_path: str = "", num_workers: int = 2,
+                 threads_per_worker: int = 1, max_batch: int = 8, startup_timeout: float = 60.0,
+                 request_timeout: float = 10.0):
+        self.model_path = model_path
+        self.labels_path = labels_path
+        self.threads_per_worker = threads_per_worker
+        self.max_batch = max(1, max_batch)
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        # spawn: workers must not inherit the audio/serial threads of this process
+        self._context = mp.get_context("spawn")
+
+        self.window_size = 0
+        self.labels: list[str] = []
+        self.batched = True
+        self.workers = [_Worker(i) for i in range(max(1, num_workers))]
+        self._idle: queue.Queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+
+        try:
+            for worker in self.workers:
+                self._start(worker)
+                self._idle.put(worker)
+        except Exception:
+            self.close()
+            raise
+        logger.info(
+            f"Classifier process pool: {len(self.workers)} workers x {threads_per_worker} threads, "
+            f"batches of up to {self.max_batch} via shared memory"
+        )
+
+    def _start(self, worker: _Worker):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.model_path, self.labels_path, self.threads_per_worker),
+            name=f"classifier-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        if not parent_conn.poll(self.startup_timeout):
+            process.kill()
+            raise TimeoutError(f"Classifier worker {worker.index} did not load the model in {self.startup_timeout:.0f}s")
+        message = parent_conn.recv()
+        if message[0] != "ready":
+            process.join()
+            raise RuntimeError(f"Classifier worker {worker.index} failed to load the model: {message[1]}")
+        _, window_size, labels, batched = message
+        self.window_size, self.labels = window_size, labels
+        self.batched = self.batched and batched
+
+        if worker.shm is None:
+            input_bytes = self.max_batch * window_size * 4
+            worker.shm = shared_memory.SharedMemory(create=True, size=input_bytes + self.max_batch * len(labels) * 4)
+            worker.inputs = np.ndarray((self.max_batch, window_size), dtype=np.float32, buffer=worker.shm.buf)
+            worker.outputs = np.ndarray(
+                (self.max_batch, len(labels)), dtype=np.float32, buffer=worker.shm.buf, offset=input_bytes
+            )
+        parent_conn.send((worker.shm.name, self.max_batch))
+        worker.process, worker.conn = process, parent_conn
+        if not parent_conn.poll(self.startup_timeout):
+            process.kill()
+            raise TimeoutError(f"Classifier worker {worker.index} did not attach its shared memory")
+        parent_conn.recv()
+        if not _TRACK_FLAG:
+            resource_tracker.register(worker.shm._name, "shared_memory")
+
+    def _restart(self, worker: _Worker, reason: str):
+        logger.warning(f"Classifier worker {worker.index} (pid {worker.process.pid}) {reason}, restarting")
+        worker.conn.close()
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=1)
+        worker.restarts += 1
+        self._start(worker)
+
+    def _run(self, worker: _Worker, windows: np.ndarray) -> np.ndarray:
+        count = len(windows)
+        start = time.perf_counter()
+        worker.inputs[:count] = windows
+        try:
+            worker.conn.send(count)
+            if worker.conn.poll(self.request_timeout):
+                status, value = worker.conn.recv()
+            else:
+                status, value = "timed out", None
+        except (EOFError, OSError, BrokenPipeError):
+            status, value = "died", None
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            worker.requests += 1
+            if status == "ok":
+                worker.latencies.append(elapsed)
+                worker.infer_latencies.append(value)
+            else:
+                worker.errors += 1
+        if status in ("died", "timed out"):
+            # A hung worker is killed too: its late reply would answer the next batch
+            self._restart(worker, status)
+            raise RuntimeError(f"classifier worker {worker.index} {status}")
+        if status != "ok":
+            raise RuntimeError(value)
+        return worker.outputs[:count].copy()
+
+    def infer(self, windows: np.ndarray) -> np.ndarray:
+        """Score windows on the next idle worker (blocks while all are busy)"""
+        if self._closed:
+            raise RuntimeError("classifier pool is closed")
+        worker = self._idle.get()
+        try:
+            return np.concatenate([
+                self._run(worker, windows[start:start + self.max_batch])
+                for start in range(0, len(windows), self.max_batch)
+            ])
+        finally:
+            self._idle.put(worker)
+
+    def get_stats(self) -> dict:
+        """Per-worker request counts, restarts and latency percentiles (ms)"""
+        workers = []
+        with self._stats_lock:
+            for worker in self.workers:
+                stats = {
+                    "worker": worker.index,
+                    "pid": worker.process.pid if worker.process else None,
+                    "requests": worker.requests,
+                    "errors": worker.errors,
+                    "restarts": worker.restarts,
+                }
+                for key, values in (("latency", worker.latencies), ("infer", worker.infer_latencies)):
+                    if values:
+                        ms = np.array(values) * 1000.0
+                        stats[f"{key}_p50_ms"] = float(np.percentile(ms, 50))
+                        stats[f"{key}_p95_ms"] = float(np.percentile(ms, 95))
+                workers.append(stats)
+        return {"workers": workers}
+
+    def close(self):
+        """Stop the workers and release their shared memory"""
+        self._closed = True
+        for worker in self.workers:
+            if worker.process is not None:
+                try:
+                    worker.conn.send(None)
+                except (OSError, BrokenPipeError):
+                    pass
+                worker.process.join(timeout=2)
+                if worker.process.is_alive():
+                    worker.process.kill()
+                worker.conn.close()
+                worker.process = None
+            if worker.shm is not None:
+                worker.inputs = worker.outputs = None
+                worker.shm.close()
+                worker.shm.unlink()
+                worker.shm = None
@@ -12,29 +12,119 @@ SERIAL_BAUD = 115200
 # Audio configuration
 AUDIO_SAMPLE_RATE = int(os.getenv("AUDIO_SAMPLE_RATE", "16000"))  # Hz
 AUDIO_CHANNELS = 1  # Mono
-AUDIO_CHUNK_DURATION = 0.5  # seconds
+AUDIO_CHUNK_DURATION = 0.5  # seconds; block handed to the pipeline in callback mode (ring mode uses AUDIO_READ_DURATION)
 AUDIO_CHUNK_SIZE = int(AUDIO_SAMPLE_RATE * AUDIO_CHUNK_DURATION)
 AUDIO_DEVICE_INDEX = os.getenv("AUDIO_DEVICE_INDEX", None)
 AUDIO_USE_DEVICE_DEFAULT = os.getenv("AUDIO_USE_DEVICE_DEFAULT", "0").lower() in ("1", "true", "yes", "on")
+AUDIO_CAPTURE_MODE = os.getenv("AUDIO_CAPTURE_MODE", "callback").lower()  # callback or ring
+AUDIO_RING_SECONDS = float(os.getenv("AUDIO_RING_SECONDS", "4.0"))  # Ring buffer capacity (ring mode)
+AUDIO_CAPTURE_BLOCK_SIZE = int(os.getenv("AUDIO_CAPTURE_BLOCK_SIZE", "0"))  # PortAudio block in ring mode (0 = host optimal)
+AUDIO_READ_DURATION = float(os.getenv("AUDIO_READ_DURATION", "0.1"))  # Block handed to the pipeline in ring mode (seconds); callback mode stays at AUDIO_CHUNK_DURATION
+AUDIO_READ_SIZE = int(AUDIO_SAMPLE_RATE * AUDIO_READ_DURATION)
 SAVE_AUDIO_DIR = os.getenv("SAVE_AUDIO_DIR", "")
-SAVE_AUDIO_MAX = int(os.getenv("SAVE_AUDIO_MAX", "5"))
+SAVE_AUDIO_MAX = int(os.getenv("SAVE_AUDIO_MAX", "5"))  # Files kept (WAVs or archive segments; 0 = all)
+SAVE_AUDIO_FORMAT = os.getenv("SAVE_AUDIO_FORMAT", "wav").lower()  # wav (one file per segment) or archive (append-only)
+SAVE_AUDIO_QUEUE = int(os.getenv("SAVE_AUDIO_QUEUE", "32"))  # Segments waiting to be written (newest dropped when full)
+SAVE_AUDIO_ARCHIVE_MB = float(os.getenv("SAVE_AUDIO_ARCHIVE_MB", "16"))  # Archive segment file size before rolling over
 
 # Voice Activity Detection (VAD) thresholds
 VAD_START_THRESHOLD = float(os.getenv("VAD_START_THRESHOLD", "0.02"))  # RMS energy to start detecting speech
 VAD_STOP_THRESHOLD = float(os.getenv("VAD_STOP_THRESHOLD", "0.01"))   # RMS energy to stop detecting speech
-VAD_HANGOVER_BLOCKS = 3     # Number of blocks to wait after energy drops below stop threshold
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", "200"))  # Silence to wait after energy drops below stop threshold
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "20"))  # Analysis frame length
+VAD_HOP_MS = int(os.getenv("VAD_HOP_MS", "10"))      # Analysis hop between frames
+VAD_BACKEND = os.getenv("VAD_BACKEND", "spectral").lower()  # energy, spectral, or webrtc
+VAD_WEBRTC_MODE = int(os.getenv("VAD_WEBRTC_MODE", "2"))  # webrtcvad aggressiveness (0-3)
+VAD_ADAPTIVE = os.getenv("VAD_ADAPTIVE", "1").lower() in ("1", "true", "yes", "on")  # Thresholds follow the noise floor
+VAD_NOISE_QUANTILE = float(os.getenv("VAD_NOISE_QUANTILE", "0.2"))   # Quantile of frame scores tracked as noise floor
+VAD_START_MARGIN_DB = float(os.getenv("VAD_START_MARGIN_DB", "12"))  # Start threshold above noise floor
+VAD_STOP_MARGIN_DB = float(os.getenv("VAD_STOP_MARGIN_DB", "6"))     # Stop threshold above noise floor
+VAD_MIN_THRESHOLD = float(os.getenv("VAD_MIN_THRESHOLD", "0.002"))   # Adaptive thresholds never go below this
+VAD_CALIBRATION_MS = int(os.getenv("VAD_CALIBRATION_MS", "1000"))    # Startup noise calibration window (0 = off)
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "300"))  # Idle audio prepended to each segment
+VAD_SPLIT_SECONDS = float(os.getenv("VAD_SPLIT_SECONDS", "5.0"))  # Split long speech near this length (0 = off)
+VAD_SPLIT_SEARCH_MS = int(os.getenv("VAD_SPLIT_SEARCH_MS", "1500"))  # Window searched for a quiet split point
+VAD_SPLIT_OVERLAP_MS = int(os.getenv("VAD_SPLIT_OVERLAP_MS", "300"))  # Audio repeated at the start of the next part
 MAX_SPEECH_SECONDS = float(os.getenv("MAX_SPEECH_SECONDS", "8.0"))
 
+# Segment trimming between VAD and STT
+TRIM_SILENCE = os.getenv("TRIM_SILENCE", "1").lower() in ("1", "true", "yes", "on")
+TRIM_FRAME_MS = int(os.getenv("TRIM_FRAME_MS", "10"))          # Envelope resolution
+TRIM_MARGIN_MS = int(os.getenv("TRIM_MARGIN_MS", "200"))       # Safety margin kept around speech
+TRIM_THRESHOLD_DB = float(os.getenv("TRIM_THRESHOLD_DB", "-40"))  # Silence level relative to segment peak
+
 # Direction gating parameters
 DIRECTION_STABLE_MS = 400    # Direction must be stable for this duration
 MIN_CONFIDENCE = 0.20        # Minimum confidence to emit caption
 MIN_ENERGY = float(os.getenv("MIN_ENERGY", "0.00002"))  # Minimum RMS energy to emit caption
 ENABLE_GATING = os.getenv("ENABLE_GATING", "1").lower() in ("1", "true", "yes", "on")
 
+# Speech-to-Text scheduling
+STT_BACKEND = os.getenv("STT_BACKEND", "elevenlabs").lower()   # elevenlabs, whisper, whisper_cpp or router
+STT_ROUTER_BACKENDS = os.getenv("STT_ROUTER_BACKENDS", "whisper,elevenlabs")  # Backends the router chooses between (fallback order)
+STT_BREAKER_FAILURES = int(os.getenv("STT_BREAKER_FAILURES", "3"))      # Consecutive failures that open a backend's breaker
+STT_BREAKER_COOLDOWN = float(os.getenv("STT_BREAKER_COOLDOWN", "30"))   # Seconds before an open breaker allows a trial request
+STT_ATTEMPT_SHARE = float(os.getenv("STT_ATTEMPT_SHARE", "0.6"))        # Most of the remaining deadline one routed attempt may use while a fallback is left
+STT_CONCURRENCY = int(os.getenv("STT_CONCURRENCY", "3"))            # Segments transcribed at once
+STT_MAX_QUEUE = int(os.getenv("STT_MAX_QUEUE", "8"))                # Waiting segments; the oldest is dropped when full
+STT_DEADLINE_SECONDS = float(os.getenv("STT_DEADLINE_SECONDS", "6.0"))  # Captions later than this after speech ends are dropped
+
+# Streaming Speech-to-Text (interim captions while someone is talking)
+STT_STREAMING = os.getenv("STT_STREAMING", "off").lower()  # off, elevenlabs or whisper
+STT_PARTIAL_INTERVAL_MS = int(os.getenv("STT_PARTIAL_INTERVAL_MS", "250"))  # Minimum spacing of interim captions
+ELEVENLABS_REALTIME_URL = os.getenv("ELEVENLABS_REALTIME_URL", "wss://api.elevenlabs.io/v1/speech-to-text/realtime")
+ELEVENLABS_REALTIME_MODEL = os.getenv("ELEVENLABS_REALTIME_MODEL", "scribe_v2_realtime")
+
+# Speech-to-Text (ElevenLabs) HTTP client
+ELEVENLABS_POOL_SIZE = int(os.getenv("ELEVENLABS_POOL_SIZE", "4"))       # Keep-alive connections shared by worker threads
+ELEVENLABS_PREWARM = int(os.getenv("ELEVENLABS_PREWARM", "1"))           # Connections opened during initialize()
+ELEVENLABS_HTTP2 = os.getenv("ELEVENLABS_HTTP2", "0").lower() in ("1", "true", "yes", "on")  # Needs httpx[http2]
+ELEVENLABS_TIMEOUT = float(os.getenv("ELEVENLABS_TIMEOUT", "30"))       # Request timeout (seconds)
+ELEVENLABS_AUDIO_CODEC = os.getenv("ELEVENLABS_AUDIO_CODEC", "wav")     # wav, flac or opus (flac/opus need soundfile)
+ELEVENLABS_AUDIO_COMPRESSION = float(os.getenv("ELEVENLABS_AUDIO_COMPRESSION", "-1"))  # 0.0-1.0 libsndfile level (-1 = default)
+
 # Speech-to-Text (Whisper) configuration
 WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")  # tiny, base, small, medium, large
 WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")  # cpu or cuda
 WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")  # int8, int8_float16, float16, float32
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))  # CTranslate2 intra-op threads per worker (0 = auto)
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "0"))  # Parallel transcriptions on one model (0 = auto)
+WHISPER_WARMUP = os.getenv("WHISPER_WARMUP", "1").lower() in ("1", "true", "yes", "on")  # Dummy inference at startup
+WHISPER_TIER = os.getenv("WHISPER_TIER", "accurate").lower()  # fast (greedy) or accurate (beam search)
+WHISPER_VAD_FILTER = os.getenv("WHISPER_VAD_FILTER", "0").lower() in ("1", "true", "yes", "on")  # Our VAD already segments
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", str(STT_CONCURRENCY)))  # Segments per batched call (1 = off; defaults to STT_CONCURRENCY)
+WHISPER_BATCH_WINDOW_MS = int(os.getenv("WHISPER_BATCH_WINDOW_MS", "50"))  # Wait for more segments before decoding
+WHISPER_STREAM_STEP_MS = int(os.getenv("WHISPER_STREAM_STEP_MS", "1000"))  # Re-decode interval while speech continues
+WHISPER_STREAM_BUFFER_SECONDS = float(os.getenv("WHISPER_STREAM_BUFFER_SECONDS", "15"))  # Trim committed audio past this
+
+# Local Speech-to-Text (whisper.cpp)
+WHISPER_MODEL_PATH = os.getenv("WHISPER_MODEL_PATH", "whisper.cpp/models/ggml-base.en.bin")
+WHISPER_SERVER_PATH = os.getenv("WHISPER_SERVER_PATH", "whisper.cpp/build/bin/whisper-server")  # Long-lived worker binary
+WHISPER_SERVER_PORT = int(os.getenv("WHISPER_SERVER_PORT", "0"))  # Localhost port (0 = pick a free one)
+WHISPER_SERVER_THREADS = int(os.getenv("WHISPER_SERVER_THREADS", "0"))  # whisper.cpp threads (0 = its default)
+WHISPER_SERVER_STARTUP_TIMEOUT = float(os.getenv("WHISPER_SERVER_STARTUP_TIMEOUT", "60"))  # Model load budget (seconds)
+WHISPER_HEALTH_INTERVAL = float(os.getenv("WHISPER_HEALTH_INTERVAL", "5"))  # Seconds between worker health checks
+
+# Sound event classification (YAMNet-style TFLite/ONNX model; energy placeholder if unset)
+CLASSIFIER_MODEL_PATH = os.getenv("CLASSIFIER_MODEL_PATH", "")  # .tflite or .onnx, e.g. models/yamnet.tflite
+CLASSIFIER_LABELS_PATH = os.getenv("CLASSIFIER_LABELS_PATH", "")  # Class map .csv/.txt (default: labels embedded in the model)
+CLASSIFIER_THREADS = int(os.getenv("CLASSIFIER_THREADS", "2"))  # Interpreter / ONNX Runtime threads (per worker)
+CLASSIFIER_WORKERS = int(os.getenv("CLASSIFIER_WORKERS", "0"))  # Worker processes (0 = classify in a thread of this process)
+CLASSIFIER_TOP_K = int(os.getenv("CLASSIFIER_TOP_K", "3"))  # Labels (with scores) kept per chunk
+CLASSIFIER_MIN_SCORE = float(os.getenv("CLASSIFIER_MIN_SCORE", "0.3"))  # Top score needed to emit a sound caption
+CLASSIFIER_BATCH_SIZE = int(os.getenv("CLASSIFIER_BATCH_SIZE", "8"))  # Chunks classified per invoke
+CLASSIFIER_BATCH_WINDOW_MS = int(os.getenv("CLASSIFIER_BATCH_WINDOW_MS", "20"))  # Wait for more chunks before invoking
+CLASSIFIER_NOVELTY_THRESHOLD = float(os.getenv("CLASSIFIER_NOVELTY_THRESHOLD", "0.05"))  # Band-energy cosine distance of a new sound (0 = classify every chunk)
+CLASSIFIER_NOVELTY_LEVEL_DB = float(os.getenv("CLASSIFIER_NOVELTY_LEVEL_DB", "6"))  # Level change that also counts as a new sound
+CLASSIFIER_NOVELTY_BANDS = int(os.getenv("CLASSIFIER_NOVELTY_BANDS", "16"))  # Mel bands compared
+CLASSIFIER_REFRESH_SECONDS = float(os.getenv("CLASSIFIER_REFRESH_SECONDS", "10"))  # Re-classify an unchanged sound after this
+
+# Sound event aggregation (one caption when a sound starts, one when it ends)
+SOUND_WINDOW_SECONDS = float(os.getenv("SOUND_WINDOW_SECONDS", "2.0"))  # Sliding window over chunk labels
+SOUND_SLOT_SECONDS = float(os.getenv("SOUND_SLOT_SECONDS", "0.5"))      # Window resolution
+SOUND_ONSET_SCORE = float(os.getenv("SOUND_ONSET_SCORE", "0.6"))        # Windowed score sum that starts a sound
+SOUND_OFFSET_SCORE = float(os.getenv("SOUND_OFFSET_SCORE", "0.1"))      # Windowed score sum below which it ends
+SOUND_MAX_ACTIVE = int(os.getenv("SOUND_MAX_ACTIVE", "3"))              # Sounds captioned at once
 
 # TCP client configuration (connect to existing Unity/Arduino TCP server)
 TCP_HOST = os.getenv("TCP_HOST", "10.29.193.69")
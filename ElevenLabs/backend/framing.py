@@ -0,0 +1,57 @@
+"""
+Analysis framing for streaming audio
+Decouples the size of captured chunks from the size of analysis frames
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class AudioFramer:
+    """
+    Splits a stream of arbitrarily sized chunks into overlapping analysis frames
+    Samples not yet covered by a full hop are carried over to the next chunk,
+    so frames straddling chunk boundaries are analysed exactly once.
+    """
+
+    def __init__(self, frame_length: int, hop_length: int):
+        if hop_length <= 0 or frame_length < hop_length:
+            raise ValueError("frame_length must be >= hop_length > 0")
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self._carry = np.zeros(0, dtype=np.float32)
+
+    def push(self, chunk: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Add a chunk and return the frames it completes
+
+        Returns:
+            (frames, ends)
+            - frames: (n_frames, frame_length) read-only view
+            - ends: end offset of each frame relative to the start of this chunk,
+              always in (0, len(chunk)]
+        """
+        carry_len = len(self._carry)
+        buf = np.concatenate((self._carry, chunk)) if carry_len else np.asarray(chunk, dtype=np.float32)
+
+        if len(buf) < self.frame_length:
+            self._carry = buf
+            return np.zeros((0, self.frame_length), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        n_frames = (len(buf) - self.frame_length) // self.hop_length + 1
+        frames = sliding_window_view(buf, self.frame_length)[::self.hop_length][:n_frames]
+        ends = np.arange(n_frames, dtype=np.int64) * self.hop_length + (self.frame_length - carry_len)
+
+        self._carry = buf[n_frames * self.hop_length:]
+        return frames, ends
+
+    def reset(self):
+        """Drop any carried samples"""
+        self._carry = np.zeros(0, dtype=np.float32)
+
+    @staticmethod
+    def frame_rms(frames: np.ndarray) -> np.ndarray:
+        """Vectorized RMS of each frame"""
+        if len(frames) == 0:
+            return np.zeros(0, dtype=np.float32)
+        return np.sqrt(np.einsum("ij,ij->i", frames, frames) / frames.shape[1])
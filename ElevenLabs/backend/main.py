@@ -9,12 +9,17 @@ import threading
 import time
 from typing import Optional
 import numpy as np
-from config import LOG_LEVEL, ENABLE_SERIAL
+from config import LOG_LEVEL, ENABLE_SERIAL, TRIM_SILENCE, STT_STREAMING, STT_BACKEND
 from serial_reader import SerialReader
 from audio_stream import AudioStream
+from audio_frame import AudioFrame
 from vad import VAD
-from stt_elevenlabs import ElevenLabsSTT
+from segment_trim import SegmentTrimmer
+from stt_router import create_stt
+from stt_scheduler import STTScheduler
+from stt_streaming import StreamingCaptioner, create_streaming_stt
 from classifier_mediapipe import MediaPipeClassifier
+from sound_events import SoundEventAggregator
 from tcp_client import TCPClient
 from message_bus import MessageBus
 
@@ -26,6 +31,31 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def describe_stt_stats(stats: dict) -> str:
+    """One-line summary of an STT backend's get_stats() (backend-specific details when present)"""
+    summary = (
+        f"{stats['requests']} requests ({stats['errors']} errors), "
+        f"p50={stats.get('latency_p50_ms', 0):.0f} ms, p95={stats.get('latency_p95_ms', 0):.0f} ms"
+    )
+    if "codec" in stats:
+        summary += (
+            f", connections opened={stats['connections_opened']}, "
+            f"{stats['codec']} encode={stats.get('encode_ms_avg', 0):.1f} ms, bytes saved={stats['bytes_saved']}"
+        )
+    elif "workers" in stats:
+        summary += f", workers busy={stats['busy']}/{stats['workers']} (x{stats['cpu_threads']} threads)"
+    elif "restarts" in stats:
+        summary += f", server restarts={stats['restarts']}, healthy={stats['healthy']}"
+    elif "backends" in stats:
+        routes = [
+            f"{name}={backend['routed']} (p50={backend.get('latency_p50_ms', 0):.0f} ms, "
+            f"breaker {backend['breaker']})"
+            for name, backend in stats["backends"].items()
+        ]
+        summary = f"{stats['requests']} requests ({stats['errors']} errors), routed " + ", ".join(routes)
+    return summary
+
+
 class SoundSightBackend:
     """Main backend orchestrator"""
     
@@ -33,8 +63,20 @@ class SoundSightBackend:
         self.serial_reader: Optional[SerialReader] = None
         self.audio_stream = AudioStream()
         self.vad = VAD()
-        self.stt = ElevenLabsSTT()
+        self.trimmer: Optional[SegmentTrimmer] = SegmentTrimmer() if TRIM_SILENCE else None
+        self.stt = create_stt(STT_BACKEND)
+        self.stt_warmup: Optional[asyncio.Task] = None
+        self.stt_scheduler = STTScheduler(self.stt.transcribe_async, self.emit_speech_caption)
+        # Optional streaming STT: interim captions while speech is ongoing, replacing segment STT
+        self.streaming: Optional[StreamingCaptioner] = None
+        streaming_backend = create_streaming_stt(STT_STREAMING, self.stt)
+        if streaming_backend is not None:
+            self.streaming = StreamingCaptioner(
+                streaming_backend, self.emit_streaming_caption, self.audio_stream.sample_rate
+            )
+            logger.info(f"Streaming STT enabled ({self.streaming.name})")
         self.classifier = MediaPipeClassifier()
+        self.sound_events = SoundEventAggregator()
         self.tcp_client = TCPClient()
         self.message_bus = MessageBus(self.tcp_client, direction_enabled=ENABLE_SERIAL)
         self.loop: Optional[asyncio.AbstractEventLoop] = None
@@ -58,14 +100,26 @@ class SoundSightBackend:
         # Initialize TCP client
         await self.tcp_client.start()
         
-        # STT is initialized in __init__ (will raise error if API key missing)
-        logger.info("ElevenLabs STT initialized")
+        # STT is constructed in __init__ (ElevenLabs raises if the API key is missing).
+        # Warm it up in the background: open pooled connections / load the Whisper
+        # model and run a dummy inference, so the first caption does not pay for it
+        self.stt_warmup = asyncio.create_task(self.warm_up_stt())
         
         # Initialize classifier
         self.classifier.initialize()
         
         logger.info("Initialization complete")
     
+    async def warm_up_stt(self):
+        """Background STT warm-up; failures are logged and the first caption retries the load"""
+        try:
+            if hasattr(self.stt, "warm_up_async"):
+                await self.stt.warm_up_async()  # Warms the client the async transcribe path uses
+            else:
+                await asyncio.to_thread(self.stt.warm_up)
+        except Exception as e:
+            logger.error(f"STT warm-up failed: {e}")
+    
     def handle_serial_data(self, data: dict):
         """Handle incoming serial data from Arduino"""
         try:
@@ -80,89 +134,210 @@ class SoundSightBackend:
         except Exception as e:
             logger.error(f"Error handling serial data: {e}")
     
-    def handle_audio_chunk(self, audio_chunk: np.ndarray):
-        """Handle incoming audio chunk"""
+    def handle_audio_chunk(self, frame: AudioFrame):
+        """Handle incoming audio chunk (features are computed once on the frame and shared)"""
         try:
             # Update energy level
-            energy = AudioStream.get_rms_energy(audio_chunk)
-            self.message_bus.update_audio_energy(energy)
+            energy = frame.rms
+            self.message_bus.update_audio_frame(frame)
             now = time.time()
             if now - self.last_energy_log >= 2.0:
+                noise_floor = self.vad.noise_floor
                 logger.info(
                     f"Audio energy: {energy:.4f} (vad_start={self.vad.start_threshold:.3f}, "
-                    f"vad_stop={self.vad.stop_threshold:.3f})"
+                    f"vad_stop={self.vad.stop_threshold:.3f}"
+                    + (f", noise_floor={noise_floor:.4f})" if noise_floor is not None else ")")
+                )
+                ring_stats = self.audio_stream.get_ring_stats()
+                if ring_stats:
+                    logger.info(
+                        f"Audio ring: fill={ring_stats['fill']}/{ring_stats['capacity']}, "
+                        f"overflows={ring_stats['overflows']} ({ring_stats['dropped_samples']} samples dropped), "
+                        f"input overflows={ring_stats['input_overflows']}"
+                    )
+                stt_stats = self.stt.get_stats()
+                if stt_stats["requests"]:
+                    logger.info(f"STT: {describe_stt_stats(stt_stats)}")
+                scheduler_stats = self.stt_scheduler.get_stats()
+                if scheduler_stats["submitted"]:
+                    logger.info(
+                        f"STT queue: depth={scheduler_stats['queue_depth']} "
+                        f"(high water {scheduler_stats['queue_high_water']}), "
+                        f"in flight={scheduler_stats['in_flight']}, emitted={scheduler_stats['emitted']}, "
+                        f"dropped full={scheduler_stats['dropped_overflow']} "
+                        f"stale={scheduler_stats['dropped_stale']}, "
+                        f"caption lag p95={scheduler_stats.get('caption_lag_p95_ms', 0):.0f} ms"
+                    )
+                if self.streaming is not None:
+                    streaming_stats = self.streaming.get_stats()
+                    if streaming_stats["utterances"]:
+                        logger.info(
+                            f"Streaming STT: {streaming_stats['utterances']} utterances, "
+                            f"{streaming_stats['partials']} interim, {streaming_stats['finals']} final, "
+                            f"{streaming_stats['failures']} failures, "
+                            f"first interim p50={streaming_stats.get('first_partial_p50_ms', 0):.0f} ms"
+                        )
+                classifier_stats = self.classifier.get_stats()
+                novelty_stats = classifier_stats["novelty"]
+                if novelty_stats["observed"]:
+                    logger.info(
+                        f"Sound gate: {novelty_stats['observed']} chunks, {novelty_stats['classified']} classified, "
+                        f"{novelty_stats['reused']} reused cached labels ({novelty_stats['cached']} cached)"
+                    )
+                sound_stats = self.sound_events.get_stats()
+                if sound_stats["chunks"]:
+                    logger.info(
+                        f"Sound events: {sound_stats['chunks']} labelled chunks -> "
+                        f"{sound_stats['onsets']} onsets, {sound_stats['offsets']} offsets "
+                        f"({sound_stats['active']} active)"
+                    )
+                if classifier_stats["chunks"]:
+                    logger.info(
+                        f"Sound classifier: {classifier_stats['chunks']} chunks, "
+                        f"{classifier_stats['chunks_per_s']:.1f} chunks/s, "
+                        f"avg batch={classifier_stats['avg_batch_size']:.1f}, "
+                        f"infer p95={classifier_stats.get('infer_p95_ms', 0):.0f} ms"
+                        + "".join(
+                            f", worker {w['worker']} p95={w.get('latency_p95_ms', 0):.0f} ms"
+                            f" ({w['requests']} batches, {w['restarts']} restarts)"
+                            for w in classifier_stats.get("workers", [])
+                        )
+                    )
+                buffer_stats = self.vad.get_buffer_stats()
+                logger.debug(
+                    f"Segment buffer: {buffer_stats['capacity_bytes']} bytes allocated, "
+                    f"high water {buffer_stats['high_water_bytes']} bytes, "
+                    f"{buffer_stats['allocations']} allocations, {buffer_stats['grows']} grows"
                 )
                 self.last_energy_log = now
             
             # Process with VAD
-            is_speech, complete_audio = self.vad.process(audio_chunk)
+            is_speech, complete_audio = self.vad.process(frame)
+            segment_info = self.vad.last_segment
+
+            if self.streaming is not None:
+                self.stream_speech_audio(segment_info)
             
-            if complete_audio is not None:
+            if complete_audio is not None and self.streaming is None:
+                # Drop leading noise / trailing hangover before paying for STT
+                if self.trimmer:
+                    complete_audio, trim_stats = self.trimmer.trim(
+                        complete_audio,
+                        floor=self.vad.stop_threshold,
+                        sample_rate=frame.sample_rate,
+                    )
+                    logger.info(
+                        f"Segment trimmed: {trim_stats['original_seconds']:.2f}s -> "
+                        f"{trim_stats['original_seconds'] - trim_stats['seconds_saved']:.2f}s "
+                        f"(saved {trim_stats['seconds_saved']:.2f}s, {trim_stats['bytes_saved']} bytes)"
+                    )
+
                 # Speech segment complete, process it
+                segment = AudioFrame(
+                    complete_audio,
+                    frame.sample_rate,
+                    frame.timestamp + frame.duration - len(complete_audio) / frame.sample_rate,
+                )
                 if self.loop:
-                    asyncio.run_coroutine_threadsafe(
-                        self.process_speech_segment(complete_audio), self.loop
+                    # Direction is taken when the speech ends, not when its caption is ready
+                    self.loop.call_soon_threadsafe(
+                        self.stt_scheduler.submit,
+                        segment,
+                        segment_info,
+                        self.message_bus.current_direction or 0,
+                        self.message_bus.current_confidence,
                     )
-            elif not is_speech:
+            elif complete_audio is None and not is_speech:
                 # Not speech, classify as sound event
                 if self.loop:
                     asyncio.run_coroutine_threadsafe(
-                        self.process_sound_event(audio_chunk), self.loop
+                        self.process_sound_event(frame), self.loop
                     )
                 
         except Exception as e:
             logger.error(f"Error handling audio chunk: {e}")
     
-    async def process_speech_segment(self, audio: np.ndarray):
-        """Process complete speech segment with STT"""
-        try:
-            # Transcribe (blocking I/O offloaded to thread)
-            sample_rate = self.audio_stream.sample_rate
-            text = await asyncio.to_thread(self.stt.transcribe, audio, sample_rate)
-            logger.info(f"Caption: {text}")
-            
-            if text and text != "[NO_SPEECH]" and text != "[TRANSCRIPTION_ERROR]":
-                # Get current direction and confidence from message bus
-                direction = self.message_bus.current_direction or 0
-                confidence = self.message_bus.current_confidence
-                
-                # Emit caption
-                await self.message_bus.emit_caption(
-                    text=text,
-                    mode="speech",
-                    direction=direction,
-                    confidence=confidence,
-                    is_final=True
-                )
-        except Exception as e:
-            logger.error(f"Error processing speech segment: {e}")
+    def stream_speech_audio(self, segment_info):
+        """Forward the audio the VAD added to utterances in this chunk to streaming STT"""
+        if not self.loop or (not self.vad.speech_audio and segment_info is None):
+            return
+        ended_id = segment_info.utterance_id if segment_info is not None and segment_info.is_last else None
+        direction = self.message_bus.current_direction or 0
+        confidence = self.message_bus.current_confidence
+
+        # A chunk can end one utterance and start the next; forward each separately.
+        # Pieces are views into capture buffers, so they are copied (concatenated) here.
+        by_utterance: dict[int, list] = {}
+        for utterance_id, samples in self.vad.speech_audio:
+            by_utterance.setdefault(utterance_id, []).append(samples)
+        if ended_id is not None:
+            by_utterance.setdefault(ended_id, [])
+        for utterance_id in sorted(by_utterance):
+            pieces = by_utterance[utterance_id]
+            samples = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+            self.loop.call_soon_threadsafe(
+                self.streaming.push, utterance_id, samples, utterance_id == ended_id, direction, confidence
+            )
+
+    async def emit_streaming_caption(self, text: str, caption_id: str, is_final: bool,
+                                     direction: int, confidence: float):
+        """Emit an interim or final streaming caption; the final one replaces interims with the same id"""
+        await self.message_bus.emit_caption(
+            text=text,
+            mode="speech",
+            direction=direction,
+            confidence=confidence,
+            is_final=is_final,
+            caption_id=caption_id
+        )
+
+    async def emit_speech_caption(self, text: str, direction: int, confidence: float):
+        """Emit a transcribed caption (called by the STT scheduler, in order per direction)"""
+        await self.message_bus.emit_caption(
+            text=text,
+            mode="speech",
+            direction=direction,
+            confidence=confidence,
+            is_final=True
+        )
     
-    async def process_sound_event(self, audio_chunk: np.ndarray):
+    async def process_sound_event(self, frame: AudioFrame):
         """Process non-speech audio with classifier"""
         try:
             # Only classify if energy is significant
-            energy = AudioStream.get_rms_energy(audio_chunk)
-            if energy < 0.01:  # Skip very quiet sounds
+            if frame.rms < 0.01:  # Skip very quiet sounds
                 return
             
-            # Classify (potentially heavy; offload to thread)
-            label = await asyncio.to_thread(self.classifier.classify, audio_chunk)
+            # A sound like one classified recently reuses its label (no classifier call)
+            result = self.classifier.observe(frame)
+            if result is None:
+                # Classify on the classifier thread, batched with other queued chunks
+                result = await self.classifier.classify_async(frame)
+            label, score = result
             
-            if label and label != "[SILENCE]":
-                direction = self.message_bus.current_direction or 0
-                confidence = self.message_bus.current_confidence
-                
-                # Emit caption
-                await self.message_bus.emit_caption(
-                    text=label,
-                    mode="sound",
-                    direction=direction,
-                    confidence=confidence,
-                    is_final=True
-                )
+            # Repeats of a sound merge into one event: captioned at onset and offset only
+            scores = {label: score} if label and label != "[SILENCE]" else {}
+            context = (self.message_bus.current_direction or 0, self.message_bus.current_confidence)
+            await self.emit_sound_events(self.sound_events.add(frame.timestamp + frame.duration, scores, context))
         except Exception as e:
             logger.error(f"Error processing sound event: {e}")
     
+    async def emit_sound_events(self, events: list):
+        """
+        Caption sound onsets and offsets: the onset is an interim caption and the
+        offset the final caption with the same id, so the sound shows while it lasts
+        """
+        for event in events:
+            direction, confidence = event.context
+            await self.message_bus.emit_caption(
+                text=event.label,
+                mode="sound",
+                direction=direction,
+                confidence=confidence,
+                is_final=not event.onset,
+                caption_id=event.caption_id
+            )
+    
     def start_serial_reader(self):
         """Start serial reader in background thread"""
         if not self.serial_reader:
@@ -196,6 +371,9 @@ class SoundSightBackend:
         """Main run loop"""
         self.running = True
         self.loop = asyncio.get_running_loop()
+        self.stt_scheduler.start()
+        if self.streaming is not None:
+            self.streaming.start()
         
         # Start serial reader
         logger.info("Starting serial reader...")
@@ -210,7 +388,9 @@ class SoundSightBackend:
         # Keep running until interrupted
         try:
             while self.running:
-                await asyncio.sleep(1)
+                await asyncio.sleep(self.sound_events.slot_seconds)
+                # Close sound events whose sound stopped (no chunk may arrive to do it)
+                await self.emit_sound_events(self.sound_events.tick(time.time()))
         except KeyboardInterrupt:
             logger.info("Shutting down...")
         finally:
@@ -233,6 +413,13 @@ class SoundSightBackend:
         if self.tcp_client:
             await self.tcp_client.stop()
         
+        # Stop STT scheduling and close pooled connections
+        await self.stt_scheduler.stop()
+        if self.streaming is not None:
+            await self.streaming.stop()
+        await self.stt.aclose()
+        self.classifier.close()
+        
         logger.info("Shutdown complete")
 
 
@@ -24,6 +24,7 @@ class MessageBus:
         
         # Audio state
         self.current_audio_energy: float = 0.0
+        self.last_audio_time: Optional[float] = None
         
     def update_direction(self, direction: int, confidence: float, timestamp: float):
         """
@@ -62,13 +63,19 @@ class MessageBus:
     def update_audio_energy(self, energy: float):
         """Update current audio energy level"""
         self.current_audio_energy = energy
+
+    def update_audio_frame(self, frame):
+        """Update audio state from an AudioFrame (reuses its cached RMS)"""
+        self.current_audio_energy = frame.rms
+        self.last_audio_time = frame.timestamp
     
     async def emit_caption(self, 
                           text: str,
                           mode: str,
                           direction: Optional[int] = None,
                           confidence: Optional[float] = None,
-                          is_final: bool = True):
+                          is_final: bool = True,
+                          caption_id: Optional[str] = None):
         """
         Emit a caption event via TCP
         
@@ -78,6 +85,7 @@ class MessageBus:
             direction: Direction index (0-3) or None
             confidence: Confidence value (0.0-1.0) or None
             is_final: Whether this is a final caption
+            caption_id: Shared by interim captions and the final caption that replaces them
         """
         from config import MIN_ENERGY, ENABLE_GATING
         
@@ -107,6 +115,8 @@ class MessageBus:
             "confidence": confidence,
             "timestamp": datetime.now().timestamp()
         }
+        if caption_id is not None:
+            message["id"] = caption_id
         
         await self.transport_server.broadcast(message)
         logger.info(f"Caption emitted: [{mode}] {text[:50]}... (dir={direction}, conf={confidence:.2f})")
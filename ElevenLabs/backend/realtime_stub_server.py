@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the ElevenLabs realtime STT websocket
+Replays scripted partial results so streaming captions can be exercised without
+an API key or network. Point the backend at it with
+ELEVENLABS_REALTIME_URL=ws://127.0.0.1:8765
+
+Script file format (JSON), one entry per utterance, replayed in a loop:
+    [{"partials": ["hello", "hello wor"], "final": "hello world"}, ...]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCRIPT = [
+    {"partials": ["hey", "hey can", "hey can you hear"], "final": "Hey, can you hear me?"},
+    {"partials": ["the door", "the door is open"], "final": "The door is open."},
+]
+
+
+class ScriptedRealtimeServer:
+    """
+    Websocket server speaking the subset of the realtime protocol used by ElevenLabsRealtimeSTT
+    Sends the next scripted partial_transcript every `chunks_per_partial` audio
+    chunks and a committed_transcript (the final) when a commit arrives.
+    """
+
+    def __init__(self, script: Optional[list] = None, host: str = "127.0.0.1", port: int = 8765,
+                 chunks_per_partial: int = 3):
+        self.script = script or DEFAULT_SCRIPT
+        self.host = host
+        self.port = port
+        self.chunks_per_partial = max(1, chunks_per_partial)
+        self._server = None
+        self.utterance_index = 0
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        import websockets
+
+        self._server = await websockets.serve(self._handle, self.host, self.port)
+        if self.port == 0:
+            self.port = next(iter(self._server.sockets)).getsockname()[1]
+        logger.info(f"Scripted realtime STT server on {self.url}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, ws, *_):
+        chunks = 0
+        sent = 0
+        await ws.send(json.dumps({"message_type": "session_started"}))
+        async for raw in ws:
+            message = json.loads(raw)
+            if message.get("message_type") != "input_audio_chunk":
+                continue
+            entry = self.script[self.utterance_index % len(self.script)]
+            partials = entry.get("partials", [])
+
+            if message.get("audio_base_64"):
+                chunks += 1
+                if chunks % self.chunks_per_partial == 0 and sent < len(partials):
+                    await ws.send(json.dumps({"message_type": "partial_transcript", "text": partials[sent]}))
+                    sent += 1
+
+            if message.get("commit"):
+                await ws.send(json.dumps({"message_type": "committed_transcript", "text": entry.get("final", "")}))
+                self.utterance_index += 1
+                chunks = 0
+                sent = 0
+
+
+async def _serve(args):
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    server = ScriptedRealtimeServer(script, args.host, args.port, args.chunks_per_partial)
+    await server.start()
+    print(f"Serving scripted realtime STT on {server.url} (Ctrl+C to stop)")
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scripted stand-in for the ElevenLabs realtime STT API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="JSON file with scripted utterances")
+    parser.add_argument("--chunks-per-partial", type=int, default=3)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,75 @@
+"""
+Streaming polyphase resampler
+Converts captured audio from the device's native rate to the pipeline rate
+"""
+
+import numpy as np
+from math import gcd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class StreamingResampler:
+    """
+    Stateful rational-factor (up/down) polyphase FIR resampler
+    Uses a Kaiser-windowed sinc lowpass (same design rule as scipy's resample_poly)
+    split into `up` phases. Each block is processed with one vectorized gather +
+    dot product; filter history carries across blocks so output is seamless.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, half_width: int = 10, kaiser_beta: float = 5.0):
+        g = gcd(int(in_rate), int(out_rate))
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        self.up = self.out_rate // g
+        self.down = self.in_rate // g
+
+        max_rate = max(self.up, self.down)
+        n_taps = 2 * half_width * max_rate + 1
+        self.taps_per_phase = -(-n_taps // self.up)
+        n_taps = self.taps_per_phase * self.up
+
+        cutoff = 0.5 / max_rate  # cycles per sample at the upsampled rate
+        t = np.arange(n_taps) - (n_taps - 1) / 2.0
+        h = 2.0 * cutoff * np.sinc(2.0 * cutoff * t) * np.kaiser(n_taps, kaiser_beta)
+        h *= self.up / h.sum()  # Unity DC gain after zero-stuffing
+
+        # phases[p, i] = h[p + i * up], reversed so it dots with ascending input history
+        self.phases = h.reshape(self.taps_per_phase, self.up).T[:, ::-1].astype(np.float32).copy()
+        # Output delay of the linear-phase filter, in input samples
+        self.delay = (n_taps - 1) / 2.0 / self.up
+
+        self.reset()
+
+    def reset(self):
+        """Clear filter history"""
+        self._history = np.zeros(self.taps_per_phase - 1, dtype=np.float32)
+        self._consumed = 0  # Total input samples seen
+        self._produced = 0  # Total output samples produced
+
+    @property
+    def passthrough(self) -> bool:
+        return self.up == 1 and self.down == 1
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Resample one block; returns however many output samples the block completes"""
+        if self.passthrough:
+            return block
+
+        block = np.asarray(block, dtype=np.float32)
+        buf = np.concatenate((self._history, block))
+        buf_start = self._consumed - (self.taps_per_phase - 1)  # Absolute index of buf[0]
+        self._consumed += len(block)
+
+        # Output n needs input up to base = floor(n * down / up)
+        n_end = -(-(self._consumed * self.up) // self.down)
+        n = np.arange(self._produced, n_end, dtype=np.int64)
+        self._produced = n_end
+
+        self._history = buf[len(buf) - (self.taps_per_phase - 1):]
+        if len(n) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        m = n * self.down
+        bases = m // self.up
+        windows = sliding_window_view(buf, self.taps_per_phase)[bases - (self.taps_per_phase - 1) - buf_start]
+        return np.einsum("ij,ij->i", windows, self.phases[m % self.up]).astype(np.float32)
@@ -0,0 +1,91 @@
+"""
+Speech segment post-processing between VAD and STT
+Trims leading noise and trailing hangover silence so STT backends do not pay to
+upload or decode it
+"""
+
+import logging
+import numpy as np
+from config import AUDIO_SAMPLE_RATE, TRIM_FRAME_MS, TRIM_MARGIN_MS, TRIM_THRESHOLD_DB
+
+logger = logging.getLogger(__name__)
+
+# STT uploads are 16-bit PCM
+BYTES_PER_SAMPLE = 2
+
+
+class SegmentTrimmer:
+    """
+    Frame-resolution silence trimmer
+    Computes a vectorized RMS envelope over fixed frames and keeps the span between
+    the first and last frame above max(peak * threshold_db, floor), plus a safety
+    margin on both sides.
+    """
+
+    def __init__(self,
+                 sample_rate: int = AUDIO_SAMPLE_RATE,
+                 frame_ms: int = TRIM_FRAME_MS,
+                 margin_ms: int = TRIM_MARGIN_MS,
+                 threshold_db: float = TRIM_THRESHOLD_DB):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.margin_ms = margin_ms
+        self.threshold_ratio = 10.0 ** (threshold_db / 20.0)
+
+        self.segments = 0
+        self.total_seconds_saved = 0.0
+        self.total_bytes_saved = 0
+
+    def trim(self, audio: np.ndarray, floor: float = 0.0,
+             sample_rate: int = None) -> tuple[np.ndarray, dict]:
+        """
+        Trim a speech segment
+
+        Args:
+            audio: Segment samples (float32, mono)
+            floor: Absolute RMS level below which frames count as silence (e.g. VAD stop threshold)
+            sample_rate: Sample rate in Hz (defaults to the trimmer's rate)
+
+        Returns:
+            (trimmed_view, stats) where stats has samples/seconds/bytes saved
+        """
+        sample_rate = sample_rate or self.sample_rate
+        frame = max(1, int(sample_rate * self.frame_ms / 1000))
+        margin = int(sample_rate * self.margin_ms / 1000)
+        n_frames = -(-len(audio) // frame)
+
+        start, end = 0, len(audio)
+        if n_frames > 0:
+            # Zero-pad the last partial frame so the envelope is one reshape
+            padded = np.zeros(n_frames * frame, dtype=np.float32)
+            padded[:len(audio)] = audio
+            frames = padded.reshape(n_frames, frame)
+            envelope = np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame)
+
+            threshold = max(float(envelope.max()) * self.threshold_ratio, floor)
+            active = np.flatnonzero(envelope >= threshold)
+            if len(active) > 0:
+                start = max(0, int(active[0]) * frame - margin)
+                end = min(len(audio), (int(active[-1]) + 1) * frame + margin)
+
+        trimmed = audio[start:end]
+        removed = len(audio) - len(trimmed)
+        stats = {
+            "samples_saved": removed,
+            "seconds_saved": removed / sample_rate,
+            "bytes_saved": removed * BYTES_PER_SAMPLE,
+            "original_seconds": len(audio) / sample_rate,
+        }
+
+        self.segments += 1
+        self.total_seconds_saved += stats["seconds_saved"]
+        self.total_bytes_saved += stats["bytes_saved"]
+        return trimmed, stats
+
+    def get_stats(self) -> dict:
+        """Return cumulative trimming totals"""
+        return {
+            "segments": self.segments,
+            "seconds_saved": self.total_seconds_saved,
+            "bytes_saved": self.total_bytes_saved,
+        }
@@ -0,0 +1,168 @@
+"""
+Temporal aggregation of sound labels into onset/offset events
+Per-chunk classifier labels are accumulated per label over a sliding window
+of time slots; a sound is captioned once when it starts and once when it
+ends, however many chunks it spans.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Optional
+import numpy as np
+from config import (
+    SOUND_WINDOW_SECONDS,
+    SOUND_SLOT_SECONDS,
+    SOUND_ONSET_SCORE,
+    SOUND_OFFSET_SCORE,
+    SOUND_MAX_ACTIVE,
+)
+
+
+@dataclass
+class SoundEvent:
+    """Onset or offset of a sound label"""
+    label: str
+    caption_id: str
+    onset: bool      # False = offset
+    score: float     # Windowed score when the event fired
+    context: Any     # Whatever was passed with the onset chunk (e.g. direction)
+
+
+class SoundEventAggregator:
+    """
+    Sliding-window score accumulator with onset/offset hysteresis
+    Scores live in a fixed (n_slots, max_labels) ring array with per-label
+    running sums, so adding a chunk or advancing a slot is O(labels). A label
+    starts (onset) when its windowed sum reaches onset_score and ends (offset)
+    once it falls below offset_score; repeats in between merge into the
+    active event. Since an offset needs the label to fade over most of the
+    window, each label yields at most two events per window, and at most
+    max_active labels are active, so the event rate is bounded by
+    2 * max_active / window_seconds regardless of chunk rate.
+    """
+
+    def __init__(self,
+                 window_seconds: float = SOUND_WINDOW_SECONDS,
+                 slot_seconds: float = SOUND_SLOT_SECONDS,
+                 onset_score: float = SOUND_ONSET_SCORE,
+                 offset_score: float = SOUND_OFFSET_SCORE,
+                 max_active: int = SOUND_MAX_ACTIVE,
+                 max_labels: int = 16):
+        """
+        Args:
+            window_seconds: Sliding window length
+            slot_seconds: Time resolution; scores within a slot keep the maximum per label
+            onset_score: Windowed score sum that starts a sound event
+            offset_score: Windowed score sum below which it ends
+            max_active: Sound events that can be open at once
+            max_labels: Labels tracked at once (the weakest inactive one is evicted)
+        """
+        self.slot_seconds = slot_seconds
+        self.n_slots = max(1, int(round(window_seconds / slot_seconds)))
+        self.onset_score = onset_score
+        self.offset_score = min(offset_score, onset_score)
+        self.max_active = max(1, max_active)
+
+        self._scores = np.zeros((self.n_slots, max_labels), dtype=np.float32)
+        self._sums = np.zeros(max_labels, dtype=np.float64)
+        self._columns: dict[str, int] = {}
+        self._labels: list[Optional[str]] = [None] * max_labels
+        self._slot: Optional[int] = None  # Absolute index of the current slot
+
+        self._active: dict[str, tuple[str, Any]] = {}  # label -> (caption_id, context)
+        self._next_id = 1
+        self.onsets = 0
+        self.offsets = 0
+        self.chunks = 0
+
+    def _advance(self, timestamp: float):
+        """Move the window so the current slot covers timestamp, clearing expired slots"""
+        slot = int(timestamp // self.slot_seconds)
+        if self._slot is None:
+            self._slot = slot
+            return
+        if slot - self._slot >= self.n_slots:
+            self._scores.fill(0.0)
+            self._sums.fill(0.0)
+        else:
+            for absolute in range(self._slot + 1, slot + 1):
+                row = absolute % self.n_slots
+                self._sums -= self._scores[row]
+                self._scores[row] = 0.0
+        self._slot = max(self._slot, slot)
+
+    def _column(self, label: str) -> Optional[int]:
+        column = self._columns.get(label)
+        if column is not None:
+            return column
+        free = [i for i, name in enumerate(self._labels) if name is None]
+        if free:
+            column = free[0]
+        else:
+            inactive = [i for i, name in enumerate(self._labels) if name not in self._active]
+            if not inactive:
+                return None
+            column = min(inactive, key=lambda i: self._sums[i])
+            del self._columns[self._labels[column]]
+        self._scores[:, column] = 0.0
+        self._sums[column] = 0.0
+        self._labels[column] = label
+        self._columns[label] = column
+        return column
+
+    def add(self, timestamp: float, scores: dict[str, float], context: Any = None) -> list[SoundEvent]:
+        """
+        Fold one chunk's label scores in and return the events it triggers
+
+        Args:
+            timestamp: Time of the chunk (time.time() clock)
+            scores: Label -> score for the chunk
+            context: Stored with an onset and returned with the matching offset
+        """
+        self._advance(timestamp)
+        self.chunks += 1
+        row = self._slot % self.n_slots
+        for label, score in scores.items():
+            column = self._column(label)
+            if column is None:
+                continue
+            previous = self._scores[row, column]
+            if score > previous:
+                self._scores[row, column] = score
+                self._sums[column] += score - previous
+        return self._events(context)
+
+    def tick(self, timestamp: float) -> list[SoundEvent]:
+        """Advance the window without a new chunk (emits offsets of sounds that stopped)"""
+        self._advance(timestamp)
+        return self._events(None)
+
+    def _events(self, context: Any) -> list[SoundEvent]:
+        events = []
+        for label in list(self._active):
+            score = float(self._sums[self._columns[label]])
+            if score < self.offset_score:
+                caption_id, onset_context = self._active.pop(label)
+                events.append(SoundEvent(label, caption_id, False, score, onset_context))
+                self.offsets += 1
+
+        candidates = sorted(
+            (float(self._sums[column]), label) for label, column in self._columns.items()
+            if label not in self._active and self._sums[column] >= self.onset_score
+        )
+        for score, label in reversed(candidates):
+            if len(self._active) >= self.max_active:
+                break
+            caption_id = f"snd-{self._next_id}"
+            self._next_id += 1
+            self._active[label] = (caption_id, context)
+            events.append(SoundEvent(label, caption_id, True, score, context))
+            self.onsets += 1
+        return events
+
+    def get_stats(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "onsets": self.onsets,
+            "offsets": self.offsets,
+            "active": len(self._active),
+        }
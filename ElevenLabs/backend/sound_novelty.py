@@ -0,0 +1,124 @@
+"""
+Novelty gate in front of the sound classifier
+Non-speech chunks are compared with recently classified sounds by their band
+energies (mel bands over the chunk's memoized stft, shared with any other stage
+using the same frame parameters). A chunk that matches one of them reuses its label instead of running
+the classifier; only new sounds, level jumps and stale entries are classified.
+"""
+
+import time
+from collections import deque
+from typing import Optional
+import numpy as np
+from config import (
+    VAD_FRAME_MS,
+    VAD_HOP_MS,
+    CLASSIFIER_NOVELTY_THRESHOLD,
+    CLASSIFIER_NOVELTY_LEVEL_DB,
+    CLASSIFIER_NOVELTY_BANDS,
+    CLASSIFIER_REFRESH_SECONDS,
+)
+from audio_frame import AudioFrame, fft_size, mel_filterbank
+
+
+class NoveltyGate:
+    """
+    Label cache keyed by spectral signature
+    Signature: mean mel-band magnitudes of the chunk (compared by cosine
+    distance, so it is level-independent) plus its RMS level in dB. A cached
+    entry matches when the distance is below threshold and the level is within
+    level_db; entries older than refresh_seconds are re-classified.
+    """
+
+    def __init__(self,
+                 threshold: float = CLASSIFIER_NOVELTY_THRESHOLD,
+                 level_db: float = CLASSIFIER_NOVELTY_LEVEL_DB,
+                 n_bands: int = CLASSIFIER_NOVELTY_BANDS,
+                 refresh_seconds: float = CLASSIFIER_REFRESH_SECONDS,
+                 frame_ms: int = VAD_FRAME_MS,
+                 hop_ms: int = VAD_HOP_MS,
+                 max_entries: int = 8):
+        """
+        Args:
+            threshold: Cosine distance above which a chunk is a different sound (0 = gate off)
+            level_db: Level change (dB) that also counts as a different sound
+            n_bands: Mel bands in the signature
+            refresh_seconds: Age after which a cached label is re-checked by the classifier
+            frame_ms / hop_ms: STFT frame and hop lengths (default: the VAD's analysis frames)
+            max_entries: Recently classified sounds remembered
+        """
+        self.threshold = threshold
+        self.level_db = level_db
+        self.n_bands = n_bands
+        self.refresh_seconds = refresh_seconds
+        self.frame_ms = frame_ms
+        self.hop_ms = hop_ms
+        # (bands, level_db, label, score, classified_at), most recent last
+        self._entries: deque = deque(maxlen=max_entries)
+
+        self.observed = 0
+        self.reused = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def signature(self, frame: AudioFrame) -> tuple[np.ndarray, float]:
+        """(unit-norm band magnitudes, level in dB) for a chunk"""
+        def compute():
+            frame_length = int(frame.sample_rate * self.frame_ms / 1000)
+            hop_length = int(frame.sample_rate * self.hop_ms / 1000)
+            power = frame.stft(frame_length, hop_length)
+            if not len(power):
+                return np.zeros(self.n_bands, dtype=np.float32)
+            bank = mel_filterbank(frame.sample_rate, fft_size(frame_length), self.n_bands)
+            bands = np.sqrt(power.mean(axis=0) @ bank.T)
+            norm = np.linalg.norm(bands)
+            return bands / norm if norm > 0 else bands
+
+        bands = frame.feature(("novelty_bands", self.n_bands, self.frame_ms, self.hop_ms), compute)
+        return bands, 20.0 * np.log10(max(frame.rms, 1e-10))
+
+    def observe(self, frame: AudioFrame) -> Optional[tuple[str, float]]:
+        """Cached (label, score) if the chunk matches a recently classified sound, else None (classify it)"""
+        self.observed += 1
+        if not self.enabled:
+            return None
+        bands, level = self.signature(frame)
+        now = time.time()
+        best, best_distance = None, self.threshold
+        for entry in reversed(self._entries):
+            entry_bands, entry_level, _, _, classified_at = entry
+            if now - classified_at > self.refresh_seconds or abs(level - entry_level) > self.level_db:
+                continue
+            distance = 1.0 - float(np.dot(bands, entry_bands))
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        if best is None:
+            return None
+        self.reused += 1
+        return best[2], best[3]
+
+    def update(self, frame: AudioFrame, label: str, score: float):
+        """Remember the classifier's label and score for this chunk's sound"""
+        if not self.enabled:
+            return
+        bands, level = self.signature(frame)
+        now = time.time()
+        # Drop expired entries and the one this chunk replaces
+        kept = [
+            entry for entry in self._entries
+            if now - entry[4] <= self.refresh_seconds
+            and (abs(level - entry[1]) > self.level_db or 1.0 - float(np.dot(bands, entry[0])) >= self.threshold)
+        ]
+        self._entries.clear()
+        self._entries.extend(kept)
+        self._entries.append((bands, level, label, score, now))
+
+    def get_stats(self) -> dict:
+        return {
+            "observed": self.observed,
+            "reused": self.reused,
+            "classified": self.observed - self.reused,
+            "cached": len(self._entries),
+        }
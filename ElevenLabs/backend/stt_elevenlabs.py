@@ -2,30 +2,60 @@
 Speech-to-Text using ElevenLabs API
 """
 
-import io
-import wave
+import asyncio
 import logging
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import requests
-from typing import Optional
-from pathlib import Path
-from datetime import datetime
-from config import SAVE_AUDIO_DIR, SAVE_AUDIO_MAX
+from requests.adapters import HTTPAdapter
+from typing import Optional, Union
+from config import (
+    SAVE_AUDIO_DIR,
+    ELEVENLABS_POOL_SIZE,
+    ELEVENLABS_PREWARM,
+    ELEVENLABS_HTTP2,
+    ELEVENLABS_TIMEOUT,
+    ELEVENLABS_AUDIO_CODEC,
+)
+from audio_frame import AudioFrame
+from audio_encoders import create_audio_encoder, to_pcm16, wav_size
+from audio_archive import AudioArchiver
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 logger = logging.getLogger(__name__)
 
+# Exceptions raised by whichever HTTP client is in use
+HTTP_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
 
 class ElevenLabsSTT:
     """Speech-to-text using ElevenLabs batch API"""
     
-    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.elevenlabs.io"):
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 base_url: str = "https://api.elevenlabs.io",
+                 pool_size: int = ELEVENLABS_POOL_SIZE,
+                 http2: bool = ELEVENLABS_HTTP2,
+                 timeout: float = ELEVENLABS_TIMEOUT,
+                 codec: str = ELEVENLABS_AUDIO_CODEC):
         """
         Initialize ElevenLabs STT client
         
         Args:
             api_key: ElevenLabs API key (defaults to ELEVENLABS_API_KEY env var)
             base_url: API base URL (default: https://api.elevenlabs.io)
+            pool_size: Keep-alive connections shared by all worker threads
+            http2: Use an HTTP/2 httpx client if httpx[http2] is installed
+            timeout: Request timeout in seconds
+            codec: Upload encoding (wav, flac or opus; falls back to wav if unavailable)
         """
         self.api_key = api_key or os.getenv("ELEVENLABS_API_KEY")
         if not self.api_key:
@@ -33,140 +63,374 @@ class ElevenLabsSTT:
         
         self.base_url = base_url.rstrip("/")
         self.endpoint = f"{self.base_url}/v1/speech-to-text"
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.http2_requested = http2
+        self.encoder = create_audio_encoder(codec)
         
-        logger.info("ElevenLabs STT initialized")
-    
-    def _audio_to_wav_bytes(self, audio: np.ndarray, sample_rate: int = 16000) -> bytes:
+        # One pooled keep-alive client shared by every asyncio.to_thread worker,
+        # so only the first request per connection pays for DNS + TCP + TLS
+        self.http2 = False
+        self.session = None
+        if http2:
+            try:
+                self.session = httpx.Client(
+                    http2=True,
+                    headers=self._headers(),
+                    timeout=timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.pool_size, max_keepalive_connections=self.pool_size
+                    ),
+                )
+                self.http2 = True
+            except Exception as e:
+                logger.warning(f"HTTP/2 client unavailable ({e}), using requests session")
+        if self.session is None:
+            self.session = requests.Session()
+            self.session.headers.update(self._headers())
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=1)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        
+        self._stats_lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=200)
+        self.requests_sent = 0
+        self.request_errors = 0
+        self.requests_cancelled = 0
+        # Per-request upload metrics (codec, encode_ms, upload_bytes, bytes_saved, latency_ms)
+        self.recent_requests: deque = deque(maxlen=200)
+        self.total_bytes_saved = 0
+        
+        # Debug copies of uploaded segments, written off the request path
+        self.archiver: Optional[AudioArchiver] = AudioArchiver() if SAVE_AUDIO_DIR else None
+        
+        # Non-blocking client for transcribe_async, bound to the loop that first uses it
+        self._async_client = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_connections = 0  # TCP connects made by the async client (counted via httpcore trace events)
+        
+        logger.info(
+            f"ElevenLabs STT initialized ({'HTTP/2' if self.http2 else 'HTTP/1.1'} pool of {self.pool_size}, "
+            f"{self.encoder.name} uploads)"
+        )
+
+    def _headers(self) -> dict:
+        return {
+            'xi-api-key': self.api_key,
+            'Accept': 'application/json'
+        }
+
+    def warm_up(self, connections: int = ELEVENLABS_PREWARM):
+        """
+        Open pooled connections ahead of the first utterance
+        Any HTTP response (even 404/405) means DNS, TCP and TLS are done.
+        """
+        connections = min(max(0, connections), self.pool_size)
+        if connections == 0:
+            return
+
+        def ping(_):
+            start = time.perf_counter()
+            try:
+                self.session.head(self.base_url, timeout=self.timeout)
+                return time.perf_counter() - start
+            except HTTP_ERRORS as e:
+                logger.warning(f"ElevenLabs warm-up failed: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            results = list(pool.map(ping, range(connections)))
+        warmed = [r for r in results if r is not None]
+        if warmed:
+            logger.info(
+                f"ElevenLabs connections warmed: {len(warmed)}/{connections} "
+                f"(slowest {max(warmed) * 1000:.0f} ms)"
+            )
+
+    async def warm_up_async(self, connections: int = ELEVENLABS_PREWARM):
+        """
+        Open the async client's connections ahead of the first utterance
+        transcribe_async uses its own httpx.AsyncClient, so this creates it on the
+        running loop and sends concurrent HEAD requests through it. Without httpx
+        the blocking session is warmed instead.
         """
-        Convert numpy float32 audio array to WAV file bytes (16-bit PCM)
+        if httpx is None:
+            await asyncio.to_thread(self.warm_up, connections)
+            return
+        connections = min(max(0, connections), self.pool_size)
+        if connections == 0:
+            return
+        client = self._get_async_client()
+
+        async def ping():
+            start = time.perf_counter()
+            try:
+                await client.head(self.base_url, extensions={"trace": self._trace})
+                return time.perf_counter() - start
+            except httpx.HTTPError as e:
+                logger.warning(f"ElevenLabs warm-up failed: {e}")
+                return None
+
+        results = await asyncio.gather(*(ping() for _ in range(connections)))
+        warmed = [r for r in results if r is not None]
+        if warmed:
+            logger.info(
+                f"ElevenLabs async connections warmed: {len(warmed)}/{connections} "
+                f"(slowest {max(warmed) * 1000:.0f} ms)"
+            )
+
+    async def _trace(self, event: str, info: dict):
+        """httpcore trace hook: counts new connections made by the async client"""
+        if event == "connection.connect_tcp.complete":
+            with self._stats_lock:
+                self._async_connections += 1
+
+    def _connections_opened(self) -> Optional[int]:
+        """Connections opened so far by both clients (first connect + reconnects); None if not exposed"""
+        opened = None
+        if not self.http2:
+            try:
+                pools = self.session.get_adapter(self.endpoint).poolmanager.pools
+                opened = sum(pools[key].num_connections for key in pools.keys())
+            except Exception:
+                pass
+        if httpx is not None:
+            opened = (opened or 0) + self._async_connections
+        return opened
+
+    def _record_request(self, latency: float, ok: bool, upload: Optional[dict] = None):
+        with self._stats_lock:
+            self.requests_sent += 1
+            if ok:
+                self._latencies.append(latency)
+            else:
+                self.request_errors += 1
+            if upload is not None:
+                self.recent_requests.append({**upload, "latency_ms": latency * 1000.0, "ok": ok})
+                self.total_bytes_saved += upload["bytes_saved"]
+
+    def get_stats(self) -> dict:
+        """Return request counts, connection reuse and rolling latency percentiles (ms)"""
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000.0
+            uploads = list(self.recent_requests)
+            stats = {
+                "requests": self.requests_sent,
+                "errors": self.request_errors,
+                "cancelled": self.requests_cancelled,
+                "connections_opened": self._connections_opened(),
+                "http2": self.http2,
+                "codec": self.encoder.name,
+                "bytes_saved": self.total_bytes_saved,
+            }
+        if uploads:
+            stats["encode_ms_avg"] = float(np.mean([u["encode_ms"] for u in uploads]))
+            stats["upload_bytes_avg"] = float(np.mean([u["upload_bytes"] for u in uploads]))
+        if len(latencies):
+            stats["latency_p50_ms"] = float(np.percentile(latencies, 50))
+            stats["latency_p95_ms"] = float(np.percentile(latencies, 95))
+        return stats
+
+    def close(self):
+        """Close pooled connections and flush the debug archiver"""
+        self.session.close()
+        if self.archiver is not None:
+            self.archiver.close()
+
+    async def aclose(self):
+        """Close the async client (if one was created) and the pooled session"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.session.close()
+        if self.archiver is not None:
+            # Flushing queued segments can take a while; keep it off the event loop
+            await asyncio.to_thread(self.archiver.close)
+
+    def _get_async_client(self):
+        """Create the httpx.AsyncClient on first use from the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            try:
+                client = httpx.AsyncClient(
+                    http2=self.http2_requested, headers=self._headers(), timeout=self.timeout, limits=limits
+                )
+            except ImportError:
+                # http2=True without the h2 package
+                client = httpx.AsyncClient(headers=self._headers(), timeout=self.timeout, limits=limits)
+            self._async_client = client
+            self._async_loop = loop
+        return self._async_client
+    
+    @staticmethod
+    def _extract_text(result) -> str:
+        """Pull the transcript out of an API response body"""
+        # Extract transcription text (try common response keys)
+        text = None
+        if isinstance(result, dict):
+            text = result.get('text') or result.get('transcript') or result.get('transcription')
+        elif isinstance(result, str):
+            text = result
         
-        Args:
-            audio: Audio samples as numpy array (float32, mono, range [-1, 1])
-            sample_rate: Sample rate in Hz
+        if text:
+            text = str(text).strip()
+            logger.debug(f"Transcribed: {text}")
+            return text if text else "[NO_SPEECH]"
+        else:
+            logger.warning(f"Unexpected API response format: {result}")
+            return "[TRANSCRIPTION_ERROR]"
+
+    def _build_request(self, audio: np.ndarray, sample_rate: int,
+                       language: Optional[str]) -> tuple[dict, dict, dict]:
+        """
+        Encode audio and build the multipart form
         
         Returns:
-            WAV file bytes
+            (files, data, upload) where upload has codec, encode_ms, upload_bytes and
+            bytes_saved relative to a 16-bit WAV upload
         """
-        # Ensure audio is float32 and in valid range
-        audio = np.clip(audio, -1.0, 1.0).astype(np.float32)
-        
-        # Convert to int16 PCM
-        audio_int16 = (audio * 32767.0).astype(np.int16)
+        # PCM is computed once and shared by the encoder and the debug archiver
+        pcm = to_pcm16(audio)
         
-        # Create WAV file in memory
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, 'wb') as wav_file:
-            wav_file.setnchannels(1)  # Mono
-            wav_file.setsampwidth(2)  # 16-bit = 2 bytes
-            wav_file.setframerate(sample_rate)
-            wav_file.writeframes(audio_int16.tobytes())
+        start = time.perf_counter()
+        body = self.encoder.encode(pcm, sample_rate)
+        if self.archiver is not None:
+            self.archiver.submit(pcm, sample_rate, wav=body if self.encoder.name == "wav" else None)
+        upload = {
+            "codec": self.encoder.name,
+            "encode_ms": (time.perf_counter() - start) * 1000.0,
+            "upload_bytes": len(body),
+            "bytes_saved": wav_size(len(pcm)) - len(body),
+        }
         
-        wav_bytes = wav_buffer.getvalue()
-        wav_buffer.close()
+        # Prepare multipart form data
+        files = {
+            'file': (self.encoder.filename, body, self.encoder.mime_type)
+        }
         
-        return wav_bytes
-
-    def _maybe_save_audio(self, audio: np.ndarray, sample_rate: int = 16000) -> None:
-        if not SAVE_AUDIO_DIR:
-            return
+        # Optional: add language parameter if provided
+        data = {
+            "model_id": "scribe_v1"
+        }
+        if language:
+            data['language'] = language
+        return files, data, upload
 
-        output_dir = Path(SAVE_AUDIO_DIR)
-        output_dir.mkdir(parents=True, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        filename = output_dir / f"stt_{timestamp}.wav"
+    @staticmethod
+    def _log_http_error(e: Exception):
+        logger.error(f"ElevenLabs API request failed: {e}")
+        if getattr(e, 'response', None) is not None:
+            try:
+                error_detail = e.response.json()
+                logger.error(f"API error details: {error_detail}")
+            except Exception:
+                logger.error(f"API error response: {e.response.text}")
 
-        audio = np.clip(audio, -1.0, 1.0).astype(np.float32)
-        audio_int16 = (audio * 32767.0).astype(np.int16)
-
-        with wave.open(str(filename), 'wb') as wav_file:
-            wav_file.setnchannels(1)
-            wav_file.setsampwidth(2)
-            wav_file.setframerate(sample_rate)
-            wav_file.writeframes(audio_int16.tobytes())
+    async def transcribe_async(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = 16000,
+                               language: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """
+        Transcribe audio without holding a worker thread while the request is in flight
+        
+        Args:
+            audio: AudioFrame or audio samples as numpy array (float32, mono, range [-1, 1])
+            sample_rate: Sample rate in Hz (default 16000; taken from the frame for AudioFrame)
+            language: Optional language code (e.g., "en"). If None, API auto-detects.
+            timeout: Deadline for the whole request in seconds (default: client timeout)
+        
+        Returns:
+            Transcribed text string, or "[TRANSCRIPTION_ERROR]" on failure or missed deadline.
+            Cancelling the awaiting task aborts the request.
+        """
+        if httpx is None:
+            # No async HTTP client installed: fall back to the blocking path on a thread
+            return await asyncio.to_thread(self.transcribe, audio, sample_rate, language)
 
+        audio, sample_rate = AudioFrame.unwrap(audio, sample_rate)
+        timeout = self.timeout if timeout is None else timeout
         try:
-            files = sorted(output_dir.glob("stt_*.wav"))
-            if SAVE_AUDIO_MAX > 0 and len(files) > SAVE_AUDIO_MAX:
-                for old in files[:len(files) - SAVE_AUDIO_MAX]:
-                    old.unlink(missing_ok=True)
+            # Encoding (FLAC/Opus can take a few ms per second of audio) stays off the event loop
+            files, data, upload = await asyncio.to_thread(self._build_request, audio, sample_rate, language)
+            client = self._get_async_client()
+            
+            logger.debug(
+                f"Sending audio to ElevenLabs ({upload['upload_bytes']} bytes {upload['codec']}, "
+                f"encoded in {upload['encode_ms']:.1f} ms, deadline {timeout:.1f}s)"
+            )
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(
+                    client.post(self.endpoint, files=files, data=data, extensions={"trace": self._trace}), timeout
+                )
+                response.raise_for_status()
+            except asyncio.CancelledError:
+                with self._stats_lock:
+                    self.requests_cancelled += 1
+                raise
+            except (asyncio.TimeoutError, httpx.HTTPError):
+                self._record_request(time.perf_counter() - start, ok=False, upload=upload)
+                raise
+            latency = time.perf_counter() - start
+            self._record_request(latency, ok=True, upload=upload)
+            logger.debug(f"ElevenLabs response: {response.status_code} in {latency * 1000:.0f} ms")
+            
+            return self._extract_text(response.json())
+            
+        except asyncio.TimeoutError:
+            logger.error(f"ElevenLabs request missed its {timeout:.1f}s deadline")
+            return "[TRANSCRIPTION_ERROR]"
+        except httpx.HTTPError as e:
+            self._log_http_error(e)
+            return "[TRANSCRIPTION_ERROR]"
         except Exception as e:
-            logger.warning(f"Failed to prune saved audio: {e}")
-    
-    def transcribe(self, audio: np.ndarray, sample_rate: int = 16000, language: Optional[str] = None) -> str:
+            logger.error(f"Transcription error: {e}", exc_info=True)
+            return "[TRANSCRIPTION_ERROR]"
+
+    def transcribe(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = 16000,
+                   language: Optional[str] = None) -> str:
         """
         Transcribe audio to text using ElevenLabs API
         
         Args:
-            audio: Audio samples as numpy array (float32, mono, range [-1, 1])
-            sample_rate: Sample rate in Hz (default 16000)
+            audio: AudioFrame or audio samples as numpy array (float32, mono, range [-1, 1])
+            sample_rate: Sample rate in Hz (default 16000; taken from the frame for AudioFrame)
             language: Optional language code (e.g., "en"). If None, API auto-detects.
         
         Returns:
             Transcribed text string, or "[TRANSCRIPTION_ERROR]" on failure
         """
+        audio, sample_rate = AudioFrame.unwrap(audio, sample_rate)
         try:
-            # Convert audio to WAV bytes
-            wav_bytes = self._audio_to_wav_bytes(audio, sample_rate)
-            self._maybe_save_audio(audio, sample_rate)
-            
-            # Prepare multipart form data
-            files = {
-                'file': ('audio.wav', wav_bytes, 'audio/wav')
-            }
-            
-            # Prepare headers
-            headers = {
-                'xi-api-key': self.api_key,
-                'Accept': 'application/json'
-            }
-            
-            # Optional: add language parameter if provided
-            data = {
-                "model_id": "scribe_v1"
-            }
-            if language:
-                data['language'] = language
+            files, data, upload = self._build_request(audio, sample_rate, language)
             
             # Make API request
-            logger.debug(f"Sending audio to ElevenLabs ({len(wav_bytes)} bytes)")
-            response = requests.post(
-                self.endpoint,
-                headers=headers,
-                files=files,
-                data=data,
-                timeout=30.0  # 30 second timeout
+            logger.debug(
+                f"Sending audio to ElevenLabs ({upload['upload_bytes']} bytes {upload['codec']}, "
+                f"encoded in {upload['encode_ms']:.1f} ms)"
             )
-            
-            # Check response status
-            response.raise_for_status()
-            logger.debug(f"ElevenLabs response: {response.status_code}")
+            start = time.perf_counter()
+            try:
+                response = self.session.post(
+                    self.endpoint,
+                    files=files,
+                    data=data,
+                    timeout=self.timeout
+                )
+                
+                # Check response status
+                response.raise_for_status()
+            except HTTP_ERRORS:
+                self._record_request(time.perf_counter() - start, ok=False, upload=upload)
+                raise
+            latency = time.perf_counter() - start
+            self._record_request(latency, ok=True, upload=upload)
+            logger.debug(f"ElevenLabs response: {response.status_code} in {latency * 1000:.0f} ms")
             
             # Parse JSON response
-            result = response.json()
-            
-            # Extract transcription text (try common response keys)
-            text = None
-            if isinstance(result, dict):
-                text = result.get('text') or result.get('transcript') or result.get('transcription')
-            elif isinstance(result, str):
-                text = result
-            
-            if text:
-                text = str(text).strip()
-                logger.debug(f"Transcribed: {text}")
-                return text if text else "[NO_SPEECH]"
-            else:
-                logger.warning(f"Unexpected API response format: {result}")
-                return "[TRANSCRIPTION_ERROR]"
+            return self._extract_text(response.json())
             
-        except requests.exceptions.RequestException as e:
-            logger.error(f"ElevenLabs API request failed: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_detail = e.response.json()
-                    logger.error(f"API error details: {error_detail}")
-                except:
-                    logger.error(f"API error response: {e.response.text}")
+        except HTTP_ERRORS as e:
+            self._log_http_error(e)
             return "[TRANSCRIPTION_ERROR]"
         except Exception as e:
             logger.error(f"Transcription error: {e}", exc_info=True)
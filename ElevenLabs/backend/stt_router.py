@@ -0,0 +1,316 @@
+"""
+Speech-to-Text backend registry and latency-aware router
+Every backend exposes the same interface:
+    transcribe(audio) -> str                      (blocking)
+    await transcribe_async(audio, timeout=...) -> str
+    warm_up(), get_stats() -> dict, await aclose()
+(plus await warm_up_async() where the async path has its own client to warm)
+and returns "[NO_SPEECH]" / "[TRANSCRIPTION_ERROR]" instead of raising.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Optional, Union
+import numpy as np
+from config import STT_ROUTER_BACKENDS, STT_BREAKER_FAILURES, STT_BREAKER_COOLDOWN, STT_ATTEMPT_SHARE
+from audio_frame import AudioFrame
+
+logger = logging.getLogger(__name__)
+
+ERROR_RESULT = "[TRANSCRIPTION_ERROR]"
+
+
+def _elevenlabs():
+    from stt_elevenlabs import ElevenLabsSTT
+    return ElevenLabsSTT()
+
+
+def _whisper():
+    # faster-whisper is optional and slow to import
+    from stt_whisper import WhisperSTT
+    return WhisperSTT()
+
+
+def _whisper_cpp():
+    from whisper_local import WhisperLocal
+    return WhisperLocal()
+
+
+STT_BACKENDS = {
+    "elevenlabs": _elevenlabs,
+    "whisper": _whisper,
+    "whisper_cpp": _whisper_cpp,
+}
+
+
+def create_stt(name: str):
+    """
+    Build a segment STT backend by name ("router" builds an STTRouter)
+    Unknown names fall back to elevenlabs.
+    """
+    if name == "router":
+        return STTRouter()
+    factory = STT_BACKENDS.get(name)
+    if factory is None:
+        logger.warning(f"Unknown STT backend '{name}', using elevenlabs")
+        factory = _elevenlabs
+    return factory()
+
+
+class BackendTracker:
+    """
+    Rolling latency model and circuit breaker for one backend
+    Latency is fitted as intercept + slope * segment_seconds over recent attempts
+    (network round trip vs real-time factor); failed and timed-out attempts count
+    at least the rolling p95, so failing never makes a backend look faster. After `failure_threshold` consecutive
+    failures the breaker opens for `cooldown` seconds, then lets one trial through.
+    """
+
+    MIN_FIT_SAMPLES = 3
+
+    def __init__(self, name: str, failure_threshold: int = STT_BREAKER_FAILURES,
+                 cooldown: float = STT_BREAKER_COOLDOWN, window: int = 100):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._samples: deque = deque(maxlen=window)  # (segment_seconds, latency_seconds)
+
+        self.in_flight = 0
+        self.routed = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.time() - self.opened_at >= self.cooldown else "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._trial_in_flight)
+
+    def begin(self):
+        self.in_flight += 1
+        self.routed += 1
+        if self.state == "half-open":
+            self._trial_in_flight = True
+
+    def record(self, segment_seconds: float, latency: float, ok: bool):
+        self.in_flight -= 1
+        self._trial_in_flight = False
+        if not ok and self._samples:
+            # A timeout only bounds the latency from below, and a fast error still costs a fallback
+            latency = max(latency, self.percentiles()[1])
+        self._samples.append((segment_seconds, latency))
+        if ok:
+            self.consecutive_failures = 0
+            if self.opened_at is not None:
+                logger.info(f"STT backend '{self.name}' recovered, closing breaker")
+            self.opened_at = None
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(
+                    f"STT backend '{self.name}' failed {self.consecutive_failures} times, "
+                    f"opening breaker for {self.cooldown:.0f}s"
+                )
+            self.opened_at = time.time()  # A failed trial re-opens it for another cooldown
+
+    def fit(self) -> Optional[tuple[float, float]]:
+        """(intercept, slope) of latency vs segment length, or None without data"""
+        if not self._samples:
+            return None
+        samples = np.array(self._samples)
+        seconds, latency = samples[:, 0], samples[:, 1]
+        if len(samples) >= self.MIN_FIT_SAMPLES and np.ptp(seconds) > 0.5:
+            slope, intercept = np.polyfit(seconds, latency, 1)
+            if slope >= 0:
+                return float(intercept), float(slope)
+        return float(np.median(latency)), 0.0
+
+    def percentiles(self) -> tuple[float, float]:
+        """Rolling (p50, p95) latency in seconds"""
+        latency = np.array([lat for _, lat in self._samples])
+        return float(np.percentile(latency, 50)), float(np.percentile(latency, 95))
+
+    def expected_latency(self, segment_seconds: float, concurrency: int) -> float:
+        """Predicted p95-ish latency for a segment, including queueing behind in-flight requests"""
+        fit = self.fit()
+        if fit is None:
+            return 0.0  # Unmeasured backends get tried first so they can be measured
+        intercept, slope = fit
+        samples = np.array(self._samples)
+        residuals = samples[:, 1] - (intercept + slope * samples[:, 0])
+        predicted = max(0.0, intercept + slope * segment_seconds)
+        # Tail allowance: how far above the fit the slow requests land
+        tail = max(0.0, float(np.percentile(residuals, 95)))
+        # Requests already in flight beyond the backend's concurrency wait their turn
+        queued = max(0, self.in_flight + 1 - concurrency)
+        return predicted + tail + queued * self.percentiles()[0]
+
+    def get_stats(self) -> dict:
+        stats = {
+            "routed": self.routed,
+            "failures": self.failures,
+            "breaker": self.state,
+            "in_flight": self.in_flight,
+        }
+        fit = self.fit()
+        if fit is not None:
+            p50, p95 = self.percentiles()
+            stats.update(latency_p50_ms=p50 * 1000.0, latency_p95_ms=p95 * 1000.0,
+                         fit_intercept_ms=fit[0] * 1000.0, fit_ms_per_second=fit[1] * 1000.0)
+        return stats
+
+
+class STTRouter:
+    """
+    Routes each segment to the backend with the lowest expected latency
+    Backends are ranked by BackendTracker.expected_latency for the segment's
+    length; ones with an open breaker are skipped, and a backend left unpicked
+    for EXPLORE_EVERY segments is tried once so its estimate stays current. A failure (error result or
+    missed deadline) falls through to the next backend while time remains, and
+    the configured order breaks ties, so listing the local backend first makes
+    it the fallback when the cloud API is down. While a fallback is left, an
+    attempt gets at most attempt_share of the remaining deadline (and at most
+    twice its predicted latency), so the fallback still has time to answer.
+    """
+
+    EXPLORE_EVERY = 20  # Re-measure a backend that has not been picked in this many segments
+
+    def __init__(self, backend_names: str = STT_ROUTER_BACKENDS, attempt_share: float = STT_ATTEMPT_SHARE):
+        self.attempt_share = min(max(attempt_share, 0.1), 1.0)
+        self.backends: dict = {}
+        for name in [n.strip() for n in backend_names.split(",") if n.strip()]:
+            try:
+                self.backends[name] = STT_BACKENDS[name]()
+            except Exception as e:
+                logger.warning(f"STT router: backend '{name}' unavailable ({e})")
+        if not self.backends:
+            raise RuntimeError(f"STT router has no usable backends (from '{backend_names}')")
+        self.trackers = {name: BackendTracker(name) for name in self.backends}
+        self.decisions = 0
+        self._last_picked = {name: 0 for name in self.backends}
+        logger.info(f"STT router backends: {', '.join(self.backends)}")
+
+    @staticmethod
+    def _concurrency(backend) -> int:
+        return int(getattr(backend, "num_workers", None) or getattr(backend, "pool_size", None) or 1)
+
+    def rank(self, segment_seconds: float) -> list[str]:
+        """Backend names in routing order for a segment (breaker-open ones last)"""
+        order = list(self.backends)
+
+        def key(name):
+            tracker = self.trackers[name]
+            if self.decisions - self._last_picked[name] >= self.EXPLORE_EVERY:
+                expected = 0.0  # Its latency model is stale; take one sample
+            else:
+                expected = tracker.expected_latency(segment_seconds, self._concurrency(self.backends[name]))
+            return (not tracker.available(), expected, order.index(name))
+
+        return sorted(order, key=key)
+
+    def _route(self, segment_seconds: float) -> list[str]:
+        self.decisions += 1
+        ranked = self.rank(segment_seconds)
+        self._last_picked[ranked[0]] = self.decisions
+        return ranked
+
+    def _attempt_timeout(self, name: str, segment_seconds: float, remaining: Optional[float],
+                         has_fallback: bool) -> Optional[float]:
+        """Time one attempt may take, keeping the rest of the deadline for the fallback"""
+        if remaining is None or not has_fallback:
+            return remaining
+        budget = remaining * self.attempt_share
+        expected = self.trackers[name].expected_latency(segment_seconds, self._concurrency(self.backends[name]))
+        if expected > 0:
+            budget = min(budget, 2.0 * expected)
+        return budget
+
+    async def transcribe_async(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = 16000,
+                               timeout: Optional[float] = None) -> str:
+        samples, sample_rate = AudioFrame.unwrap(audio, sample_rate)
+        segment_seconds = len(samples) / sample_rate
+        deadline = None if timeout is None else time.time() + timeout
+
+        ranked = self._route(segment_seconds)
+        for position, name in enumerate(ranked):
+            tracker = self.trackers[name]
+            if not tracker.available():
+                continue
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                break
+            has_fallback = any(self.trackers[n].available() for n in ranked[position + 1:])
+            attempt_timeout = self._attempt_timeout(name, segment_seconds, remaining, has_fallback)
+            tracker.begin()
+            start = time.perf_counter()
+            text = ERROR_RESULT
+            try:
+                text = await self.backends[name].transcribe_async(audio, timeout=attempt_timeout)
+            finally:
+                tracker.record(segment_seconds, time.perf_counter() - start, ok=text != ERROR_RESULT)
+            if text != ERROR_RESULT:
+                return text
+            logger.warning(f"STT backend '{name}' failed, trying the next one")
+        return ERROR_RESULT
+
+    def transcribe(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = 16000) -> str:
+        samples, sample_rate = AudioFrame.unwrap(audio, sample_rate)
+        segment_seconds = len(samples) / sample_rate
+        for name in self._route(segment_seconds):
+            tracker = self.trackers[name]
+            if not tracker.available():
+                continue
+            tracker.begin()
+            start = time.perf_counter()
+            text = ERROR_RESULT
+            try:
+                text = self.backends[name].transcribe(audio)
+            finally:
+                tracker.record(segment_seconds, time.perf_counter() - start, ok=text != ERROR_RESULT)
+            if text != ERROR_RESULT:
+                return text
+        return ERROR_RESULT
+
+    def warm_up(self):
+        """Warm every backend; one failing does not stop the others"""
+        for name, backend in self.backends.items():
+            try:
+                backend.warm_up()
+            except Exception as e:
+                logger.error(f"STT backend '{name}' warm-up failed: {e}")
+
+    async def warm_up_async(self):
+        """Warm every backend for transcribe_async, concurrently"""
+        async def warm(name, backend):
+            try:
+                if hasattr(backend, "warm_up_async"):
+                    await backend.warm_up_async()
+                else:
+                    await asyncio.to_thread(backend.warm_up)
+            except Exception as e:
+                logger.error(f"STT backend '{name}' warm-up failed: {e}")
+
+        await asyncio.gather(*(warm(name, backend) for name, backend in self.backends.items()))
+
+    def get_stats(self) -> dict:
+        """Return totals plus per-backend routing, breaker and latency-model stats"""
+        backends = {name: tracker.get_stats() for name, tracker in self.trackers.items()}
+        return {
+            "requests": sum(b["routed"] for b in backends.values()),
+            "errors": sum(b["failures"] for b in backends.values()),
+            "backends": backends,
+        }
+
+    async def aclose(self):
+        for backend in self.backends.values():
+            await backend.aclose()
@@ -0,0 +1,232 @@
+"""
+Scheduling of speech segments onto the STT backend
+Bounds the work handed to STT, drops captions that would arrive too late to be
+useful, and emits results in capture order per direction.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+import numpy as np
+from config import STT_CONCURRENCY, STT_MAX_QUEUE, STT_DEADLINE_SECONDS
+from audio_frame import AudioFrame
+from vad import SegmentInfo
+from transcript_stitch import stitch_overlap
+
+logger = logging.getLogger(__name__)
+
+NON_TEXT_RESULTS = ("[NO_SPEECH]", "[TRANSCRIPTION_ERROR]")
+
+
+@dataclass
+class STTJob:
+    """One speech segment waiting for (or undergoing) transcription"""
+    segment: AudioFrame
+    info: Optional[SegmentInfo]
+    direction: int
+    confidence: float
+    deadline: float                      # Wall-clock time after which the caption is stale
+    previous: Optional["STTJob"]         # Earlier job in the same direction (emission order)
+    done: asyncio.Future = field(repr=False, default=None)  # Resolves to the raw transcript ("" if none)
+
+    @property
+    def end_time(self) -> float:
+        return self.segment.timestamp + self.segment.duration
+
+
+class STTScheduler:
+    """
+    Bounded, deadline-aware STT work queue
+    - At most max_queue segments wait; when full the oldest waiting one is dropped
+    - At most `concurrency` transcriptions are in flight
+    - A segment whose deadline (speech end + deadline_seconds) passes is dropped,
+      before the request if possible, otherwise before its caption is emitted
+    - Captions for the same direction are emitted in capture order; parts of a
+      split utterance have their overlapping words stitched out
+    """
+
+    def __init__(self,
+                 transcribe: Callable[..., Awaitable[str]],
+                 emit: Callable[[str, int, float], Awaitable[None]],
+                 concurrency: int = STT_CONCURRENCY,
+                 max_queue: int = STT_MAX_QUEUE,
+                 deadline_seconds: float = STT_DEADLINE_SECONDS):
+        """
+        Args:
+            transcribe: async (segment, timeout=seconds) -> text
+            emit: async (text, direction, confidence) called for each caption, in order
+            concurrency: Maximum transcriptions in flight
+            max_queue: Maximum segments waiting to start
+            deadline_seconds: Age (after the segment ends) at which a caption is dropped
+        """
+        self.transcribe = transcribe
+        self.emit = emit
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(1, max_queue)
+        self.deadline_seconds = deadline_seconds
+
+        self.pending: deque[STTJob] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: list[asyncio.Task] = []
+        self._last_job: dict[int, STTJob] = {}           # Tail of each direction's emission chain
+        self._utterance_direction: dict[int, tuple[int, float]] = {}
+
+        self.in_flight = 0
+        self.submitted = 0
+        self.emitted = 0
+        self.dropped_overflow = 0
+        self.dropped_stale = 0
+        self.queue_high_water = 0
+        self._caption_lag: deque = deque(maxlen=200)  # Speech end -> caption emitted (seconds)
+
+    def start(self):
+        """Start worker tasks on the running loop"""
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """Cancel workers and release anything still queued"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        while self.pending:
+            self._release(self.pending.popleft(), "")
+
+    def submit(self, segment: AudioFrame, info: Optional[SegmentInfo], direction: int, confidence: float):
+        """
+        Queue a segment (must be called on the loop thread, e.g. via call_soon_threadsafe)
+        Later parts of a split utterance keep the direction of its first part.
+        """
+        if info is not None:
+            if info.part > 0 and info.utterance_id in self._utterance_direction:
+                direction, confidence = self._utterance_direction[info.utterance_id]
+            if info.is_last:
+                self._utterance_direction.pop(info.utterance_id, None)
+            else:
+                self._utterance_direction[info.utterance_id] = (direction, confidence)
+
+        job = STTJob(
+            segment=segment,
+            info=info,
+            direction=direction,
+            confidence=confidence,
+            deadline=segment.timestamp + segment.duration + self.deadline_seconds,
+            previous=self._last_job.get(direction),
+            done=asyncio.get_running_loop().create_future(),
+        )
+        self._last_job[direction] = job
+        self.submitted += 1
+
+        if len(self.pending) >= self.max_queue:
+            dropped = self.pending.popleft()
+            self.dropped_overflow += 1
+            logger.warning(
+                f"STT queue full ({self.max_queue}), dropping segment from "
+                f"{time.time() - dropped.end_time:.1f}s ago"
+            )
+            self._release(dropped, "")
+        self.pending.append(job)
+        self.queue_high_water = max(self.queue_high_water, len(self.pending))
+        self._wakeup.set()
+
+    async def _worker(self):
+        while True:
+            while not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            job = self.pending.popleft()
+            self.in_flight += 1
+            try:
+                await self._run(job)
+            finally:
+                self.in_flight -= 1
+
+    async def _run(self, job: STTJob):
+        raw_text = ""
+        try:
+            remaining = job.deadline - time.time()
+            if remaining <= 0:
+                self._drop_stale(job, "before transcription")
+                return
+
+            text = await self.transcribe(job.segment, timeout=remaining)
+            if text not in NON_TEXT_RESULTS:
+                raw_text = text
+            logger.info(f"Caption: {text}")
+
+            # Earlier captions in this direction go first
+            previous_text = await job.previous.done if job.previous is not None else ""
+            if not raw_text:
+                return
+
+            if time.time() > job.deadline:
+                self._drop_stale(job, "after transcription")
+                return
+
+            info = job.info
+            if (previous_text and info is not None and info.part > 0 and info.overlap_seconds > 0
+                    and self._is_previous_part(job)):
+                text = stitch_overlap(previous_text, text)
+            if not text:
+                return
+
+            await self.emit(text, job.direction, job.confidence)
+            self.emitted += 1
+            self._caption_lag.append(time.time() - job.end_time)
+        except Exception as e:
+            logger.error(f"Error processing speech segment: {e}")
+        finally:
+            self._release(job, raw_text)
+
+    @staticmethod
+    def _is_previous_part(job: STTJob) -> bool:
+        previous = job.previous
+        return (previous is not None and previous.info is not None
+                and previous.info.utterance_id == job.info.utterance_id
+                and previous.info.part == job.info.part - 1)
+
+    def _drop_stale(self, job: STTJob, stage: str):
+        self.dropped_stale += 1
+        logger.warning(
+            f"Dropping stale caption {stage} "
+            f"({time.time() - job.end_time:.1f}s after speech, deadline {self.deadline_seconds:.1f}s)"
+        )
+
+    def _release(self, job: STTJob, raw_text: str):
+        """
+        Mark a job finished once everything before it in its direction is finished
+        so a dropped job never lets a later caption overtake an earlier one
+        """
+        previous = job.previous
+        if previous is not None and not previous.done.done():
+            previous.done.add_done_callback(lambda _: self._finish(job, raw_text))
+        else:
+            self._finish(job, raw_text)
+
+    def _finish(self, job: STTJob, raw_text: str):
+        if not job.done.done():
+            job.done.set_result(raw_text)
+        job.previous = None  # Let finished chains be garbage collected
+        if self._last_job.get(job.direction) is job:
+            del self._last_job[job.direction]
+
+    def get_stats(self) -> dict:
+        """Return queue depth, throughput and drop counters, plus caption lag percentiles (ms)"""
+        stats = {
+            "queue_depth": len(self.pending),
+            "queue_high_water": self.queue_high_water,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "emitted": self.emitted,
+            "dropped_overflow": self.dropped_overflow,
+            "dropped_stale": self.dropped_stale,
+        }
+        if self._caption_lag:
+            lag = np.array(self._caption_lag) * 1000.0
+            stats["caption_lag_p50_ms"] = float(np.percentile(lag, 50))
+            stats["caption_lag_p95_ms"] = float(np.percentile(lag, 95))
+        return stats
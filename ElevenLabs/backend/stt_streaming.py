@@ -0,0 +1,337 @@
+"""
+Streaming Speech-to-Text
+Audio is pushed to the backend while someone is still talking; partial hypotheses
+are emitted as interim captions (isFinal=false) that the final caption, sharing
+the same caption id, replaces.
+"""
+
+import abc
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+import numpy as np
+from config import (
+    STT_PARTIAL_INTERVAL_MS,
+    STT_DEADLINE_SECONDS,
+    ELEVENLABS_REALTIME_URL,
+    ELEVENLABS_REALTIME_MODEL,
+)
+from audio_encoders import to_pcm16
+
+logger = logging.getLogger(__name__)
+
+PartialCallback = Callable[[str], Awaitable[None]]
+
+
+class StreamingSTT(abc.ABC):
+    """
+    Interface for streaming STT backends
+    One utterance is open at a time: start_utterance(), any number of
+    send_audio() calls, then end_utterance() which returns the final text.
+    Partial hypotheses are delivered through the on_partial callback.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def start_utterance(self, sample_rate: int, on_partial: PartialCallback):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def send_audio(self, samples: np.ndarray):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def end_utterance(self) -> str:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class ElevenLabsRealtimeSTT(StreamingSTT):
+    """
+    ElevenLabs realtime STT over a persistent websocket (requires the websockets package)
+    Audio goes up as base64 16-bit PCM chunks; each utterance is closed with a commit.
+    Server messages used: partial_transcript and committed_transcript. The
+    connection is reused across utterances and reopened if it drops.
+    """
+
+    name = "elevenlabs"
+
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 url: str = ELEVENLABS_REALTIME_URL,
+                 model_id: str = ELEVENLABS_REALTIME_MODEL):
+        import websockets
+
+        self.websockets = websockets
+        self.api_key = api_key or os.getenv("ELEVENLABS_API_KEY", "")
+        self.url = url
+        self.model_id = model_id
+        self.sample_rate: Optional[int] = None
+
+        self._ws = None
+        self._receiver: Optional[asyncio.Task] = None
+        self._on_partial: Optional[PartialCallback] = None
+        self._final: Optional[asyncio.Future] = None
+        self._commits_outstanding = 0  # Commits whose transcript has not arrived yet
+
+    async def _connect(self, sample_rate: int):
+        url = f"{self.url}?model_id={self.model_id}&audio_format=pcm_{sample_rate}"
+        headers = {"xi-api-key": self.api_key} if self.api_key else {}
+        try:
+            self._ws = await self.websockets.connect(url, additional_headers=headers)
+        except TypeError:
+            # websockets < 14 names the argument extra_headers
+            self._ws = await self.websockets.connect(url, extra_headers=headers)
+        self.sample_rate = sample_rate
+        self._commits_outstanding = 0
+        self._receiver = asyncio.create_task(self._receive_loop())
+        logger.info(f"Realtime STT connected ({self.url})")
+
+    async def _receive_loop(self):
+        try:
+            async for raw in self._ws:
+                message = json.loads(raw)
+                message_type = message.get("message_type", "")
+                text = (message.get("text") or "").strip()
+                if message_type == "partial_transcript":
+                    if text and self._on_partial is not None:
+                        await self._on_partial(text)
+                elif message_type.startswith("committed_transcript"):
+                    # Ignore the late result of an utterance that already timed out
+                    self._commits_outstanding = max(0, self._commits_outstanding - 1)
+                    if self._commits_outstanding == 0 and self._final is not None and not self._final.done():
+                        self._final.set_result(text)
+                elif "error" in message_type:
+                    logger.error(f"Realtime STT error: {message}")
+                    if self._final is not None and not self._final.done():
+                        self._final.set_exception(RuntimeError(message.get("error", message_type)))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Realtime STT connection lost: {e}")
+        finally:
+            self._ws = None
+            if self._final is not None and not self._final.done():
+                self._final.set_exception(ConnectionError("realtime STT connection closed"))
+
+    async def start_utterance(self, sample_rate: int, on_partial: PartialCallback):
+        if self._ws is None or sample_rate != self.sample_rate:
+            await self.close()
+            await self._connect(sample_rate)
+        self._on_partial = on_partial
+        self._final = asyncio.get_running_loop().create_future()
+
+    async def _send_chunk(self, pcm: bytes, commit: bool):
+        await self._ws.send(json.dumps({
+            "message_type": "input_audio_chunk",
+            "audio_base_64": base64.b64encode(pcm).decode("ascii"),
+            "commit": commit,
+            "sample_rate": self.sample_rate,
+        }))
+
+    async def send_audio(self, samples: np.ndarray):
+        if self._ws is None:
+            raise ConnectionError("realtime STT not connected")
+        await self._send_chunk(to_pcm16(samples).tobytes(), commit=False)
+
+    async def end_utterance(self) -> str:
+        if self._ws is None:
+            raise ConnectionError("realtime STT not connected")
+        await self._send_chunk(b"", commit=True)
+        self._commits_outstanding += 1
+        try:
+            return await self._final
+        finally:
+            self._on_partial = None
+
+    async def close(self):
+        ws, self._ws = self._ws, None
+        if self._receiver is not None:
+            self._receiver.cancel()
+            await asyncio.gather(self._receiver, return_exceptions=True)
+            self._receiver = None
+        if ws is not None:
+            await ws.close()
+
+
+def _whisper_streaming_stt(segment_stt=None) -> StreamingSTT:
+    # Imported on demand: faster-whisper is optional and slow to import
+    from stt_whisper import WhisperSTT, WhisperStreamingSTT
+    if hasattr(segment_stt, "backends"):
+        segment_stt = segment_stt.backends.get("whisper")  # STTRouter: share its local Whisper
+    return WhisperStreamingSTT(segment_stt if isinstance(segment_stt, WhisperSTT) else None)
+
+
+STREAMING_BACKENDS = {
+    ElevenLabsRealtimeSTT.name: lambda segment_stt=None: ElevenLabsRealtimeSTT(),
+    "whisper": _whisper_streaming_stt,
+}
+
+
+def create_streaming_stt(name: str, segment_stt=None) -> Optional[StreamingSTT]:
+    """
+    Build a streaming STT backend by name
+    Returns None (segment-based STT only) if streaming is off, unknown or unavailable.
+    A local segment backend (e.g. a loaded WhisperSTT) is shared rather than loaded twice.
+    """
+    if name in ("", "off", "0", "none"):
+        return None
+    factory = STREAMING_BACKENDS.get(name)
+    if factory is None:
+        logger.warning(f"Unknown streaming STT backend '{name}', streaming disabled")
+        return None
+    try:
+        return factory(segment_stt)
+    except Exception as e:
+        logger.warning(f"Streaming STT backend '{name}' unavailable ({e}), streaming disabled")
+        return None
+
+
+class StreamingCaptioner:
+    """
+    Drives a StreamingSTT backend from VAD output and emits interim/final captions
+    Audio is handed over from the audio thread with push() and forwarded by a single
+    task, so backend calls for one utterance stay in order. Interim captions are
+    rate-limited to one per partial_interval_ms and skipped when the text is unchanged.
+    """
+
+    def __init__(self,
+                 backend: StreamingSTT,
+                 emit: Callable[..., Awaitable[None]],
+                 sample_rate: int,
+                 partial_interval_ms: int = STT_PARTIAL_INTERVAL_MS,
+                 deadline_seconds: float = STT_DEADLINE_SECONDS):
+        """
+        Args:
+            backend: Streaming STT backend
+            emit: async (text, caption_id, is_final, direction, confidence)
+            sample_rate: Sample rate of pushed audio
+            partial_interval_ms: Minimum spacing between interim captions
+            deadline_seconds: Time allowed for the final result after speech ends
+        """
+        self.backend = backend
+        self.emit = emit
+        self.sample_rate = sample_rate
+        self.partial_interval = partial_interval_ms / 1000.0
+        self.deadline_seconds = deadline_seconds
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Current utterance
+        self._utterance_id: Optional[int] = None
+        self._active = False
+        self._caption_id = ""
+        self._direction = 0
+        self._confidence = 0.0
+        self._started_at = 0.0
+        self._last_partial = ""
+        self._last_partial_time = 0.0
+
+        self.utterances = 0
+        self.partials_emitted = 0
+        self.finals_emitted = 0
+        self.failures = 0
+        self._first_partial_latency: deque = deque(maxlen=200)  # Speech start -> first interim caption
+        self._final_latency: deque = deque(maxlen=200)          # Speech end -> final caption
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    def start(self):
+        """Start the forwarding task on the running loop"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.backend.close()
+
+    def push(self, utterance_id: int, samples: np.ndarray, ended: bool, direction: int, confidence: float):
+        """Queue utterance audio (call on the loop thread; samples must not be reused by the caller)"""
+        self._queue.put_nowait((utterance_id, samples, ended, direction, confidence, time.time()))
+
+    async def _run(self):
+        while True:
+            utterance_id, samples, ended, direction, confidence, pushed_at = await self._queue.get()
+            try:
+                if utterance_id != self._utterance_id:
+                    if self._active:
+                        await self._end(pushed_at)
+                    await self._begin(utterance_id, direction, confidence)
+                if not self._active:
+                    continue
+                if len(samples):
+                    await self.backend.send_audio(samples)
+                if ended:
+                    await self._end(pushed_at)
+            except Exception as e:
+                self.failures += 1
+                self._active = False
+                logger.error(f"Streaming STT error: {e}")
+
+    async def _begin(self, utterance_id: int, direction: int, confidence: float):
+        self._utterance_id = utterance_id
+        self._caption_id = f"utt-{utterance_id}"
+        self._direction = direction
+        self._confidence = confidence
+        self._started_at = time.time()
+        self._last_partial = ""
+        self._last_partial_time = 0.0
+        self.utterances += 1
+        self._active = False
+        await self.backend.start_utterance(self.sample_rate, self._on_partial)
+        self._active = True
+
+    async def _on_partial(self, text: str):
+        now = time.time()
+        if not self._active or text == self._last_partial or now - self._last_partial_time < self.partial_interval:
+            return
+        if not self._last_partial:
+            self._first_partial_latency.append(now - self._started_at)
+        self._last_partial = text
+        self._last_partial_time = now
+        self.partials_emitted += 1
+        await self.emit(text, self._caption_id, False, self._direction, self._confidence)
+
+    async def _end(self, ended_at: float):
+        self._active = False
+        try:
+            text = await asyncio.wait_for(self.backend.end_utterance(), self.deadline_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(f"Streaming STT final result missed its {self.deadline_seconds:.1f}s deadline")
+            self.failures += 1
+            text = self._last_partial  # Settle on the last interim caption rather than leave it dangling
+        if text:
+            await self.emit(text, self._caption_id, True, self._direction, self._confidence)
+            self.finals_emitted += 1
+            self._final_latency.append(time.time() - ended_at)
+            logger.info(f"Caption: {text}")
+
+    def get_stats(self) -> dict:
+        """Return utterance/caption counts and interim/final latency percentiles (ms)"""
+        stats = {
+            "utterances": self.utterances,
+            "partials": self.partials_emitted,
+            "finals": self.finals_emitted,
+            "failures": self.failures,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+        for key, values in (("first_partial", self._first_partial_latency), ("final", self._final_latency)):
+            if values:
+                ms = np.array(values) * 1000.0
+                stats[f"{key}_p50_ms"] = float(np.percentile(ms, 50))
+                stats[f"{key}_p95_ms"] = float(np.percentile(ms, 95))
+        return stats
@@ -2,48 +2,260 @@
 Speech-to-Text using faster-whisper
 """
 
+import asyncio
 import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import Optional
+from typing import Optional, Union
 from faster_whisper import WhisperModel
-from config import WHISPER_MODEL, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE
+from faster_whisper.version import __version__ as FASTER_WHISPER_VERSION
+try:
+    from faster_whisper import BatchedInferencePipeline
+except ImportError:  # faster-whisper < 1.1
+    BatchedInferencePipeline = None
+from config import (
+    WHISPER_MODEL,
+    WHISPER_DEVICE,
+    WHISPER_COMPUTE_TYPE,
+    WHISPER_CPU_THREADS,
+    WHISPER_NUM_WORKERS,
+    WHISPER_WARMUP,
+    WHISPER_TIER,
+    WHISPER_VAD_FILTER,
+    WHISPER_BATCH_SIZE,
+    WHISPER_BATCH_WINDOW_MS,
+    WHISPER_STREAM_STEP_MS,
+    WHISPER_STREAM_BUFFER_SECONDS,
+)
+from audio_frame import AudioFrame
+from stt_streaming import StreamingSTT, PartialCallback
+from vad import SegmentBuffer
 
 logger = logging.getLogger(__name__)
 
+# Decoding settings per latency tier
+WHISPER_TIERS = {
+    "fast": {"beam_size": 1, "best_of": 1},     # Greedy
+    "accurate": {"beam_size": 5},
+}
+
+# Longest clip the batched pipeline decodes in one window
+MAX_CLIP_SECONDS = 30.0
+
+# faster-whisper 1.2+ takes clip_timestamps in seconds; 1.1 slices the audio by sample offsets
+CLIP_TIMESTAMPS_IN_SECONDS = tuple(int(p) for p in FASTER_WHISPER_VERSION.split(".")[:2]) >= (1, 2)
+
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def layout_batch(audios: list[np.ndarray], sample_rate: int = 16000,
+                 in_seconds: bool = CLIP_TIMESTAMPS_IN_SECONDS) -> tuple[np.ndarray, list[dict], np.ndarray]:
+    """
+    Lay segments out for one batched decode
+    Each segment starts its own MAX_CLIP_SECONDS slot of a zero-padded buffer and
+    its clip spans the whole slot, so two clips never fit in one decode window
+    and the pipeline cannot merge them.
+
+    Args:
+        audios: Segments, each at most MAX_CLIP_SECONDS long
+        sample_rate: Sample rate in Hz
+        in_seconds: Give clip bounds in seconds instead of integer sample offsets
+
+    Returns:
+        (buffer, clip_timestamps, slot start times in seconds for mapping segments back)
+    """
+    slot = int(MAX_CLIP_SECONDS * sample_rate)
+    buffer = np.zeros(slot * len(audios), dtype=np.float32)
+    for i, audio in enumerate(audios):
+        buffer[i * slot:i * slot + len(audio)] = audio
+    offsets = [i * slot for i in range(len(audios) + 1)]
+    if in_seconds:
+        clips = [{"start": offsets[i] / sample_rate, "end": offsets[i + 1] / sample_rate} for i in range(len(audios))]
+    else:
+        clips = [{"start": offsets[i], "end": offsets[i + 1]} for i in range(len(audios))]
+    return buffer, clips, np.array(offsets, dtype=np.float64) / sample_rate
+
+
+def segment_index(bounds: np.ndarray, start: float, end: float) -> int:
+    """Index of the batched segment whose slot holds the midpoint of an output segment"""
+    index = int(np.searchsorted(bounds, (start + end) / 2, side="right")) - 1
+    return min(max(index, 0), len(bounds) - 2)
+
+
+def pool_size(cpu_threads: int = 0, num_workers: int = 0, cores: Optional[int] = None) -> tuple[int, int]:
+    """
+    Split the host's cores between CTranslate2 workers and threads per worker
+    Unset (0) values are derived so workers * threads ~= cores: a few workers of
+    ~4 threads each beats one worker using every core when segments overlap.
+
+    Returns:
+        (cpu_threads, num_workers)
+    """
+    cores = cores or _available_cores()
+    if num_workers <= 0:
+        num_workers = max(1, min(4, cores // max(1, cpu_threads or 4)))
+    if cpu_threads <= 0:
+        cpu_threads = max(1, cores // num_workers)
+    return cpu_threads, num_workers
+
 
 class WhisperSTT:
-    """Speech-to-text using faster-whisper"""
+    """
+    Speech-to-text using faster-whisper
+    One WhisperModel is shared by num_workers CTranslate2 workers (model replicas
+    that can decode in parallel), each using cpu_threads threads. Calls beyond
+    num_workers wait for a free worker instead of contending on the same one.
+    Segments arriving together through transcribe_async are micro-batched into
+    one batched decode (see WhisperBatcher).
+    """
     
     def __init__(self,
                  model_size: str = WHISPER_MODEL,
                  device: str = WHISPER_DEVICE,
-                 compute_type: str = WHISPER_COMPUTE_TYPE):
+                 compute_type: str = WHISPER_COMPUTE_TYPE,
+                 cpu_threads: int = WHISPER_CPU_THREADS,
+                 num_workers: int = WHISPER_NUM_WORKERS,
+                 tier: str = WHISPER_TIER,
+                 vad_filter: bool = WHISPER_VAD_FILTER,
+                 batch_size: int = WHISPER_BATCH_SIZE):
         self.model_size = model_size
         self.device = device
         self.compute_type = compute_type
+        self.cpu_threads, self.num_workers = pool_size(cpu_threads, num_workers)
+        if tier not in WHISPER_TIERS:
+            logger.warning(f"Unknown Whisper tier '{tier}', using accurate")
+            tier = "accurate"
+        self.tier = tier
+        self.decode_options = WHISPER_TIERS[tier]
+        self.vad_filter = vad_filter
         self.model: Optional[WhisperModel] = None
+        self.batched: Optional["BatchedInferencePipeline"] = None
+        self.batcher: Optional[WhisperBatcher] = WhisperBatcher(self, batch_size) if batch_size > 1 else None
+        
+        self._load_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.num_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="whisper")
+        
+        self._stats_lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=200)
+        self.requests = 0
+        self.errors = 0
+        self.busy = 0
+        self.batches = 0
+        self.batched_segments = 0
+        self.load_seconds: Optional[float] = None
         
     def initialize(self):
-        """Load Whisper model (lazy initialization)"""
-        if self.model is None:
+        """Load Whisper model (safe to call from several threads; loads once)"""
+        with self._load_lock:
+            if self.model is not None:
+                return
             try:
-                logger.info(f"Loading Whisper model: {self.model_size} ({self.device}, {self.compute_type})")
+                logger.info(
+                    f"Loading Whisper model: {self.model_size} ({self.device}, {self.compute_type}, "
+                    f"{self.num_workers} workers x {self.cpu_threads} threads)"
+                )
+                start = time.perf_counter()
                 self.model = WhisperModel(
                     self.model_size,
                     device=self.device,
-                    compute_type=self.compute_type
+                    compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads,
+                    num_workers=self.num_workers
                 )
-                logger.info("Whisper model loaded successfully")
+                if self.batcher is not None and BatchedInferencePipeline is not None:
+                    self.batched = BatchedInferencePipeline(model=self.model)
+                self.load_seconds = time.perf_counter() - start
+                logger.info(f"Whisper model loaded successfully ({self.load_seconds:.1f}s)")
             except Exception as e:
                 logger.error(f"Failed to load Whisper model: {e}")
                 raise
+
+    def warm_up(self, enabled: bool = WHISPER_WARMUP):
+        """
+        Load the model and run one dummy inference per worker
+        The first decode on each worker allocates its buffers, so doing it here
+        keeps that cost off the first real caption.
+        """
+        self.initialize()
+        if not enabled:
+            return
+        start = time.perf_counter()
+        silence = np.zeros(16000, dtype=np.float32)
+
+        def dummy(_):
+            with self._slots:
+                segments, _ = self.model.transcribe(silence, beam_size=1, language="en", vad_filter=False)
+                list(segments)
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            list(pool.map(dummy, range(self.num_workers)))
+        logger.info(f"Whisper warm-up done in {time.perf_counter() - start:.1f}s")
+
+    async def transcribe_async(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = 16000,
+                               timeout: Optional[float] = None) -> str:
+        """
+        Transcribe on the model's own worker threads
+        On timeout the caller stops waiting; the decode itself cannot be interrupted.
+        """
+        if self.batcher is not None:
+            audio, sample_rate = AudioFrame.unwrap(audio, sample_rate)
+            future = self.batcher.submit(audio)
+        else:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.transcribe, audio, sample_rate)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Whisper transcription missed its {timeout:.1f}s deadline")
+            return "[TRANSCRIPTION_ERROR]"
+
+    def get_stats(self) -> dict:
+        """Return request counts, worker utilisation and rolling latency percentiles (ms)"""
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000.0
+            stats = {
+                "requests": self.requests,
+                "errors": self.errors,
+                "workers": self.num_workers,
+                "cpu_threads": self.cpu_threads,
+                "busy": self.busy,
+                "tier": self.tier,
+                "batches": self.batches,
+                "avg_batch_size": self.batched_segments / self.batches if self.batches else 0.0,
+            }
+        if len(latencies):
+            stats["latency_p50_ms"] = float(np.percentile(latencies, 50))
+            stats["latency_p95_ms"] = float(np.percentile(latencies, 95))
+        return stats
+
+    async def aclose(self):
+        """Stop the worker threads"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, latency: float, ok: bool, segments: int = 1):
+        with self._stats_lock:
+            self.requests += segments
+            if ok:
+                self._latencies.append(latency)
+            else:
+                self.errors += segments
     
-    def transcribe(self, audio: np.ndarray, sample_rate: int = 16000) -> str:
+    def transcribe(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = 16000) -> str:
         """
         Transcribe audio to text
         
         Args:
-            audio: Audio samples as numpy array (float32, mono)
+            audio: AudioFrame or audio samples as numpy array (float32, mono)
             sample_rate: Sample rate in Hz (default 16000)
         
         Returns:
@@ -52,27 +264,292 @@ class WhisperSTT:
         if self.model is None:
             self.initialize()
         
-        try:
-            # faster-whisper expects int16 audio
-            audio_int16 = (audio * 32767.0).astype(np.int16)
-            
+        audio, sample_rate = AudioFrame.unwrap(audio, sample_rate)
+        # Segments are decoded lazily while iterating, so the whole body holds a worker slot
+        with self._slots:
+            with self._stats_lock:
+                self.busy += 1
+            start = time.perf_counter()
+            ok = False
+            try:
+                # faster-whisper takes float32 samples in [-1, 1]
+                segments, info = self.model.transcribe(
+                    audio.astype(np.float32, copy=False),
+                    language="en",  # Can be made configurable
+                    vad_filter=self.vad_filter,  # Off by default: segments already come from our VAD
+                    vad_parameters=dict(min_silence_duration_ms=500),
+                    **self.decode_options
+                )
+                
+                # Collect all segments
+                text_parts = []
+                for segment in segments:
+                    text_parts.append(segment.text.strip())
+                
+                result = " ".join(text_parts).strip()
+                logger.debug(f"Transcribed: {result}")
+                ok = True
+                return result if result else "[NO_SPEECH]"
+                
+            except Exception as e:
+                logger.error(f"Transcription error: {e}")
+                return "[TRANSCRIPTION_ERROR]"
+            finally:
+                with self._stats_lock:
+                    self.busy -= 1
+                self._record(time.perf_counter() - start, ok)
+
+    def transcribe_batch(self, audios: list[np.ndarray], sample_rate: int = 16000) -> list[str]:
+        """
+        Transcribe several segments in one batched decode
+        Each segment gets its own decode window (see layout_batch), passed as
+        clip_timestamps; output segments are mapped back by their midpoint. Falls back to one call per segment without
+        BatchedInferencePipeline or for clips longer than one decode window.
+        """
+        if self.model is None:
+            self.initialize()
+        lengths = [len(a) for a in audios]
+        if (len(audios) == 1 or self.batched is None
+                or max(lengths) > MAX_CLIP_SECONDS * sample_rate):
+            return [self.transcribe(a, sample_rate) for a in audios]
+
+        buffer, clips, bounds = layout_batch(audios, sample_rate)
+        with self._slots:
+            with self._stats_lock:
+                self.busy += 1
+            start = time.perf_counter()
+            ok = False
+            try:
+                segments, info = self.batched.transcribe(
+                    buffer,
+                    language="en",
+                    clip_timestamps=clips,
+                    batch_size=len(audios),
+                    vad_filter=False,  # Clips are our VAD's segments
+                    without_timestamps=True,
+                    **self.decode_options
+                )
+                texts = [[] for _ in audios]
+                for segment in segments:
+                    texts[segment_index(bounds, segment.start, segment.end)].append(segment.text.strip())
+                ok = True
+                with self._stats_lock:
+                    self.batches += 1
+                    self.batched_segments += len(audios)
+                return [" ".join(t).strip() or "[NO_SPEECH]" for t in texts]
+            except Exception as e:
+                logger.error(f"Batched transcription error: {e}")
+                return ["[TRANSCRIPTION_ERROR]"] * len(audios)
+            finally:
+                with self._stats_lock:
+                    self.busy -= 1
+                self._record(time.perf_counter() - start, ok, len(audios))
+
+    def transcribe_words(self, audio: np.ndarray, prompt: str = "") -> list[tuple[float, float, str]]:
+        """
+        Transcribe audio into timestamped words (used for streaming re-decoding)
+        
+        Args:
+            audio: Audio samples (float32, mono, 16 kHz)
+            prompt: Text already committed for this utterance, given as decoding context
+        
+        Returns:
+            List of (start_seconds, end_seconds, word) relative to the start of `audio`
+        """
+        if self.model is None:
+            self.initialize()
+        
+        with self._slots:
             segments, info = self.model.transcribe(
-                audio_int16,
-                beam_size=5,
-                language="en",  # Can be made configurable
-                vad_filter=True,  # Use built-in VAD (we also have our own)
-                vad_parameters=dict(min_silence_duration_ms=500)
+                audio.astype(np.float32, copy=False),
+                language="en",
+                initial_prompt=prompt or None,
+                word_timestamps=True,
+                condition_on_previous_text=False,
+                vad_filter=False,  # Our VAD already gates the audio
+                **self.decode_options
+            )
+            return [(w.start, w.end, w.word) for segment in segments for w in (segment.words or [])]
+
+
+class WhisperBatcher:
+    """
+    Collects segments submitted within a short window and decodes them together
+    The first segment opens a batch; it is flushed window_ms later or as soon as
+    batch_size segments are waiting. Each batch runs on one model worker.
+    """
+
+    def __init__(self, stt: WhisperSTT, batch_size: int = WHISPER_BATCH_SIZE,
+                 window_ms: int = WHISPER_BATCH_WINDOW_MS):
+        self.stt = stt
+        self.batch_size = batch_size
+        self.window = window_ms / 1000.0
+        self._pending: list[tuple[np.ndarray, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def submit(self, audio: np.ndarray) -> asyncio.Future:
+        """Queue a segment (on the loop thread); the returned future resolves to its text"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((audio, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: list):
+        audios = [audio for audio, _ in batch]
+        try:
+            texts = await asyncio.get_running_loop().run_in_executor(
+                self.stt.executor, self.stt.transcribe_batch, audios
             )
-            
-            # Collect all segments
-            text_parts = []
-            for segment in segments:
-                text_parts.append(segment.text.strip())
-            
-            result = " ".join(text_parts).strip()
-            logger.debug(f"Transcribed: {result}")
-            return result if result else "[NO_SPEECH]"
-            
         except Exception as e:
-            logger.error(f"Transcription error: {e}")
-            return "[TRANSCRIPTION_ERROR]"
+            logger.error(f"Batched transcription error: {e}")
+            texts = ["[TRANSCRIPTION_ERROR]"] * len(batch)
+        for (_, future), text in zip(batch, texts):
+            if not future.done():
+                future.set_result(text)
+
+
+_WORD_CLEAN = re.compile(r"[^\w']+")
+
+
+def _normalize(word: str) -> str:
+    return _WORD_CLEAN.sub("", word.lower())
+
+
+class LocalAgreement:
+    """
+    Commits the prefix on which two consecutive hypotheses agree (LocalAgreement-2)
+    Words are (start, end, text) with times relative to the utterance start.
+    """
+
+    def __init__(self):
+        self.committed: list[tuple[float, float, str]] = []
+        self._previous: list[tuple[float, float, str]] = []
+
+    @property
+    def committed_end(self) -> float:
+        return self.committed[-1][1] if self.committed else 0.0
+
+    @property
+    def committed_text(self) -> str:
+        return "".join(w[2] for w in self.committed).strip()
+
+    def _new_words(self, words: list) -> list:
+        """Words of a hypothesis that follow the committed text"""
+        words = [w for w in words if w[0] >= self.committed_end - 0.1]
+        # Drop words that repeat the committed tail (re-decoded across the boundary)
+        for k in range(min(5, len(self.committed), len(words)), 0, -1):
+            tail = [_normalize(w[2]) for w in self.committed[-k:]]
+            if tail == [_normalize(w[2]) for w in words[:k]]:
+                return words[k:]
+        return words
+
+    def insert(self, words: list) -> list:
+        """Add a new hypothesis; returns the words committed by it"""
+        hypothesis = self._new_words(words)
+        agreed = 0
+        for previous, current in zip(self._previous, hypothesis):
+            if _normalize(previous[2]) != _normalize(current[2]):
+                break
+            agreed += 1
+        commit = hypothesis[:agreed]
+        self.committed.extend(commit)
+        self._previous = hypothesis[agreed:]
+        return commit
+
+    def finish(self, words: list) -> str:
+        """Commit everything in the last hypothesis and return the full text"""
+        self.committed.extend(self._new_words(words))
+        self._previous = []
+        return self.committed_text
+
+
+class WhisperStreamingSTT(StreamingSTT):
+    """
+    Streaming captions from faster-whisper by re-decoding the growing utterance
+    Every step_ms of new audio the buffered speech is decoded again (with the
+    committed text as prompt); the prefix that two consecutive decodes agree on is
+    committed and sent as an interim caption. Audio before the last committed word
+    is trimmed once the buffer passes buffer_seconds. end_utterance() decodes the
+    remainder once more and returns the full text.
+    """
+
+    name = "whisper"
+
+    def __init__(self,
+                 stt: Optional[WhisperSTT] = None,
+                 step_ms: int = WHISPER_STREAM_STEP_MS,
+                 buffer_seconds: float = WHISPER_STREAM_BUFFER_SECONDS):
+        self.stt = stt or WhisperSTT()
+        self.step_ms = step_ms
+        self.buffer_seconds = buffer_seconds
+
+        self.sample_rate = 16000
+        self._buffer = SegmentBuffer(int(self.sample_rate * (buffer_seconds + 2 * step_ms / 1000)))
+        self._offset = 0.0        # Utterance time of the first buffered sample (seconds)
+        self._undecoded = 0       # Samples appended since the last decode started
+        self._agreement = LocalAgreement()
+        self._on_partial: Optional[PartialCallback] = None
+        self._decode: Optional[asyncio.Task] = None
+
+    async def start_utterance(self, sample_rate: int, on_partial: PartialCallback):
+        if self.stt.model is None:
+            await asyncio.to_thread(self.stt.initialize)
+        self.sample_rate = sample_rate
+        self._buffer.clear()
+        self._offset = 0.0
+        self._undecoded = 0
+        self._agreement = LocalAgreement()
+        self._on_partial = on_partial
+
+    async def send_audio(self, samples: np.ndarray):
+        self._buffer.append(samples)
+        self._undecoded += len(samples)
+        # Decode in the background; skip a step rather than queue decodes behind a slow one
+        if (self._undecoded >= self.sample_rate * self.step_ms / 1000
+                and (self._decode is None or self._decode.done())):
+            self._undecoded = 0
+            self._decode = asyncio.create_task(self._decode_step())
+
+    async def _decode_words(self) -> list:
+        # The view stays valid while new audio is appended past its end
+        audio, offset = self._buffer.view(), self._offset
+        words = await asyncio.to_thread(self.stt.transcribe_words, audio, self._agreement.committed_text)
+        return [(start + offset, end + offset, word) for start, end, word in words]
+
+    async def _decode_step(self):
+        try:
+            words = await self._decode_words()
+            if self._agreement.insert(words) and self._on_partial is not None:
+                await self._on_partial(self._agreement.committed_text)
+            self._trim()
+        except Exception as e:
+            logger.error(f"Streaming decode error: {e}")
+
+    def _trim(self):
+        """Drop audio before the last committed word once the buffer is long"""
+        if len(self._buffer) <= self.buffer_seconds * self.sample_rate or not self._agreement.committed:
+            return
+        cut = min(len(self._buffer), int((self._agreement.committed_end - self._offset) * self.sample_rate))
+        if cut > 0:
+            self._buffer.split(cut, cut)
+            self._offset += cut / self.sample_rate
+
+    async def end_utterance(self) -> str:
+        if self._decode is not None:
+            await asyncio.gather(self._decode, return_exceptions=True)
+            self._decode = None
+        self._on_partial = None
+        words = await self._decode_words()
+        return self._agreement.finish(words)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test script for streaming Speech-to-Text with interim captions
+By default streams synthetic audio to a local scripted stand-in server
+(realtime_stub_server.py). With --live, records from the default microphone
+and streams to the ElevenLabs realtime API (needs ELEVENLABS_API_KEY).
+"""
+
+import argparse
+import asyncio
+import sys
+import numpy as np
+from realtime_stub_server import ScriptedRealtimeServer
+from stt_streaming import ElevenLabsRealtimeSTT, StreamingCaptioner
+
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 0.1
+
+
+def synthetic_audio(duration: float) -> np.ndarray:
+    """Amplitude-modulated tone standing in for speech"""
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.2 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))).astype(np.float32)
+
+
+def record_audio(duration: float) -> np.ndarray:
+    """Record audio from default microphone"""
+    import sounddevice as sd
+
+    print(f"Recording {duration} seconds... Speak now!")
+    audio = sd.rec(int(duration * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1, dtype=np.float32)
+    sd.wait()
+    return audio.flatten()
+
+
+async def emit(text: str, caption_id: str, is_final: bool, direction: int, confidence: float):
+    print(f"  [{caption_id}] {'FINAL  ' if is_final else 'interim'} {text}")
+
+
+async def run(live: bool, utterances: int, duration: float):
+    server = None
+    if live:
+        backend = ElevenLabsRealtimeSTT()
+    else:
+        server = ScriptedRealtimeServer(port=0)
+        await server.start()
+        backend = ElevenLabsRealtimeSTT(url=server.url)
+
+    captioner = StreamingCaptioner(backend, emit, SAMPLE_RATE, partial_interval_ms=0)
+    captioner.start()
+
+    chunk = int(CHUNK_SECONDS * SAMPLE_RATE)
+    for utterance_id in range(1, utterances + 1):
+        audio = record_audio(duration) if live else synthetic_audio(duration)
+        print(f"\nUtterance {utterance_id} ({len(audio) / SAMPLE_RATE:.1f}s)")
+        for start in range(0, len(audio), chunk):
+            ended = start + chunk >= len(audio)
+            captioner.push(utterance_id, audio[start:start + chunk], ended, 0, 1.0)
+            if not live:
+                await asyncio.sleep(CHUNK_SECONDS)  # Pace like real capture
+        while captioner.get_stats()["finals"] + captioner.get_stats()["failures"] < utterance_id:
+            await asyncio.sleep(0.05)
+
+    print(f"\nStats: {captioner.get_stats()}")
+    await captioner.stop()
+    if server:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming STT test")
+    parser.add_argument("--live", action="store_true", help="Use the microphone and the ElevenLabs API")
+    parser.add_argument("--utterances", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print("Streaming STT Test")
+    print("=" * 50)
+    try:
+        asyncio.run(run(args.live, args.utterances, args.duration))
+    except Exception as e:
+        print(f"Streaming test failed: {e}")
+        sys.exit(1)
+    print("\nTest complete!")
+
+
+if __name__ == "__main__":
+    main()
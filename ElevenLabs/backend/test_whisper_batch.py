@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test script for batched faster-whisper decoding (WhisperSTT.transcribe_batch)
+Checks that segments laid out for one batched call come back as one decode
+window each (in the clip_timestamps units of the installed faster-whisper),
+then decodes the same segments batched and one by one and compares the text.
+With --record, the segments are recorded from the default microphone.
+"""
+
+import argparse
+import sys
+import numpy as np
+from stt_whisper import (
+    WhisperSTT,
+    layout_batch,
+    segment_index,
+    CLIP_TIMESTAMPS_IN_SECONDS,
+    FASTER_WHISPER_VERSION,
+    MAX_CLIP_SECONDS,
+)
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_segments(durations: list[float]) -> list[np.ndarray]:
+    """Tones of different pitch and length standing in for speech segments"""
+    segments = []
+    for i, duration in enumerate(durations):
+        t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        segments.append((0.2 * np.sin(2 * np.pi * (220 + 110 * i) * t)).astype(np.float32))
+    return segments
+
+
+def record_segments(count: int, duration: float) -> list[np.ndarray]:
+    """Record count segments from default microphone"""
+    import sounddevice as sd
+
+    segments = []
+    for i in range(count):
+        input(f"Segment {i + 1}/{count}: press Enter and speak for {duration} seconds")
+        audio = sd.rec(int(duration * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1, dtype=np.float32)
+        sd.wait()
+        segments.append(audio.flatten())
+    return segments
+
+
+def check_layout(segments: list[np.ndarray]) -> bool:
+    """Slice the batch buffer the way the pipeline does and check each window holds one segment"""
+    buffer, clips, bounds = layout_batch(segments, SAMPLE_RATE)
+    window = int(MAX_CLIP_SECONDS * SAMPLE_RATE)
+    ok = True
+    for i, (segment, clip) in enumerate(zip(segments, clips)):
+        if CLIP_TIMESTAMPS_IN_SECONDS:
+            start, end = int(clip["start"] * SAMPLE_RATE), int(clip["end"] * SAMPLE_RATE)
+        else:
+            start, end = clip["start"], clip["end"]
+        chunk = buffer[start:end]
+        fits = len(chunk) <= window and np.array_equal(chunk[:len(segment)], segment) and not chunk[len(segment):].any()
+        midpoint = segment_index(bounds, start / SAMPLE_RATE, end / SAMPLE_RATE)
+        print(f"  clip {i}: {clip} -> {len(chunk) / SAMPLE_RATE:.1f}s window, mapped to {midpoint}")
+        ok = ok and fits and midpoint == i
+    # Two clips together must not fit one window, or the pipeline could merge them
+    return ok and bool(np.all(np.diff(bounds) > MAX_CLIP_SECONDS / 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched Whisper decoding test")
+    parser.add_argument("--record", action="store_true", help="Record the segments from the microphone")
+    parser.add_argument("--segments", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--layout-only", action="store_true", help="Skip loading the model")
+    args = parser.parse_args()
+
+    print("Whisper Batch Test")
+    print("=" * 50)
+    units = "seconds" if CLIP_TIMESTAMPS_IN_SECONDS else "sample offsets"
+    print(f"faster-whisper {FASTER_WHISPER_VERSION}: clip_timestamps in {units}")
+
+    if args.record:
+        segments = record_segments(args.segments, args.duration)
+    else:
+        segments = synthetic_segments([args.duration * (1 + i) / args.segments for i in range(args.segments)])
+
+    if not check_layout(segments):
+        print("Layout check failed")
+        sys.exit(1)
+    print("Layout check passed")
+    if args.layout_only:
+        return
+
+    stt = WhisperSTT()
+    stt.initialize()
+    if stt.batched is None:
+        print("BatchedInferencePipeline unavailable (WHISPER_BATCH_SIZE=1 or faster-whisper < 1.1)")
+        sys.exit(1)
+    batched = stt.transcribe_batch(segments, SAMPLE_RATE)
+    sequential = [stt.transcribe(segment, SAMPLE_RATE) for segment in segments]
+    for i, (a, b) in enumerate(zip(batched, sequential)):
+        print(f"  {i}: batched='{a}' sequential='{b}'")
+    if len(batched) != len(segments) or "[TRANSCRIPTION_ERROR]" in batched:
+        print("Batched decode failed")
+        sys.exit(1)
+    print(f"\nStats: {stt.get_stats()}")
+    print("\nTest complete!")
+
+
+if __name__ == "__main__":
+    main()
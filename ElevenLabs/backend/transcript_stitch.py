@@ -0,0 +1,33 @@
+"""
+Stitching of transcripts from overlapping sub-segments of one utterance
+"""
+
+import re
+
+_WORD_CLEAN = re.compile(r"[^\w']+")
+
+
+def _normalize(word: str) -> str:
+    return _WORD_CLEAN.sub("", word.lower())
+
+
+def stitch_overlap(previous: str, current: str, max_words: int = 8) -> str:
+    """
+    Drop the words at the start of `current` that repeat the end of `previous`
+
+    Sub-segments overlap by a few hundred milliseconds of audio, so the same one
+    or two words usually show up at the seam of both transcripts. The longest
+    matching run (compared case- and punctuation-insensitively) is removed.
+
+    Returns:
+        `current` without the duplicated prefix
+    """
+    prev_words = [_normalize(w) for w in previous.split()]
+    cur_raw = current.split()
+    cur_words = [_normalize(w) for w in cur_raw]
+
+    limit = min(max_words, len(prev_words), len(cur_words))
+    for k in range(limit, 0, -1):
+        if prev_words[-k:] == cur_words[:k] and any(cur_words[:k]):
+            return " ".join(cur_raw[k:])
+    return current
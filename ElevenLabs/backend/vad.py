@@ -1,97 +1,440 @@
 """
-Voice Activity Detection (VAD) using energy-based approach
+Voice Activity Detection (VAD) with pluggable frame scoring backends
 """
 
 import numpy as np
 import logging
-import time
-from typing import Optional
-from config import VAD_START_THRESHOLD, VAD_STOP_THRESHOLD, VAD_HANGOVER_BLOCKS, MAX_SPEECH_SECONDS
-from audio_stream import AudioStream
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Union
+from config import (
+    VAD_START_THRESHOLD,
+    VAD_STOP_THRESHOLD,
+    VAD_HANGOVER_MS,
+    VAD_FRAME_MS,
+    VAD_HOP_MS,
+    VAD_BACKEND,
+    VAD_ADAPTIVE,
+    VAD_NOISE_QUANTILE,
+    VAD_START_MARGIN_DB,
+    VAD_STOP_MARGIN_DB,
+    VAD_MIN_THRESHOLD,
+    VAD_CALIBRATION_MS,
+    VAD_PREROLL_MS,
+    VAD_SPLIT_SECONDS,
+    VAD_SPLIT_SEARCH_MS,
+    VAD_SPLIT_OVERLAP_MS,
+    MAX_SPEECH_SECONDS,
+    AUDIO_SAMPLE_RATE,
+)
+from framing import AudioFramer
+from audio_frame import AudioFrame
+from vad_backends import create_vad_backend
 
 logger = logging.getLogger(__name__)
 
 
+class NoiseFloorTracker:
+    """
+    O(1)-per-frame streaming quantile of frame scores, in dB
+    Each frame nudges the estimate up by step * q or down by step * (1 - q), which
+    converges on the q-quantile without storing history. Updates are slowed while
+    speech is active so talkers do not drag the floor up.
+    An optional calibration window seeds the estimate with an exact quantile.
+    """
+
+    SPEECH_STEP_SCALE = 0.5
+    MIN_DB = -100.0
+
+    def __init__(self,
+                 quantile: float = VAD_NOISE_QUANTILE,
+                 step_db: float = 0.2,
+                 calibration_frames: int = 0,
+                 initial_floor: float = VAD_STOP_THRESHOLD / 2):
+        self.quantile = quantile
+        self.step_db = step_db
+        self.floor_db = self._to_db(initial_floor)
+        self.calibration_frames = calibration_frames
+        self._calibration: list = []
+        self._calibrated = calibration_frames <= 0
+
+    @classmethod
+    def _to_db(cls, value: float) -> float:
+        return max(cls.MIN_DB, 20.0 * np.log10(max(value, 1e-12)))
+
+    @property
+    def calibrating(self) -> bool:
+        return not self._calibrated
+
+    @property
+    def floor(self) -> float:
+        return float(10.0 ** (self.floor_db / 20.0))
+
+    def update(self, score: float, in_speech: bool = False) -> float:
+        """Fold one frame score into the estimate and return the current floor (RMS scale)"""
+        score_db = self._to_db(score)
+        if self.calibrating:
+            self._calibration.append(score_db)
+            if len(self._calibration) >= self.calibration_frames:
+                self.floor_db = float(np.quantile(self._calibration, self.quantile))
+                self._calibration = []
+                self._calibrated = True
+                logger.info(f"VAD noise floor calibrated: {self.floor:.4f}")
+            return self.floor
+
+        step = self.step_db * (self.SPEECH_STEP_SCALE if in_speech else 1.0)
+        if score_db < self.floor_db:
+            self.floor_db -= step * (1.0 - self.quantile)
+        else:
+            self.floor_db += step * self.quantile
+        return self.floor
+
+
+class SegmentBuffer:
+    """
+    Preallocated float32 buffer that speech audio is written into in place
+    Replaces a list of chunks + np.concatenate per segment. The buffer only grows
+    (by doubling) if a segment outlives its initial capacity.
+    """
+
+    def __init__(self, capacity: int):
+        self.initial_capacity = max(1, int(capacity))
+        self._buf: Optional[np.ndarray] = None
+        self.length = 0
+
+        self.allocations = 0
+        self.grows = 0
+        self.high_water = 0
+        self.transfers = 0
+        self.copies = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _reserve(self, extra: int):
+        if self._buf is None:
+            self._buf = np.empty(self.initial_capacity, dtype=np.float32)
+            self.allocations += 1
+        needed = self.length + extra
+        if needed > len(self._buf):
+            grown = np.empty(max(needed, 2 * len(self._buf)), dtype=np.float32)
+            grown[:self.length] = self._buf[:self.length]
+            self._buf = grown
+            self.grows += 1
+
+    def append(self, samples: np.ndarray):
+        """Copy samples onto the end of the segment"""
+        n = len(samples)
+        if n == 0:
+            return
+        self._reserve(n)
+        self._buf[self.length:self.length + n] = samples
+        self.length += n
+        self.high_water = max(self.high_water, self.length)
+
+    def view(self) -> np.ndarray:
+        """View of the audio written so far (valid until the next detach/clear)"""
+        if self._buf is None:
+            return np.zeros(0, dtype=np.float32)
+        return self._buf[:self.length]
+
+    def detach(self) -> np.ndarray:
+        """
+        Hand the finished segment off and start a new one
+        Segments filling most of the buffer transfer ownership of it (no copy; a
+        fresh buffer is allocated lazily for the next segment). Short segments are
+        copied out so the large buffer keeps being reused.
+        """
+        if self._buf is None:
+            return np.zeros(0, dtype=np.float32)
+        if 2 * self.length > len(self._buf):
+            segment = self._buf[:self.length]
+            self._buf = None
+            self.transfers += 1
+        else:
+            segment = self._buf[:self.length].copy()
+            self.copies += 1
+        self.length = 0
+        return segment
+
+    def split(self, cut: int, keep_from: int) -> np.ndarray:
+        """
+        Copy out [0, cut) as a finished sub-segment and keep [keep_from, length)
+        in place as the start of the next one (keep_from <= cut gives an overlap)
+        """
+        segment = self._buf[:cut].copy()
+        remaining = self.length - keep_from
+        self._buf[:remaining] = self._buf[keep_from:self.length]
+        self.length = remaining
+        self.copies += 1
+        return segment
+
+    def clear(self):
+        """Discard the current segment, keeping the buffer"""
+        self.length = 0
+
+    def get_stats(self) -> dict:
+        """Return memory and hand-off statistics"""
+        return {
+            "capacity_bytes": 0 if self._buf is None else self._buf.nbytes,
+            "high_water_bytes": self.high_water * 4,
+            "allocations": self.allocations,
+            "grows": self.grows,
+            "transfers": self.transfers,
+            "copies": self.copies,
+        }
+
+
+@dataclass
+class SegmentInfo:
+    """Position of an emitted segment within its utterance"""
+    utterance_id: int
+    part: int
+    is_last: bool
+    overlap_seconds: float  # Audio shared with the end of the previous part
+
+
 class VAD:
     """
-    Simple energy-based VAD
-    Detects speech when energy exceeds start threshold
-    Stops detecting after energy drops below stop threshold for hangover duration
+    Frame-based VAD with hysteresis
+    Scores short overlapping analysis frames independently of the capture chunk size.
+    Frame scores come from a pluggable backend (see vad_backends.py) on the RMS scale.
+    Detects speech when the frame score exceeds start threshold
+    Stops detecting after the score stays below stop threshold for the hangover duration
+    In adaptive mode both thresholds sit at fixed dB margins above a tracked noise floor.
+    Segments are prefixed with a short pre-roll of idle audio so onsets are not clipped.
+    Long utterances are split at a quiet point near split_seconds, with a small
+    overlap, so parts can be transcribed while the speaker is still talking.
     """
-    
+
     def __init__(self,
                  start_threshold: float = VAD_START_THRESHOLD,
                  stop_threshold: float = VAD_STOP_THRESHOLD,
-                 hangover_blocks: int = VAD_HANGOVER_BLOCKS,
-                 max_speech_seconds: float = MAX_SPEECH_SECONDS):
+                 hangover_ms: int = VAD_HANGOVER_MS,
+                 max_speech_seconds: float = MAX_SPEECH_SECONDS,
+                 sample_rate: int = AUDIO_SAMPLE_RATE,
+                 frame_ms: int = VAD_FRAME_MS,
+                 hop_ms: int = VAD_HOP_MS,
+                 backend: str = VAD_BACKEND,
+                 adaptive: bool = VAD_ADAPTIVE,
+                 start_margin_db: float = VAD_START_MARGIN_DB,
+                 stop_margin_db: float = VAD_STOP_MARGIN_DB,
+                 min_threshold: float = VAD_MIN_THRESHOLD,
+                 calibration_ms: int = VAD_CALIBRATION_MS,
+                 preroll_ms: int = VAD_PREROLL_MS,
+                 split_seconds: float = VAD_SPLIT_SECONDS,
+                 split_search_ms: int = VAD_SPLIT_SEARCH_MS,
+                 split_overlap_ms: int = VAD_SPLIT_OVERLAP_MS):
         self.start_threshold = start_threshold
         self.stop_threshold = stop_threshold
-        self.hangover_blocks = hangover_blocks
+        self.hangover_ms = hangover_ms
         self.max_speech_seconds = max_speech_seconds
-        
+        self.sample_rate = sample_rate
+
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.hop_length = int(sample_rate * hop_ms / 1000)
+        self.hangover_frames = max(1, int(round(hangover_ms / hop_ms)))
+        self.framer = AudioFramer(self.frame_length, self.hop_length)
+        self.backend = create_vad_backend(backend, sample_rate, self.frame_length, self.hop_length)
+        logger.info(f"VAD backend: {self.backend.name}")
+
+        self.noise_tracker: Optional[NoiseFloorTracker] = None
+        if adaptive:
+            self.start_ratio = 10.0 ** (start_margin_db / 20.0)
+            self.stop_ratio = 10.0 ** (stop_margin_db / 20.0)
+            self.min_threshold = min_threshold
+            self.noise_tracker = NoiseFloorTracker(
+                calibration_frames=int(calibration_ms / hop_ms),
+                initial_floor=stop_threshold / self.stop_ratio,
+            )
+
         self.is_speech = False
         self.hangover_counter = 0
-        self.speech_buffer: list = []
-        self.speech_start_time: Optional[float] = None
-        
-    def process(self, audio_chunk: np.ndarray) -> tuple[bool, Optional[np.ndarray]]:
+        # All timing is in samples so it holds at any rate and under processing delays
+        self.max_speech_samples = int(sample_rate * max_speech_seconds)
+
+        # Sized for the longest segment plus pre-roll and one late chunk so it never grows in practice
+        self.speech_buffer = SegmentBuffer(
+            int(sample_rate * (max_speech_seconds + (preroll_ms + 1000) / 1000))
+        )
+
+        # Pre-roll keeps references to recent idle chunks (no copies) until speech starts
+        self.preroll_samples = int(sample_rate * preroll_ms / 1000)
+        self._preroll: deque = deque()
+        self._preroll_len = 0
+
+        self.split_samples = int(sample_rate * split_seconds)
+        self.split_search_samples = int(sample_rate * split_search_ms / 1000)
+        self.split_overlap_samples = int(sample_rate * split_overlap_ms / 1000)
+        self.utterance_id = 0
+        self.part_index = 0
+        self._part_overlap = 0.0
+        self.last_segment: Optional[SegmentInfo] = None
+        # (utterance_id, view) for audio added to utterances by the last process() call
+        # (pre-roll included), for streaming STT
+        self.speech_audio: list[tuple[int, np.ndarray]] = []
+
+    def process(self, audio_chunk: Union[AudioFrame, np.ndarray]) -> tuple[bool, Optional[np.ndarray]]:
         """
         Process audio chunk and determine if speech is detected
-        
+        Onset and end-of-speech are resolved at hop resolution within the chunk.
+        Accepts an AudioFrame (features computed here are cached on it) or a bare array.
+
         Returns:
             (is_speech, complete_audio_or_none)
             - is_speech: True if currently detecting speech
-            - complete_audio_or_none: Full audio buffer when speech ends, None otherwise
+            - complete_audio_or_none: Full audio buffer when speech ends, None otherwise.
+              May also be a sub-segment of ongoing speech; see last_segment.
         """
-        energy = AudioStream.get_rms_energy(audio_chunk)
-        
-        if not self.is_speech:
-            # Not currently detecting speech
-            if energy >= self.start_threshold:
-                # Start detecting speech
-                self.is_speech = True
-                self.hangover_counter = 0
-                self.speech_buffer = [audio_chunk]
-                self.speech_start_time = time.time()
-                logger.info(f"Speech started (energy: {energy:.4f})")
-                return (True, None)
-            else:
-                return (False, None)
-        else:
-            # Currently detecting speech
-            self.speech_buffer.append(audio_chunk)
-            
-            if self.speech_start_time and (time.time() - self.speech_start_time) >= self.max_speech_seconds:
-                self.is_speech = False
-                complete_audio = np.concatenate(self.speech_buffer)
-                self.speech_buffer = []
-                self.speech_start_time = None
-                logger.info(
-                    f"Speech forced end (duration: {len(complete_audio)/16000:.2f}s)"
-                )
-                return (False, complete_audio)
+        self.last_segment = None
+        self.speech_audio = []
+        audio_frame = audio_chunk if isinstance(audio_chunk, AudioFrame) else None
+        if audio_frame is not None:
+            audio_chunk = audio_frame.samples
+        frames, ends = self.framer.push(audio_chunk)
+        energies = self.backend.score(frames, audio_frame)
+
+        complete_audio: Optional[np.ndarray] = None
+        segment_start = 0  # Offset in this chunk where buffered speech resumes
+        idle_start = 0     # Offset in this chunk where idle audio resumes
+
+        for i in range(len(energies)):
+            energy = energies[i]
+            if self.noise_tracker:
+                self._adapt_thresholds(energy)
+                if self.noise_tracker.calibrating:
+                    continue
+
+            if not self.is_speech:
+                if energy >= self.start_threshold:
+                    # Start detecting speech at the onset frame
+                    self.is_speech = True
+                    self.hangover_counter = 0
+                    self.utterance_id += 1
+                    self.part_index = 0
+                    self._part_overlap = 0.0
+                    segment_start = max(idle_start, int(ends[i]) - self.frame_length)
+                    self.speech_buffer.clear()
+                    for part in self._take_preroll(audio_chunk[idle_start:segment_start]):
+                        self._append_speech(part)
+                    logger.info(f"Speech started (energy: {energy:.4f})")
+                continue
 
             if energy < self.stop_threshold:
                 self.hangover_counter += 1
-                if self.hangover_counter >= self.hangover_blocks:
+                # At most one segment per chunk; a second end is picked up on the next call
+                if self.hangover_counter >= self.hangover_frames and complete_audio is None:
                     # Speech ended
-                    self.is_speech = False
-                    complete_audio = np.concatenate(self.speech_buffer)
-                    self.speech_buffer = []
-                    self.speech_start_time = None
+                    self._append_speech(audio_chunk[segment_start:int(ends[i])])
+                    complete_audio = self._finish_segment()
+                    idle_start = int(ends[i])
                     logger.info(
-                        f"Speech ended (energy: {energy:.4f}, duration: {len(complete_audio)/16000:.2f}s)"
+                        f"Speech ended (energy: {energy:.4f}, "
+                        f"duration: {len(complete_audio)/self.sample_rate:.2f}s)"
                     )
-                    return (False, complete_audio)
             else:
                 # Reset hangover counter if energy goes back up
                 self.hangover_counter = 0
-            
-            return (True, None)
-    
+
+        if self.is_speech:
+            self._append_speech(audio_chunk[segment_start:])
+
+            if (complete_audio is None and self.split_samples
+                    and len(self.speech_buffer) >= self.split_samples):
+                complete_audio = self._split_segment()
+            elif complete_audio is None and len(self.speech_buffer) >= self.max_speech_samples:
+                complete_audio = self._finish_segment()
+                logger.info(
+                    f"Speech forced end (duration: {len(complete_audio)/self.sample_rate:.2f}s)"
+                )
+        elif self.preroll_samples:
+            self._push_preroll(audio_chunk[idle_start:])
+
+        return (self.is_speech, complete_audio)
+
+    def _append_speech(self, samples: np.ndarray):
+        self.speech_buffer.append(samples)
+        if len(samples):
+            self.speech_audio.append((self.utterance_id, samples))
+
+    def _push_preroll(self, idle_audio: np.ndarray):
+        """Remember an idle slice, dropping slices no longer needed for the pre-roll"""
+        if len(idle_audio) == 0:
+            return
+        self._preroll.append(idle_audio)
+        self._preroll_len += len(idle_audio)
+        while self._preroll_len - len(self._preroll[0]) >= self.preroll_samples:
+            self._preroll_len -= len(self._preroll.popleft())
+
+    def _take_preroll(self, head: np.ndarray) -> list:
+        """Return views covering the last preroll_samples of idle audio before the onset"""
+        if not self.preroll_samples:
+            return []
+        self._push_preroll(head)
+        parts = []
+        needed = self.preroll_samples
+        while self._preroll and needed > 0:
+            piece = self._preroll.pop()
+            parts.append(piece[-needed:] if len(piece) > needed else piece)
+            needed -= len(piece)
+        self._preroll.clear()
+        self._preroll_len = 0
+        parts.reverse()
+        return parts
+
+    def _adapt_thresholds(self, energy: float):
+        """Move start/stop thresholds with the noise floor"""
+        floor = self.noise_tracker.update(energy, self.is_speech)
+        self.start_threshold = max(self.min_threshold, floor * self.start_ratio)
+        self.stop_threshold = max(self.min_threshold, floor * self.stop_ratio)
+
+    @property
+    def noise_floor(self) -> Optional[float]:
+        """Current noise floor estimate, or None with fixed thresholds"""
+        return self.noise_tracker.floor if self.noise_tracker else None
+
+    def _find_split_point(self) -> int:
+        """Return the centre of the quietest hop in the last split_search window"""
+        audio = self.speech_buffer.view()
+        n_hops = min(len(audio), self.split_search_samples) // self.hop_length
+        if n_hops == 0:
+            return len(audio)
+        region_start = len(audio) - n_hops * self.hop_length
+        hops = audio[region_start:].reshape(n_hops, self.hop_length)
+        envelope = AudioFramer.frame_rms(hops)
+        # Mildly penalise early hops so similar-level candidates favour longer parts
+        bias = 1.0 + 0.5 * np.arange(n_hops - 1, -1, -1) / n_hops
+        quietest = int(np.argmin(envelope * bias))
+        return region_start + quietest * self.hop_length + self.hop_length // 2
+
+    def _split_segment(self) -> np.ndarray:
+        """Emit the speech so far up to a quiet point and keep going"""
+        cut = self._find_split_point()
+        keep_from = max(0, cut - self.split_overlap_samples)
+        part = self.speech_buffer.split(cut, keep_from)
+        self.last_segment = SegmentInfo(self.utterance_id, self.part_index, False, self._part_overlap)
+        self.part_index += 1
+        self._part_overlap = (cut - keep_from) / self.sample_rate
+        logger.info(f"Speech split (part {self.part_index}, duration: {len(part)/self.sample_rate:.2f}s)")
+        return part
+
+    def _finish_segment(self) -> np.ndarray:
+        """Close the current segment and return its audio"""
+        self.last_segment = SegmentInfo(self.utterance_id, self.part_index, True, self._part_overlap)
+        complete_audio = self.speech_buffer.detach()
+        self.is_speech = False
+        self.hangover_counter = 0
+        return complete_audio
+
+    def get_buffer_stats(self) -> dict:
+        """Return segment buffer memory statistics"""
+        return self.speech_buffer.get_stats()
+
     def reset(self):
         """Reset VAD state"""
         self.is_speech = False
         self.hangover_counter = 0
-        self.speech_buffer = []
-        self.speech_start_time = None
+        self.speech_buffer.clear()
+        self.framer.reset()
+        self._preroll.clear()
+        self._preroll_len = 0
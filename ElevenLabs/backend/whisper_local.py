@@ -1,108 +1,308 @@
 """
 Local Whisper transcription using whisper.cpp
-Runs whisper-cli on audio files or streams
+Keeps one whisper-server process running on localhost so the model is loaded
+once; audio is posted to it as in-memory WAV (no temp files, no per-call spawn)
 """
 
-import subprocess
+import asyncio
 import logging
-import numpy as np
-import soundfile as sf
-import tempfile
 import os
-from typing import Optional
-from config import WHISPER_MODEL_PATH, WHISPER_CLI_PATH, AUDIO_SAMPLE_RATE
+import re
+import socket
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Optional, Union
+import numpy as np
+import requests
+from config import (
+    WHISPER_MODEL_PATH,
+    WHISPER_SERVER_PATH,
+    WHISPER_SERVER_PORT,
+    WHISPER_SERVER_THREADS,
+    WHISPER_SERVER_STARTUP_TIMEOUT,
+    WHISPER_HEALTH_INTERVAL,
+    AUDIO_SAMPLE_RATE,
+)
+from audio_frame import AudioFrame
+from audio_encoders import WavEncoder, to_pcm16
 
 logger = logging.getLogger(__name__)
 
+# Timing brackets (e.g. "[00:00:00.000 --> 00:00:01.000]") and markers such as [BLANK_AUDIO]
+_TIMESTAMPS = re.compile(r'\[\d{2}:\d{2}:\d{2}\.\d{3}\s*-->\s*\d{2}:\d{2}:\d{2}\.\d{3}\]')
+_MARKERS = re.compile(r'\[[A-Z_ ]+\]|\([a-z ]+\)')
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class WhisperServerProcess:
+    """
+    Supervises a whisper.cpp whisper-server child process
+    Starts it, waits until /health answers (model loaded), and restarts it if
+    the process exits or stops answering. stderr is drained into a short tail
+    that is logged when the worker dies.
+    """
+
+    def __init__(self,
+                 server_path: str = WHISPER_SERVER_PATH,
+                 model_path: str = WHISPER_MODEL_PATH,
+                 language: str = "en",
+                 port: int = WHISPER_SERVER_PORT,
+                 threads: int = WHISPER_SERVER_THREADS,
+                 startup_timeout: float = WHISPER_SERVER_STARTUP_TIMEOUT):
+        self.server_path = server_path
+        self.model_path = model_path
+        self.language = language
+        self.requested_port = port
+        self.port = port
+        self.threads = threads
+        self.startup_timeout = startup_timeout
+
+        self.process: Optional[subprocess.Popen] = None
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._stderr_tail: deque = deque(maxlen=20)
+        self.starts = 0
+        self.restarts = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _drain_stderr(self, stream):
+        for line in iter(stream.readline, b""):
+            text = line.decode("utf-8", errors="replace").rstrip()
+            self._stderr_tail.append(text)
+            logger.debug(f"whisper-server: {text}")
+        stream.close()
+
+    def start(self):
+        """Launch the server and block until the model is loaded"""
+        self.port = self.requested_port or _free_port()
+        cmd = [
+            self.server_path,
+            "-m", self.model_path,
+            "-l", self.language,
+            "--host", "127.0.0.1",
+            "--port", str(self.port),
+        ]
+        if self.threads > 0:
+            cmd += ["-t", str(self.threads)]
+        logger.info(f"Starting whisper-server: {' '.join(cmd)}")
+        self._stderr_tail.clear()
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        threading.Thread(target=self._drain_stderr, args=(self.process.stderr,), daemon=True).start()
+        self.starts += 1
+
+        start = time.perf_counter()
+        deadline = start + self.startup_timeout
+        while time.perf_counter() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(
+                    f"whisper-server exited with code {self.process.returncode}: "
+                    + " | ".join(list(self._stderr_tail)[-3:])
+                )
+            if self.healthy(timeout=0.5):
+                logger.info(f"whisper-server ready on port {self.port} ({time.perf_counter() - start:.1f}s)")
+                return
+            time.sleep(0.2)
+        self.stop()
+        raise TimeoutError(f"whisper-server not ready after {self.startup_timeout:.0f}s")
+
+    def healthy(self, timeout: float = 1.0) -> bool:
+        """True if the process is alive and /health reports the model as loaded"""
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            return self.session.get(f"{self.base_url}/health", timeout=timeout).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def ensure_running(self):
+        """Start the server, or restart it if it has died or hung"""
+        with self._lock:
+            if self.healthy():
+                return
+            if self.process is not None:
+                logger.warning(
+                    f"whisper-server unhealthy (exit code {self.process.poll()}), restarting; "
+                    f"last output: {' | '.join(list(self._stderr_tail)[-3:])}"
+                )
+                self.stop()
+                self.restarts += 1
+            self.start()
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
 
 class WhisperLocal:
-    """Transcribe audio using local whisper.cpp CLI"""
-    
-    def __init__(self, 
+    """
+    Transcribe audio using a persistent local whisper.cpp server
+    A background thread checks the worker every health_interval seconds and
+    restarts it on crash; a request that fails because the worker died is
+    retried once after the restart.
+    """
+
+    def __init__(self,
                  model_path: str = WHISPER_MODEL_PATH,
-                 cli_path: str = WHISPER_CLI_PATH,
-                 language: str = "en"):
+                 server_path: str = WHISPER_SERVER_PATH,
+                 language: str = "en",
+                 health_interval: float = WHISPER_HEALTH_INTERVAL,
+                 timeout: float = 30.0):
         self.model_path = model_path
-        self.cli_path = cli_path
+        self.server_path = server_path
         self.language = language
         self.sample_rate = AUDIO_SAMPLE_RATE
-        
+        self.health_interval = health_interval
+        self.timeout = timeout
+
         # Validate paths
-        if not os.path.exists(self.cli_path):
-            raise FileNotFoundError(f"whisper-cli not found at {self.cli_path}")
+        if not os.path.exists(self.server_path):
+            raise FileNotFoundError(f"whisper-server not found at {self.server_path}")
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Whisper model not found at {self.model_path}")
-        
+
+        self.server = WhisperServerProcess(server_path, model_path, language)
+        self.encoder = WavEncoder()
+        self._monitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # whisper-server decodes one request at a time; queue here rather than on its socket
+        self._busy = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=200)
+        self.requests = 0
+        self.errors = 0
+
         logger.info(f"WhisperLocal initialized with model: {self.model_path}")
-        logger.info(f"Using CLI: {self.cli_path}")
-    
-    def transcribe(self, audio: np.ndarray, sample_rate: int = None) -> str:
+        logger.info(f"Using server: {self.server_path}")
+
+    def initialize(self):
+        """Start the worker (loads the model) and its health monitor"""
+        self.server.ensure_running()
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._monitor_loop, daemon=True)
+            self._monitor.start()
+
+    def warm_up(self):
+        """Start the worker at startup instead of on the first utterance"""
+        self.initialize()
+        self.transcribe(np.zeros(self.sample_rate // 2, dtype=np.float32))
+
+    def _monitor_loop(self):
+        while not self._stop.wait(self.health_interval):
+            try:
+                # During a long decode /health may be slow; only check the process is alive
+                if self._busy.locked() and self.server.process is not None and self.server.process.poll() is None:
+                    continue
+                self.server.ensure_running()
+            except Exception as e:
+                logger.error(f"whisper-server restart failed: {e}")
+
+    def _post(self, wav_bytes: bytes) -> str:
+        response = self.server.session.post(
+            f"{self.server.base_url}/inference",
+            files={"file": ("audio.wav", wav_bytes, "audio/wav")},
+            data={"response_format": "json", "temperature": "0.0"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return str(response.json().get("text", ""))
+
+    def transcribe(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = None) -> str:
         """
-        Transcribe audio chunk using whisper.cpp CLI
-        
+        Transcribe audio chunk using the whisper.cpp server
+
         Args:
-            audio: Audio samples as numpy array (mono, float32)
+            audio: AudioFrame or audio samples as numpy array (mono, float32)
             sample_rate: Sample rate (defaults to AUDIO_SAMPLE_RATE)
-        
+
         Returns:
-            Transcribed text or empty string if no speech detected
+            Transcribed text, "[NO_SPEECH]" if nothing was recognised, or
+            "[TRANSCRIPTION_ERROR]" on failure
         """
+        audio, sample_rate = AudioFrame.unwrap(audio, sample_rate)
         if sample_rate is None:
             sample_rate = self.sample_rate
-        
+
+        wav_bytes = self.encoder.encode(to_pcm16(audio), sample_rate)
+        start = time.perf_counter()
         try:
-            # Create temporary WAV file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-                tmp_path = tmp.name
-            
-            # Write audio to temporary WAV file
-            sf.write(tmp_path, audio, sample_rate)
-            
-            # Run whisper-cli
-            cmd = [
-                self.cli_path,
-                "-m", self.model_path,
-                "-f", tmp_path,
-                "-l", self.language,
-                "--no-timestamps",
-            ]
-            
-            logger.debug(f"Running: {' '.join(cmd)}")
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            # Clean up temporary file
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
-            
-            if result.returncode != 0:
-                logger.error(f"Whisper transcription failed: {result.stderr}")
-                return ""
-            
-            # Parse output - whisper-cli outputs text with timing info, extract just the text
-            text = result.stdout.strip()
-            
-            # Remove timing brackets if present (e.g., "[00:00:00.000 --> 00:00:01.000]")
-            import re
-            text = re.sub(r'\[\d{2}:\d{2}:\d{2}\.\d{3}\s*-->\s*\d{2}:\d{2}:\d{2}\.\d{3}\]', '', text)
-            text = text.strip()
-            
-            if not text:
-                logger.info("No speech detected in audio")
-                return ""
-            
-            logger.info(f"Transcription: {text}")
-            return text
-            
-        except subprocess.TimeoutExpired:
-            logger.error("Whisper transcription timed out")
-            return ""
+            if self.server.process is None:
+                self.initialize()
+            with self._busy:
+                try:
+                    text = self._post(wav_bytes)
+                except requests.exceptions.ConnectionError:
+                    # Worker died mid-request: restart it and retry once
+                    self.server.ensure_running()
+                    text = self._post(wav_bytes)
         except Exception as e:
             logger.error(f"Error during whisper transcription: {e}")
-            return ""
+            self._record(time.perf_counter() - start, ok=False)
+            return "[TRANSCRIPTION_ERROR]"
+        self._record(time.perf_counter() - start, ok=True)
+
+        text = _MARKERS.sub('', _TIMESTAMPS.sub('', text)).strip()
+        if not text:
+            logger.info("No speech detected in audio")
+            return "[NO_SPEECH]"
+
+        logger.info(f"Transcription: {text}")
+        return text
+
+    async def transcribe_async(self, audio: Union[AudioFrame, np.ndarray], sample_rate: int = None,
+                               timeout: Optional[float] = None) -> str:
+        """Transcribe on a worker thread; on timeout the caller stops waiting"""
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(self.transcribe, audio, sample_rate), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"whisper.cpp transcription missed its {timeout:.1f}s deadline")
+            return "[TRANSCRIPTION_ERROR]"
+
+    def _record(self, latency: float, ok: bool):
+        with self._stats_lock:
+            self.requests += 1
+            if ok:
+                self._latencies.append(latency)
+            else:
+                self.errors += 1
+
+    def get_stats(self) -> dict:
+        """Return request counts, worker restarts and rolling latency percentiles (ms)"""
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000.0
+            stats = {
+                "requests": self.requests,
+                "errors": self.errors,
+                "restarts": self.server.restarts,
+                "healthy": self.server.process is not None and self.server.process.poll() is None,
+            }
+        if len(latencies):
+            stats["latency_p50_ms"] = float(np.percentile(latencies, 50))
+            stats["latency_p95_ms"] = float(np.percentile(latencies, 95))
+        return stats
+
+    def close(self):
+        """Stop the health monitor and the worker process"""
+        self._stop.set()
+        self.server.stop()
+
+    async def aclose(self):
+        self.close()